@@ -0,0 +1,67 @@
+"""
+Measures what the worker bus adds to a channel PRIVMSG when running with several workers, in CPU time per broadcast.
+"publish" is the sending worker encoding the line as a bus message and writing it to the hub, "relay" is the hub
+decoding it and writing it to every other worker, and "receive" is one sibling decoding it and encoding the line for
+its members, before it's written to them. Every sibling receives it, so "total" is publish + relay + receive for each
+of them. "local" is a PRIVMSG to a two member channel on a single worker, the whole of what handling one costs there,
+for comparison. Each process pays its own part, so with a core per worker and one for the hub the total is spread
+over them rather than added up, but the hub's relay is paid for every broadcast by one process.
+
+Usage: python -m bench.bus_broadcast
+"""
+from bench.common import make_config, make_server, connect_client, send_line, time_per_call, print_table, NullTransport
+from server.irc_server import ChatServer
+from server.irc_channel.channel import IRCChannel
+from server.irc_bus.hub import WorkerHub, WorkerHubProtocol
+from server.irc_bus.worker import WorkerBusProtocol
+from json import dumps
+
+WORKER_COUNTS = [2, 4, 8]
+ITERATIONS = 50000
+LINE = ":sender!user@10.0.0.1 PRIVMSG #bus :The quick brown fox jumps over the lazy dog"
+
+
+def bus_worker(worker_id):
+    """ A worker whose bus writes to a NullTransport instead of the hub, with an empty #bus channel. """
+    server = ChatServer(make_config(), worker_id)
+    connection = WorkerBusProtocol(server.bus)
+    connection.makeConnection(NullTransport())
+    channel = IRCChannel("#bus", server.channelmanager, server.bus)
+    server.channels[channel.key] = channel
+    return server, connection, channel
+
+
+def local_privmsg():
+    server = make_server()
+    sender, _ = connect_client(server, 0, "sender", NullTransport)
+    member, _ = connect_client(server, 1, "member", NullTransport)
+    send_line(sender, "JOIN #bus")
+    send_line(member, "JOIN #bus")
+    return time_per_call(lambda: send_line(sender, "PRIVMSG #bus :The quick brown fox jumps over the lazy dog"),
+                         ITERATIONS)
+
+
+def run(worker_count, local):
+    sender, _, sender_channel = bus_worker(0)
+    _, receiver, _ = bus_worker(1)
+    hub = WorkerHub()
+    hub_connections = []
+    for worker_id in range(worker_count):
+        hub_connection = WorkerHubProtocol(hub)
+        hub_connection.makeConnection(NullTransport())
+        hub_connection.worker_id = worker_id
+        hub.workers[worker_id] = hub_connection
+        hub_connections.append(hub_connection)
+    line = dumps({"op": "channel", "channel": "#bus", "line": LINE}).encode("utf-8")  # As publish_channel_line sends it
+
+    publish = time_per_call(lambda: sender.bus.publish_channel_line(sender_channel, LINE), ITERATIONS)
+    relay = time_per_call(lambda: hub_connections[0].lineReceived(line), ITERATIONS)
+    receive = time_per_call(lambda: receiver.lineReceived(line), ITERATIONS)
+    total = publish + relay + receive * (worker_count - 1)
+    return worker_count, publish, relay, receive, total, local, total / local
+
+
+if __name__ == '__main__':
+    local_us = local_privmsg()
+    print_table(["workers", "publish us", "relay us", "receive us", "total us", "local us", "total/local"],
+                [run(x, local_us) for x in WORKER_COUNTS])
@@ -0,0 +1,39 @@
+"""
+Measures channel PRIVMSG throughput (messages/sec) against channel size. The "per member" column formats the line
+once per recipient through Twisted's IRC.privmsg, which is how channels used to broadcast, and is kept as a reference.
+
+Usage: python -m bench.channel_broadcast
+"""
+from bench.common import make_server, connect_client, send_line, time_per_call, print_table, NullTransport
+
+CHANNEL_SIZES = [10, 100, 1000, 5000]
+MEMBER_DELIVERIES = 200000  # Roughly how many lines get written per run, regardless of the channel size.
+
+
+def run(channel_size):
+    server = make_server()
+    members = []
+    for index in range(channel_size):
+        client_protocol, _ = connect_client(server, index, "user{}".format(index), NullTransport)
+        send_line(client_protocol, "JOIN #bench")
+        members.append(client_protocol)
+    channel = server.channels["#bench"]
+    sender = members[0]
+    sender_hostmask = sender.user_instance.hostmask
+    iterations = max(MEMBER_DELIVERIES // channel_size, 10)
+
+    def per_member():
+        for user in channel.users:
+            if user.hostmask != sender_hostmask:
+                user.protocol.privmsg(sender_hostmask, "#bench", "The quick brown fox jumps over the lazy dog")
+
+    def broadcast():
+        send_line(sender, "PRIVMSG #bench :The quick brown fox jumps over the lazy dog")
+
+    per_member_rate = 1e6 / time_per_call(per_member, iterations)
+    broadcast_rate = 1e6 / time_per_call(broadcast, iterations)
+    return channel_size, per_member_rate, broadcast_rate, broadcast_rate / per_member_rate
+
+
+if __name__ == '__main__':
+    print_table(["members", "per member/s", "broadcast/s", "speedup"], [run(x) for x in CHANNEL_SIZES])
@@ -0,0 +1,63 @@
+"""
+Measures how long a channel expiry sweep takes against the number of dormant channels, when a handful of them are
+due. The "scan" column looks at every channel to work out how many days it has left, which is how sweeps used to
+work, and is kept as a reference. The "heap" column pops the channels that are due from ChannelManager's expiry heap
+and runs through the steps of the job channel_maintenance would start, without the MaintenanceScheduler.
+
+Usage: python -m bench.channel_expiry
+"""
+from bench.common import make_server, print_table
+from server.irc_channel.channel import IRCChannel
+from time import time
+from timeit import default_timer
+
+CHANNEL_COUNTS = [1000, 10000, 100000, 300000]
+DUE_CHANNELS = 10
+
+
+def make_channels(server, count):
+    """ Dormant channels with nobody in them, the last DUE_CHANNELS of which are due their first warning. """
+    manager = server.channelmanager
+    now = time()
+    for index in range(count):
+        channel = IRCChannel("#dormant{}".format(index), manager)
+        days_ago = manager.ultimatum - 2 if index >= count - DUE_CHANNELS else 0
+        channel.last_owner_login = now - days_ago * 86400
+        server.channels[channel.key] = channel
+        manager.schedule_expiry(channel, now)
+
+
+def scan(manager):
+    current_time = time()
+    due = 0
+    for channel in manager.channels.values():
+        if channel.channel_owner is None:
+            time_remaining = manager.ultimatum - int((current_time - channel.last_owner_login) / 86400)
+            if time_remaining < 3:
+                due += 1
+    return due
+
+
+def sweep(manager):
+    current_time = time()
+    for _ in manager.expire_channels(manager.pop_due_channels(current_time), current_time):
+        pass
+
+
+def timed(method):
+    start = default_timer()
+    method()
+    return (default_timer() - start) * 1000
+
+
+def run(count):
+    server = make_server()
+    server.channelmanager.journal = None
+    make_channels(server, count)
+    scan_time = timed(lambda: scan(server.channelmanager))
+    heap_time = timed(lambda: sweep(server.channelmanager))
+    return count, scan_time, heap_time, scan_time / heap_time
+
+
+if __name__ == '__main__':
+    print_table(["channels", "scan ms", "heap ms", "speedup"], [run(x) for x in CHANNEL_COUNTS])
@@ -0,0 +1,64 @@
+"""
+Measures what a connection refused by the client limit costs the server, from the factory being asked for a protocol
+to the connection being closed. The "in protocol" column builds an IRCProtocol and checks the limit in connectionMade,
+which is how refusals used to work, and is kept as a reference. The "in factory" column goes through
+ChatServer.buildProtocol, which checks the ClientLimiter first and hands back a RefusedClient. The "accepted" column
+is what a connection under the limit costs, for comparison.
+
+Usage: python -m bench.client_limiter
+"""
+from bench.common import make_config, print_table, time_per_call, NullTransport
+from server.irc_server import ChatServer
+from server.irc_protocol.protocol import IRCProtocol
+from twisted.internet.address import IPv4Address, IPv6Address
+from twisted.internet.task import Clock
+
+ITERATIONS = 20000
+MAX_CLIENTS = 5
+
+
+def run(address):
+    config = make_config()
+    max_clients = config.UserSettings.MaxClients
+    config.UserSettings.MaxClients = MAX_CLIENTS
+    server = ChatServer(config)
+    server.outputflusher.clock = Clock()
+    config.UserSettings.MaxClients = max_clients
+    for _ in range(MAX_CLIENTS):
+        server.buildProtocol(address).makeConnection(NullTransport(peerAddress=address))
+
+    def in_protocol():
+        client_protocol = IRCProtocol(server.users, server.nicknames, server.channels, server.config,
+                                      server.ratelimiter, server.clientlimiter, server.pingmanager,
+                                      server.channelmanager, server.commandmanager, server.outputflusher, server.stats,
+                                      server.profiler, server.maintenance, server.bus)
+        transport = NullTransport(peerAddress=address)
+        client_protocol.transport = transport
+        client_protocol.client_host = transport.getPeer().host
+        clientlimiter = client_protocol.clientlimiter
+        key = clientlimiter.prefix_key(client_protocol.client_host)
+        clientlimiter.client_prefixes[key] += 1  # Counted, and then taken off again by connectionLost.
+        if clientlimiter.client_prefixes[key] > MAX_CLIENTS:
+            client_protocol.sendLine("You have too many clients connected to the server. Max clients: {}".format(
+                MAX_CLIENTS))
+            client_protocol.lose_connection()
+        client_protocol.connectionLost(None)
+
+    def in_factory():
+        server.buildProtocol(address).makeConnection(NullTransport(peerAddress=address))
+
+    def accepted():
+        client_protocol = server.buildProtocol(address)
+        client_protocol.makeConnection(NullTransport(peerAddress=address))
+        client_protocol.connectionLost(None)
+
+    in_protocol_time = time_per_call(in_protocol, ITERATIONS)
+    in_factory_time = time_per_call(in_factory, ITERATIONS)
+    server.clientlimiter.max_clients += 1
+    accepted_time = time_per_call(accepted, ITERATIONS)
+    return address.host, in_protocol_time, in_factory_time, in_protocol_time / in_factory_time, accepted_time
+
+
+if __name__ == '__main__':
+    print_table(["address", "in protocol us", "in factory us", "speedup", "accepted us"],
+                [run(IPv4Address("TCP", "10.0.0.1", 6667)), run(IPv6Address("TCP", "2001:db8::1", 6667))])
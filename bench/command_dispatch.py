@@ -0,0 +1,83 @@
+"""
+Measures the per-line cost of dispatching a command to its handler, with a handler that does nothing. The "getattr"
+column goes through Twisted's IRC.handleCommand with the checks done by decorators wrapped around an irc_ method,
+which is how commands used to be dispatched, and is kept as a reference. The "table" column goes through
+IRCProtocol.handleCommand and the CommandManager's dispatch table. "timed" is the same while the stats are sampling,
+with every handler timed into its histogram, and "sampled" is a busy server's average: lines handled in batches like
+the reads of a reactor iteration, with the stats sampling an iteration every COMMAND_SAMPLE_INTERVAL. "overhead" is
+what the sampling adds to the table dispatch.
+
+Usage: python -m bench.command_dispatch
+"""
+from bench.common import make_server, connect_client, time_per_call, print_table
+from server.irc_protocol.command_manager import CommandEntry
+from server.irc_stats import COMMAND_SAMPLE_INTERVAL
+from twisted.words.protocols.irc import IRC
+from twisted.internet.task import Clock
+from timeit import default_timer
+
+ITERATIONS = 500000
+BATCH_SIZE = 100  # Lines handled per reactor iteration in the batched columns.
+PARAMS = ["#bench", "The quick brown fox jumps over the lazy dog"]
+
+
+def min_param_count(count):
+    """ The old parameter count decorator, for the reference column. """
+    def command_decorator(command_method):
+        def wrapper(*args):
+            assert command_method.__name__.startswith('irc_')
+            command_name = command_method.__name__[4:]
+            self = args[0]
+            if len(args[2]) >= count:
+                return command_method(*args)
+            return self.sendLine(self.user_instance.err_needmoreparams(command_name))
+        return wrapper
+    return command_decorator
+
+
+def irc_BENCH(self, prefix, params):
+    pass
+
+
+def run(min_params):
+    server = make_server()
+    client_protocol, _ = connect_client(server, 0, "bench")
+    dispatch_table = dict(client_protocol.commands)
+    dispatch_table["BENCH"] = CommandEntry(irc_BENCH, min_params, None, False)
+    client_protocol.commands = dispatch_table
+    server.stats.clock = clock = Clock()
+    server.stats.add_commands(dispatch_table)
+    if min_params:
+        client_protocol.irc_BENCH = min_param_count(min_params)(irc_BENCH).__get__(client_protocol)
+    else:
+        client_protocol.irc_BENCH = irc_BENCH.__get__(client_protocol)
+
+    def getattr_dispatch():
+        IRC.handleCommand(client_protocol, "BENCH", None, PARAMS)
+
+    def batched_dispatch(sampling):
+        def dispatch():
+            handle_command = client_protocol.handleCommand
+            next_sample = default_timer()
+            for _ in range(ITERATIONS // BATCH_SIZE):
+                if sampling and default_timer() >= next_sample:
+                    server.stats.sample_commands()
+                    next_sample = default_timer() + COMMAND_SAMPLE_INTERVAL
+                for _ in range(BATCH_SIZE):
+                    handle_command("BENCH", None, PARAMS)
+                clock.advance(0)  # The end of the iteration, which swaps the plain entries back.
+        return time_per_call(dispatch, 1) / ITERATIONS
+
+    getattr_time = time_per_call(getattr_dispatch, ITERATIONS)
+    table_time = batched_dispatch(False)
+    dispatch_table.update(server.stats.timed_entries)
+    timed_time = batched_dispatch(False)
+    dispatch_table.update(server.stats.plain_entries)
+    sampled_time = batched_dispatch(True)
+    return (min_params, getattr_time, table_time, timed_time, sampled_time,
+            "{:+.1%}".format(sampled_time / table_time - 1), getattr_time / sampled_time)
+
+
+if __name__ == '__main__':
+    print_table(["min params", "getattr us", "table us", "timed us", "sampled us", "overhead", "speedup"],
+                [run(x) for x in (0, 2)])
@@ -0,0 +1,76 @@
+"""
+Shared helpers for the benchmarks in this package. Everything here runs in-process against fake transports, so
+no sockets are opened and the numbers only measure the server's own code paths.
+"""
+from server.irc_config.config import IRCConfig
+from server.irc_server import ChatServer
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+from tempfile import mkdtemp
+from timeit import default_timer
+from os import path
+
+
+_config = None
+
+
+def make_config():
+    """ Load the default config values through a throwaway crow.ini. The sections of a SentryConfig live on the class,
+    so the config is only read once per process; reading it again would skip the type conversions. """
+    global _config
+    if _config is None:
+        config_directory = mkdtemp()
+        _config = IRCConfig(path.join(config_directory, "crow.ini"))
+        _config.flush_config()
+        _config.read_config()
+        _config.MaintenanceSettings.FlushDirectory = path.join(config_directory, "crow_data")
+        _config.UserSettings.MaxClients = 1 << 30  # Every fake client shares a handful of hosts.
+        _config.UserSettings.AcceptRate = _config.UserSettings.SubnetAcceptRate = (1 << 30, 1)  # And connects at once.
+    return _config
+
+
+def make_server():
+    return ChatServer(make_config())
+
+
+class NullTransport(StringTransport):
+    """ A transport which throws away everything written to it, for fan-out benchmarks with thousands of members. """
+    def write(self, data):
+        pass
+
+    def writeSequence(self, data):
+        pass
+
+
+def connect_client(server, index, nickname=None, transport_class=StringTransport):
+    """ Build a protocol for a fake client and connect it to a fake transport. Registers a nickname if given. """
+    address = IPv4Address("TCP", "10.{}.{}.{}".format((index >> 16) & 255, (index >> 8) & 255, index & 255), 6667)
+    client_protocol = server.buildProtocol(address)
+    transport = transport_class(peerAddress=address)
+    client_protocol.makeConnection(transport)
+    if nickname is not None:
+        send_line(client_protocol, "NICK {}".format(nickname))
+        send_line(client_protocol, "USER {} 0 * :{}".format(nickname, nickname))
+    transport.clear()
+    return client_protocol, transport
+
+
+def send_line(client_protocol, line):
+    """ Deliver a line from a client, then write out everything it caused to be sent like the end of a reactor
+    iteration would. """
+    client_protocol.dataReceived(line.encode("utf-8") + b"\r\n")
+    client_protocol.outputflusher.flush()
+
+
+def time_per_call(method, iterations):
+    """ Returns how many microseconds a single call to method took, averaged over the iterations. """
+    start = default_timer()
+    for _ in range(iterations):
+        method()
+    return (default_timer() - start) / iterations * 1e6
+
+
+def print_table(header, rows):
+    print(" | ".join("{:>14}".format(x) for x in header))
+    for row in rows:
+        print(" | ".join("{:>14}".format(x if type(x) is not float else "{:.2f}".format(x)) for x in row))
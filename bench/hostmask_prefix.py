@@ -0,0 +1,41 @@
+"""
+Measures what building a channel PRIVMSG line costs the sender, with nobody else in the channel to deliver it to. The
+"format" column formats the sender's hostmask into the line and encodes all of it, which is how channels used to
+build the line, and is kept as a reference. The "prefix" column goes through IRCChannel.broadcast_message, which starts
+the line with the sender's cached ":nick!user@host" prefix. The "rebuild" column is what the prefix costs on the
+occasions it does change, such as a nick change.
+
+Usage: python -m bench.hostmask_prefix
+"""
+from bench.common import make_server, connect_client, send_line, time_per_call, print_table, NullTransport
+from twisted.words.protocols.irc import lowQuote
+
+ITERATIONS = 500000
+MESSAGES = ["hi", "The quick brown fox jumps over the lazy dog", "x" * 400]
+
+
+def run(message):
+    server = make_server()
+    client_protocol, _ = connect_client(server, 0, "bench", NullTransport)
+    send_line(client_protocol, "JOIN #bench")
+    channel = server.channels["#bench"]
+    user = client_protocol.user_instance
+
+    def format_line():
+        line = ":{} PRIVMSG {} :{}".format(user.hostmask, channel.channel_name, lowQuote(message))
+        channel.deliver_encoded_line(line.encode("utf-8") + b"\r\n", user)
+
+    def prefix_line():
+        channel.broadcast_message(message, user)
+
+    def rebuild_prefix():
+        user.set_hostmask(nickname="bench")
+
+    format_time = time_per_call(format_line, ITERATIONS)
+    prefix_time = time_per_call(prefix_line, ITERATIONS)
+    rebuild_time = time_per_call(rebuild_prefix, ITERATIONS)
+    return len(message), format_time, prefix_time, format_time / prefix_time, rebuild_time
+
+
+if __name__ == '__main__':
+    print_table(["message chars", "format us", "prefix us", "speedup", "rebuild us"], [run(x) for x in MESSAGES])
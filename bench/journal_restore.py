@@ -0,0 +1,42 @@
+"""
+Measures how long it takes to restore channels from a snapshot plus a journal tail on startup.
+
+Usage: python -m bench.journal_restore
+"""
+from bench.common import make_config, make_server, print_table
+from server.irc_journal import ChannelJournal
+from timeit import default_timer
+from tempfile import mkdtemp
+
+CHANNEL_COUNTS = [10000, 100000]
+JOURNAL_TAIL = 50000  # Records appended after the snapshot.
+
+
+def write_state(directory, channel_count):
+    """ Write the files directly with the writer methods, which normally run in the reactor's threadpool. """
+    journal = ChannelJournal(directory)
+    journal.load()
+    journal.append_records(0, [
+        {"op": "create", "channel": "#channel{}".format(x), "account": ["owner{}".format(x), "x" * 43],
+         "last_owner_login": 1500000000}
+        for x in range(channel_count)
+    ])
+    journal.write_snapshot(1)
+    journal.append_records(1, [
+        {"op": "update", "channel": "#channel{}".format(x % channel_count),
+         "fields": {"last_owner_login": 1500000000 + x, "scheduled_for_deletion": False}}
+        for x in range(JOURNAL_TAIL)
+    ])
+
+
+def run(channel_count):
+    make_config().MaintenanceSettings.FlushDirectory = mkdtemp()
+    server = make_server()
+    write_state(server.journal.directory, channel_count)
+    start = default_timer()
+    restored_channels = server.restore_state()
+    return restored_channels, default_timer() - start
+
+
+if __name__ == '__main__':
+    print_table(["channels", "restore (s)"], [run(x) for x in CHANNEL_COUNTS])
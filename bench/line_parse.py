@@ -0,0 +1,100 @@
+"""
+Measures how many lines/sec the server can parse out of received data, with a handleCommand that does nothing. The
+first table sends pipelined reads of different sizes; the second sends one long line split over many small reads. The
+"twisted" column goes through IRC.dataReceived and parsemsg, which is how lines used to be parsed, and is kept as a
+reference. The two take turns being timed a few times, and each one's fastest run is kept. Before timing, it checks
+that both produce the same commands for every line in the sample.
+
+Usage: python -m bench.line_parse
+"""
+from bench.common import make_server, connect_client, time_per_call, print_table
+from twisted.words.protocols.irc import IRC
+
+SAMPLE_LINES = [
+    "PRIVMSG #bench :The quick brown fox jumps over the lazy dog",
+    "PRIVMSG someone :hello there",
+    "JOIN #bench",
+    "PONG :abcdefghijklmno",
+    "MODE #bench +o  someone",
+    ":nick!user@host PRIVMSG #bench :prefixed: with a colon : inside",
+    "WHOIS someone",
+    "privmsg #bench :lower case command éè",
+    "PRIVMSG #bench :",
+    "QUIT",
+]
+CHUNK_SIZES = [1, 10, 100, 500]
+LINES_PER_RUN = 100000
+LONG_LINE_LENGTH = 8192
+READ_SIZES = [16, 64, 512]
+REPEATS = 5
+
+
+def make_protocol(received):
+    server = make_server()
+    client_protocol, _ = connect_client(server, 0)
+    client_protocol.handleCommand = lambda command, prefix, params: received.append((command, prefix, params))
+    return client_protocol
+
+
+def check_compatible():
+    twisted_received, received = [], []
+    twisted_protocol, client_protocol = make_protocol(twisted_received), make_protocol(received)
+    data = "".join(x + "\r\n" for x in SAMPLE_LINES).encode("utf-8") + b"PRIVMSG #bench :from mIRC\n"
+    IRC.dataReceived(twisted_protocol, data)
+    for index in range(len(data)):  # Byte by byte, to check lines split across reads too.
+        client_protocol.dataReceived(data[index:index + 1])
+    assert twisted_received == received, (twisted_received, received)
+
+
+def twisted_data_received(client_protocol, data):
+    """ IRCProtocol.dataReceived with IRC.dataReceived in place of its own parser, doing the same per read work. """
+    client_protocol.pingmanager.activity(client_protocol)
+    client_protocol.stats.bytes_in += len(data)
+    IRC.dataReceived(client_protocol, data)
+
+
+def best_times(twisted_method, method, iterations):
+    """ Time both a few times, taking turns, and keep each one's fastest, so a busy machine doesn't decide which side
+    looks slower. """
+    twisted_times, times = [], []
+    for _ in range(REPEATS):
+        twisted_times.append(time_per_call(twisted_method, iterations))
+        times.append(time_per_call(method, iterations))
+    return min(twisted_times), min(times)
+
+
+def run(chunk_size):
+    data = "".join(SAMPLE_LINES[x % len(SAMPLE_LINES)] + "\r\n" for x in range(chunk_size)).encode("utf-8")
+    iterations = max(LINES_PER_RUN // chunk_size, 10)
+    client_protocol = make_protocol([])
+    client_protocol.handleCommand = lambda command, prefix, params: None
+
+    twisted_time, time = best_times(lambda: twisted_data_received(client_protocol, data),
+                                    lambda: client_protocol.dataReceived(data), iterations)
+    return chunk_size, chunk_size * 1e6 / twisted_time, chunk_size * 1e6 / time, twisted_time / time
+
+
+def run_long_line(read_size):
+    line = "PRIVMSG #bench :" + "x" * LONG_LINE_LENGTH + "\r\n"
+    data = line.encode("utf-8")
+    reads = [data[x:x + read_size] for x in range(0, len(data), read_size)]
+    client_protocol = make_protocol([])
+    client_protocol.handleCommand = lambda command, prefix, params: None
+
+    def twisted_line():
+        for read in reads:
+            twisted_data_received(client_protocol, read)
+
+    def parser_line():
+        for read in reads:
+            client_protocol.dataReceived(read)
+
+    twisted_time, time = best_times(twisted_line, parser_line, 200)
+    return read_size, 1e6 / twisted_time, 1e6 / time, twisted_time / time
+
+
+if __name__ == '__main__':
+    check_compatible()
+    print_table(["lines/chunk", "twisted lines/s", "lines/s", "speedup"], [run(x) for x in CHUNK_SIZES])
+    print()
+    print_table(["bytes/read", "twisted lines/s", "lines/s", "speedup"], [run_long_line(x) for x in READ_SIZES])
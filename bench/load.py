@@ -0,0 +1,616 @@
+"""
+Load generator for the whole server over loopback. Starts a ChatServer in a child process listening on 127.0.0.1,
+connects thousands of simulated clients to it over real TCP connections, and runs these scenarios in order:
+    register        - Every client sends NICK/USER. Latency is until its welcome (001).
+    join            - Every client joins one of the channels. Latency is until its end of NAMES (366).
+    channel_privmsg - Random members talk in their channel. Latency is per delivered copy.
+    private_privmsg - Random clients message another random client.
+    nick_change     - Every client changes its nickname. Latency is per NICK line delivered to it and its channel.
+    quit_storm      - Half of every channel QUITs at once. Latency is per QUIT delivered to the members who stayed.
+    reconnect_storm - With --storm, that many more clients connect at once, each registering as soon as the server
+                      lets it in. Latency is from the server's first line to its welcome (001), so it shows how long
+                      the clients already let in wait behind the rest of the storm. Refused ones reconnect.
+Every client connects from its own 127.x.y.1 address, so it's in a subnet of its own, and the server runs with the
+default AcceptRate and SubnetAcceptRate unless they're given (or turned "off"). A client counts as connected once the
+server sends it its first line; one refused before then reconnects after a second or two.
+With --workers, the real server is started instead, bin/main.py with Workers set to each of the given counts in turn,
+and the clients are spread across the workers' SO_REUSEPORT listeners by the kernel. A scaling table of each
+scenario's msgs/s for each count follows the per-run tables. The clients all run in this one process, so the scaling
+only shows while the machine has a core to spare for each worker besides the generator's.
+For each scenario it reports deliveries/sec, p50/p99/p999 delivery latency, and the server's CPU time and RSS, summed
+over its processes. The server and generator share the machine, so numbers are only comparable between runs on the
+same machine.
+Results can be written as JSON and compared against a stored baseline; regressions beyond the tolerance are listed
+and the exit status is 1. Linux only, the server's usage is read from /proc.
+
+Usage:
+    python -m bench.load [--clients 2000] [--channels 20] [--messages 2000] [--output results.json]
+                         [--baseline baseline.json] [--tolerance 0.15] [--storm 50000]
+                         [--accept-rate 500/1|off] [--subnet-accept-rate 50/10|off] [--workers 1,2,4]
+    python -m bench.load --compare baseline.json results.json [--tolerance 0.15]
+"""
+from bench.common import make_config, make_server, print_table
+from server.irc_config.config import IRCConfig
+from twisted.internet import reactor, defer, task
+from twisted.internet.protocol import ClientFactory
+from twisted.protocols.basic import LineReceiver
+from argparse import ArgumentParser, SUPPRESS
+from subprocess import Popen, PIPE, STDOUT
+from configparser import ConfigParser
+from tempfile import mkdtemp
+from random import Random
+from time import monotonic
+from os import sysconf, listdir, killpg, path, environ, pathsep
+from signal import SIGKILL
+from socket import socket
+import resource
+import json
+import sys
+
+SCENARIO_TIMEOUT = 60  # Seconds. A scenario which takes longer is reported with how much of it completed.
+WELCOME_TIMEOUT = 30  # Seconds a client waits to be let in before it gives up on the connection and reconnects.
+SERVER_START_TIMEOUT = 30  # Seconds to wait for bin/main.py's workers to start listening.
+SEND_BATCH = 100  # How many lines the generator sends before letting the reactor run.
+CLOCK_TICKS = sysconf("SC_CLK_TCK")
+METRICS = [  # (name, label, whether higher is better)
+    ("messages_per_sec", "msgs/s", True),
+    ("latency_p99_ms", "p99 ms", False),
+    ("server_cpu_us_per_message", "cpu us/msg", False),
+    ("server_peak_rss_mb", "peak rss MB", False),
+]
+
+
+def raise_fd_limit():
+    """ Thousands of clients need thousands of file descriptors, on both ends. """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def source_address(index):
+    """ The loopback address the index'th client connects from, each in a /24 of its own. """
+    return "127.{}.{}.1".format(1 + (index >> 8) % 254, index & 255)
+
+
+def serve(accept_rate, subnet_accept_rate):
+    """ The child process: run a server with the default config and report the port it listens on. The accept rates
+    are "calls/seconds", "off", or None for the config's default. """
+    raise_fd_limit()
+    user_settings = make_config().UserSettings
+    for name, value in (("AcceptRate", accept_rate), ("SubnetAcceptRate", subnet_accept_rate)):
+        if value is None:
+            value = user_settings.options[name].default
+        setattr(user_settings, name, (1 << 30, 1) if value == "off" else tuple(int(x) for x in value.split("/")))
+    server = make_server()
+    server.restore_state()
+    port = server.acceptthrottle.add_port(reactor.listenTCP(0, server, backlog=4096, interface="127.0.0.1"))
+    print(port.getHost().port, flush=True)
+    reactor.run()
+
+
+def write_config(directory, port, workers, accept_rates):
+    """ Write the crow.ini bin/main.py reads from its working directory: the defaults, but listening on 127.0.0.1:port
+    with that many workers, and without the periodic maintenance, the metrics endpoint or a limit on clients per
+    host. The accept rates are the same as serve()'s. """
+    ini_path = path.join(directory, "crow.ini")
+    IRCConfig(ini_path).flush_config()
+    config = ConfigParser()
+    config.read(ini_path)
+    config["ServerSettings"].update(port=str(port), interface="127.0.0.1", workers=str(workers), metricsport="0")
+    config["MaintenanceSettings"].update(flushinterval="0", channelscaninterval="0", ratelimitclearinterval="0")
+    config["UserSettings"]["maxclients"] = str(1 << 30)
+    for name, value in zip(("acceptrate", "subnetacceptrate"), accept_rates):
+        if value is not None:
+            config["UserSettings"][name] = "{}/1".format(1 << 30) if value == "off" else value
+    with open(ini_path, "w") as ini_file:
+        config.write(ini_file)
+
+
+def free_port():
+    with socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def process_tree(pid):
+    """ The pid and the pids of all its descendants, such as bin/main.py's workers. """
+    children = {}
+    for name in listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open("/proc/{}/stat".format(name)) as stat_file:
+                    parent = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+            except OSError:  # Exited in the meantime.
+                continue
+            children.setdefault(parent, []).append(int(name))
+    pids = [pid]
+    for parent in pids:  # Grows as it goes.
+        pids.extend(children.get(parent, []))
+    return pids
+
+
+def server_usage(pid):
+    """ Returns the CPU seconds used by the process and its descendants so far, and their current and peak RSS in MB,
+    each summed over the processes. """
+    cpu_seconds = rss = peak_rss = 0
+    for process_id in process_tree(pid):
+        try:
+            with open("/proc/{}/stat".format(process_id)) as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            memory = {}
+            with open("/proc/{}/status".format(process_id)) as status_file:
+                for status_line in status_file:
+                    name, _, value = status_line.partition(":")
+                    if name in ("VmRSS", "VmHWM"):
+                        memory[name] = int(value.split()[0]) / 1024
+        except OSError:
+            continue
+        cpu_seconds += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+        rss += memory["VmRSS"]
+        peak_rss += memory["VmHWM"]
+    return cpu_seconds, rss, peak_rss
+
+
+def percentile(sorted_values, fraction):
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def sent_at(line):
+    """ The timestamp a generated PRIVMSG/QUIT line starts its text with. """
+    return float(line.split(b" :", 1)[1].split(b" ", 1)[0])
+
+
+class LoadClient(LineReceiver):
+    delimiter = b"\r\n"
+    MAX_LENGTH = 1 << 20
+    welcomed = False  # Whether the server has let it in and sent it its first line.
+
+    def connectionMade(self):
+        # The kernel completes the handshake before the server accepts it, and drops it if the queue overflows.
+        self.welcome_timeout = reactor.callLater(WELCOME_TIMEOUT, self.transport.abortConnection)
+
+    def lineReceived(self, line):
+        if not self.welcomed:
+            if not line.startswith(b"ERROR "):  # Refused, connectionLost reconnects it.
+                self.welcomed = True
+                self.welcome_timeout.cancel()
+                self.factory.welcomed(self)
+            return
+        scenario = self.factory.generator.scenario
+        if scenario is not None and line:
+            scenario.line_received(self, line)
+
+    def connectionLost(self, reason):
+        if not self.welcomed:
+            if self.welcome_timeout.active():
+                self.welcome_timeout.cancel()
+            self.factory.generator.reconnect(self.transport.connector)
+
+
+class LoadFactory(ClientFactory):
+    protocol = LoadClient
+
+    def __init__(self, generator, welcomed):
+        self.generator = generator
+        self.welcomed = welcomed  # Called with each client the server lets in.
+
+    def clientConnectionFailed(self, connector, reason):
+        self.generator.reconnect(connector)
+
+
+class Scenario:
+    """ Sends its load in start(), and records a latency for each line it's waiting for in line_received(). Done once
+    `expected` latencies were recorded. """
+    name = None
+    timeout = SCENARIO_TIMEOUT
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.clients = generator.clients
+        self.random = generator.random
+        self.latencies = []
+        self.expected = 0
+        self.done = defer.Deferred()
+
+    def start(self):
+        raise NotImplementedError
+
+    def line_received(self, client, line):
+        pass
+
+    def record(self, sent_time):
+        self.latencies.append(monotonic() - sent_time)
+        if len(self.latencies) >= self.expected and not self.done.called:
+            self.done.callback(None)
+
+    def send_paced(self, lines):
+        """ Send (client, line) pairs, letting the reactor run every SEND_BATCH lines. The line may be a callable,
+        which is called right before sending, so it can be stamped with the time. """
+        def sender():
+            for index, (client, line) in enumerate(lines):
+                client.sendLine((line() if callable(line) else line).encode("utf-8"))
+                if index % SEND_BATCH == SEND_BATCH - 1:
+                    yield None
+        return task.cooperate(sender()).whenDone()
+
+
+class Register(Scenario):
+    name = "register"
+
+    def start(self):
+        self.expected = len(self.clients)
+        self.sent = {}
+
+        def lines():
+            for client in self.clients:
+                self.sent[client] = monotonic()
+                yield client, "NICK {}".format(client.nickname)
+                yield client, "USER {} 0 * :load".format(client.nickname)
+        self.send_paced(lines())
+
+    def line_received(self, client, line):
+        if b" 001 " in line:
+            self.record(self.sent[client])
+
+
+class Join(Scenario):
+    name = "join"
+
+    def start(self):
+        self.expected = len(self.clients)
+        self.sent = {}
+
+        def lines():
+            for client in self.clients:
+                self.sent[client] = monotonic()
+                yield client, "JOIN {}".format(client.channel)
+        self.send_paced(lines())
+
+    def line_received(self, client, line):
+        if b" 366 " in line:
+            self.record(self.sent[client])
+
+
+class ChannelPrivmsg(Scenario):
+    name = "channel_privmsg"
+
+    def start(self):
+        members = self.generator.channel_members()
+        senders = [self.random.choice(self.clients) for _ in range(self.generator.messages)]
+        self.expected = sum(len(members[x.channel]) - 1 for x in senders)
+        self.send_paced((x, self.stamped_line(x.channel)) for x in senders)
+
+    @staticmethod
+    def stamped_line(destination):
+        return lambda: "PRIVMSG {} :{:.6f} The quick brown fox jumps over the lazy dog".format(destination, monotonic())
+
+    def line_received(self, client, line):
+        if b" PRIVMSG " in line:
+            self.record(sent_at(line))
+
+
+class PrivatePrivmsg(ChannelPrivmsg):
+    name = "private_privmsg"
+
+    def start(self):
+        self.expected = self.generator.messages
+        pairs = [self.random.sample(self.clients, 2) for _ in range(self.expected)]
+        self.send_paced((sender, self.stamped_line(target.nickname)) for sender, target in pairs)
+
+
+class NickChange(Scenario):
+    name = "nick_change"
+
+    def start(self):
+        members = self.generator.channel_members()
+        self.expected = sum(len(x) * len(x) for x in members.values())  # Every member sees every rename in it.
+        self.sent = {}
+
+        def lines():
+            for client in self.clients:
+                client.nickname += "n"
+                self.sent[client.nickname] = monotonic()
+                yield client, "NICK {}".format(client.nickname)
+        self.send_paced(lines())
+
+    def line_received(self, client, line):
+        if b" NICK " in line:
+            self.record(self.sent[line.rsplit(b" ", 1)[1].decode("utf-8")])
+
+
+class QuitStorm(Scenario):
+    name = "quit_storm"
+
+    def start(self):
+        self.quitters = set()
+        for members in self.generator.channel_members().values():
+            quitters = members[::2]
+            self.quitters.update(quitters)
+            self.expected += len(quitters) * (len(members) - len(quitters))
+        self.send_paced((x, lambda: "QUIT :{:.6f} storm".format(monotonic())) for x in self.quitters)
+
+    def line_received(self, client, line):
+        if client not in self.quitters and b" QUIT " in line:
+            self.record(sent_at(line))
+
+
+class ReconnectStorm(Scenario):
+    name = "reconnect_storm"
+
+    def start(self):
+        self.expected = self.generator.storm
+        self.timeout = SCENARIO_TIMEOUT + self.expected / 100  # However it's throttled, it takes a while.
+        self.welcomed_at = {}
+        factory = LoadFactory(self.generator, self.welcomed)
+        self.generator.connect_clients(factory, len(self.clients), self.expected)
+
+    def welcomed(self, client):
+        client.nickname = "storm{}".format(len(self.welcomed_at))
+        self.welcomed_at[client] = monotonic()
+        client.sendLine("NICK {}".format(client.nickname).encode("utf-8"))
+        client.sendLine("USER {} 0 * :storm".format(client.nickname).encode("utf-8"))
+
+    def line_received(self, client, line):
+        if b" 001 " in line:
+            self.record(self.welcomed_at[client])
+
+
+SCENARIOS = [Register, Join, ChannelPrivmsg, PrivatePrivmsg, NickChange, QuitStorm]
+
+
+class LoadGenerator:
+    def __init__(self, client_count, channel_count, messages, storm=0, accept_rates=(None, None), workers=None):
+        self.client_count = client_count
+        self.channel_count = channel_count
+        self.messages = messages
+        self.storm = storm
+        self.accept_rates = accept_rates
+        self.workers = workers  # Run bin/main.py with this many workers, rather than the --serve child.
+        self.random = Random(6667)
+        self.clients = []
+        self.scenario = None
+        self.all_connected = defer.Deferred()
+        self.server_process = None
+        self.port = None
+        self.reconnects = 0
+
+    def client_connected(self, client):
+        index = len(self.clients)
+        client.nickname = "load{}".format(index)
+        client.channel = "#load{}".format(index % self.channel_count)
+        self.clients.append(client)
+        if len(self.clients) == self.client_count:
+            self.all_connected.callback(None)
+
+    def channel_members(self):
+        members = {}
+        for client in self.clients:
+            members.setdefault(client.channel, []).append(client)
+        return members
+
+    def connect_clients(self, factory, first_index, count):
+        """ Connect count clients, from the source addresses of indexes first_index onwards. """
+        def connector():
+            for index in range(first_index, first_index + count):
+                reactor.connectTCP("127.0.0.1", self.port, factory, bindAddress=(source_address(index), 0))
+                if index % SEND_BATCH == SEND_BATCH - 1:
+                    yield None
+        return task.cooperate(connector()).whenDone()
+
+    def reconnect(self, connector):
+        """ Try a refused client again after a second or two, like a client would. """
+        if self.server_process is None:  # Stopped, the connections were dropped along with the server.
+            return
+        self.reconnects += 1
+        reactor.callLater(self.random.uniform(1, 2), connector.connect)
+
+    @defer.inlineCallbacks
+    def start_server(self):
+        """ Start the --serve child, or bin/main.py in a directory of its own if workers was given, and wait for it
+        to listen. Either way it's in a session of its own, so stop() can kill it along with any workers. """
+        if self.workers is None:
+            command = [sys.executable, "-m", "bench.load", "--serve"]
+            for option, value in zip(("--accept-rate", "--subnet-accept-rate"), self.accept_rates):
+                if value is not None:
+                    command += [option, value]
+            self.server_process = Popen(command, stdout=PIPE, start_new_session=True)
+            self.port = int(self.server_process.stdout.readline())
+            return
+        # bin/main.py strips "bin" off either end of its working directory, so the directory mustn't end in b/i/n.
+        directory = mkdtemp(suffix="-load")
+        self.port = free_port()
+        write_config(directory, self.port, self.workers, self.accept_rates)
+        project_root = path.dirname(path.dirname(path.abspath(__file__)))
+        log_path = path.join(directory, "server.log")
+        with open(log_path, "w") as log_file:
+            self.server_process = Popen(
+                [sys.executable, path.join(project_root, "bin", "main.py")], cwd=directory, stdout=log_file,
+                stderr=STDOUT, start_new_session=True,
+                env=dict(environ, PYTHONUNBUFFERED="1",
+                         PYTHONPATH=pathsep.join(x for x in [project_root, environ.get("PYTHONPATH")] if x))
+            )
+        deadline = monotonic() + SERVER_START_TIMEOUT
+        while True:
+            with open(log_path) as log_file:
+                log = log_file.read()
+            if log.count("Endpoint is now listening") >= self.workers:
+                return
+            if self.server_process.poll() is not None or monotonic() > deadline:
+                raise RuntimeError("bin/main.py didn't start listening, its output was:\n" + log)
+            yield task.deferLater(reactor, 0.1, lambda: None)
+
+    @defer.inlineCallbacks
+    def run(self):
+        yield self.start_server()
+        self.connect_clients(LoadFactory(self, self.client_connected), 0, self.client_count)
+        yield self.all_connected
+        results = {}
+        for scenario_class in SCENARIOS + ([ReconnectStorm] if self.storm else []):
+            results[scenario_class.name] = yield self.run_scenario(scenario_class(self))
+        return results
+
+    @defer.inlineCallbacks
+    def run_scenario(self, scenario):
+        self.scenario = scenario
+        cpu_before, _, _ = server_usage(self.server_process.pid)
+        reconnects_before = self.reconnects
+        start = monotonic()
+        scenario.start()
+        timeout = reactor.callLater(scenario.timeout, scenario.done.callback, None)
+        yield scenario.done
+        if timeout.active():
+            timeout.cancel()
+        elapsed = monotonic() - start
+        yield task.deferLater(reactor, 0.5, lambda: None)  # Let stragglers in so they don't count for the next one.
+        self.scenario = None
+        cpu_after, rss, peak_rss = server_usage(self.server_process.pid)
+        latencies = sorted(scenario.latencies)
+        deliveries = len(latencies)
+        result = {
+            "deliveries": deliveries,
+            "completed": deliveries / scenario.expected if scenario.expected else 1.0,
+            "seconds": elapsed,
+            "messages_per_sec": deliveries / elapsed,
+            "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+            "latency_p999_ms": percentile(latencies, 0.999) * 1000,
+            "server_cpu_seconds": cpu_after - cpu_before,
+            "server_cpu_us_per_message": (cpu_after - cpu_before) * 1e6 / max(deliveries, 1),
+            "server_rss_mb": rss,
+            "server_peak_rss_mb": peak_rss,
+            "reconnects": self.reconnects - reconnects_before,
+        }
+        return result
+
+    def stop(self):
+        if self.server_process is not None:
+            killpg(self.server_process.pid, SIGKILL)
+            self.server_process.wait()
+            self.server_process = None
+
+
+def compare(baseline, results, tolerance):
+    """ Print each scenario's metrics against the baseline. Returns how many regressed by more than the tolerance. """
+    rows = []
+    regressions = 0
+    for name, result in results["scenarios"].items():
+        baseline_result = baseline["scenarios"].get(name)
+        if baseline_result is None:
+            continue
+        for metric, label, higher_is_better in METRICS:
+            before, after = baseline_result[metric], result[metric]
+            change = (after - before) / before if before else 0.0
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            regressions += regressed
+            rows.append([name, label, before, after, "{:+.1%}".format(change), "REGRESSION" if regressed else ""])
+    print_table(["scenario", "metric", "baseline", "result", "change", ""], rows)
+    return regressions
+
+
+def compare_runs(baseline, results, tolerance):
+    """ compare(), for results from several --workers counts, run by run. """
+    if "runs" not in results:
+        return compare(baseline, results, tolerance)
+    regressions = 0
+    for workers, run_results in results["runs"].items():
+        if workers in baseline.get("runs", {}):
+            print("Workers: {}".format(workers))
+            regressions += compare(baseline["runs"][workers], run_results, tolerance)
+            print()
+    return regressions
+
+
+def print_results(results):
+    print_table(["scenario", "msgs/s", "p50 ms", "p99 ms", "p999 ms", "cpu us/msg", "peak rss MB", "completed"], [
+        [name, x["messages_per_sec"], x["latency_p50_ms"], x["latency_p99_ms"], x["latency_p999_ms"],
+         x["server_cpu_us_per_message"], x["server_peak_rss_mb"], "{:.0%}".format(x["completed"])]
+        for name, x in results["scenarios"].items()
+    ])
+
+
+def print_scaling(runs):
+    """ Each scenario's msgs/s for every worker count, and how many times the first count's it is. """
+    counts = list(runs)
+    print_table(
+        ["scenario"] + ["msgs/s {}w".format(x) for x in counts] + ["{}w/{}w".format(x, counts[0]) for x in counts[1:]],
+        [[name] + [runs[x]["scenarios"][name]["messages_per_sec"] for x in counts] +
+         ["{:.2f}x".format(runs[x]["scenarios"][name]["messages_per_sec"] / first["messages_per_sec"])
+          for x in counts[1:]]
+         for name, first in runs[counts[0]]["scenarios"].items()]
+    )
+
+
+def main():
+    parser = ArgumentParser(description="Loopback load generator for the whole server.")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000, help="Messages sent in each PRIVMSG scenario.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the results against this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed change before it's a regression.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"), help="Compare two stored results.")
+    parser.add_argument("--storm", type=int, default=0, help="Clients connecting at once in reconnect_storm.")
+    parser.add_argument("--accept-rate", help="The server's AcceptRate, as calls/seconds or off.")
+    parser.add_argument("--subnet-accept-rate", help="The server's SubnetAcceptRate, as calls/seconds or off.")
+    parser.add_argument("--workers", help="Run bin/main.py with each of these comma separated worker counts in turn.")
+    parser.add_argument("--serve", action="store_true", help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.accept_rate, args.subnet_accept_rate)
+    if args.compare is not None:
+        with open(args.compare[0]) as baseline_file, open(args.compare[1]) as results_file:
+            sys.exit(1 if compare_runs(json.load(baseline_file), json.load(results_file), args.tolerance) else 0)
+
+    raise_fd_limit()
+    worker_counts = [None] if args.workers is None else [int(x) for x in args.workers.split(",")]
+    runs = {}
+    outcome = {}
+    generators = []
+
+    @defer.inlineCallbacks
+    def run_all():
+        """ One reactor for every run, since it can't be started again. """
+        for worker_count in worker_counts:
+            generator = LoadGenerator(args.clients, args.channels, args.messages, args.storm,
+                                      (args.accept_rate, args.subnet_accept_rate), worker_count)
+            generators.append(generator)
+            scenario_results = yield generator.run()
+            generator.stop()
+            runs[str(worker_count)] = {
+                "clients": args.clients, "channels": args.channels, "messages": args.messages, "storm": args.storm,
+                "workers": worker_count, "scenarios": scenario_results
+            }
+            yield task.deferLater(reactor, 1, lambda: None)  # Let the clients of this run finish disconnecting.
+
+    def failed(failure):
+        outcome["failure"] = failure
+
+    run_all().addErrback(failed).addBoth(lambda _: reactor.stop())
+    try:
+        reactor.run()
+    finally:
+        for generator in generators:
+            generator.stop()
+    if "failure" in outcome:
+        outcome["failure"].raiseException()
+
+    for run_results in runs.values():
+        if run_results["workers"] is not None:
+            print("Workers: {}".format(run_results["workers"]))
+        print_results(run_results)
+        print()
+    if len(runs) > 1:
+        print_scaling(runs)
+    results = runs[str(worker_counts[0])] if len(runs) == 1 else {"runs": runs}
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            sys.exit(1 if compare_runs(json.load(baseline_file), results, args.tolerance) else 0)
+
+
+if __name__ == '__main__':
+    main()
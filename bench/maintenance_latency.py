@@ -0,0 +1,81 @@
+"""
+Measures how long clients are held up while a mass channel expiry is deleting populated channels. The "one pass"
+column deletes every channel in a single call, which is how channel sweeps used to run, and is kept as a reference.
+The "longest slice" column is the longest the reactor was kept from handling clients while the MaintenanceScheduler
+ran the same deletions, a slice per reactor iteration, and "slices" is how many iterations it took.
+
+Usage: python -m bench.maintenance_latency
+"""
+from bench.common import make_server, connect_client, send_line, print_table, NullTransport
+from twisted.internet.task import Clock
+from timeit import default_timer
+from time import time
+
+CHANNELS = 2000
+MEMBERS = 500
+CHANNELS_PER_MEMBER = 100  # So every channel ends up with MEMBERS * CHANNELS_PER_MEMBER / CHANNELS members.
+
+
+class SliceClock:
+    """ Holds on to the slices the MaintenanceScheduler schedules, so each one can be run and timed on its own like
+    separate reactor iterations would. """
+    def __init__(self):
+        self.slices = []
+
+    def callLater(self, delay, method):
+        self.slices.append(method)
+
+    def run_slice(self):
+        self.slices.pop(0)()
+
+
+def make_doomed_channels():
+    """ A server full of populated channels which are all due to be deleted by the next sweep. """
+    server = make_server()
+    server.channelmanager.journal = None
+    server.outputflusher.clock = Clock()
+    server.maintenance.clock = SliceClock()
+    for index in range(MEMBERS):
+        client_protocol, _ = connect_client(server, index, "member{}".format(index), NullTransport)
+        for channel_index in range(CHANNELS_PER_MEMBER):
+            send_line(client_protocol, "JOIN #doomed{}".format((index * CHANNELS_PER_MEMBER + channel_index) % CHANNELS))
+    now = time()
+    for channel in server.channels.values():
+        channel.channel_owner = None
+        channel.scheduled_for_deletion = True
+        server.channelmanager.schedule_expiry(channel, now)
+    return server
+
+
+def one_pass():
+    server = make_doomed_channels()
+    manager = server.channelmanager
+    start = default_timer()
+    current_time = time()
+    for channel in manager.pop_due_channels(current_time):
+        manager.expire_channel(channel, current_time)
+    elapsed = default_timer() - start
+    assert not server.channels
+    return elapsed * 1000
+
+
+def sliced():
+    server = make_doomed_channels()
+    clock = server.maintenance.clock
+    finished = []
+    server.channelmanager.channel_maintenance(server.maintenance).addCallback(finished.append)
+    longest = 0
+    slices = 0
+    while not finished:
+        start = default_timer()
+        clock.run_slice()
+        longest = max(longest, default_timer() - start)
+        slices += 1
+    assert not server.channels
+    return longest * 1000, slices
+
+
+if __name__ == '__main__':
+    longest_slice, slices = sliced()
+    print_table(["channels", "one pass ms", "longest slice ms", "slices"],
+                [[CHANNELS, one_pass(), longest_slice, slices]])
@@ -0,0 +1,114 @@
+"""
+Measures how much memory the server holds on to for every idle connection (registered, in no channels) and for every
+channel (with its one member's share of it), as traced by tracemalloc. The fake transports are made before measuring
+so only the server's own objects are counted. The "unslotted" columns are the same server with copies of IRCProtocol,
+IRCUser (and RPLHelper) and IRCChannel which don't declare __slots__, so their attributes are kept in a dict the way
+they used to be, and are kept as a reference.
+
+Usage: python -m bench.memory
+"""
+from bench.common import make_server, send_line, NullTransport, print_table
+from twisted.internet.address import IPv4Address
+from twisted.internet.task import Clock
+from contextlib import contextmanager
+import server.irc_server
+import server.irc_protocol.protocol
+import server.irc_protocol.commands.channel
+import tracemalloc
+import gc
+
+CONNECTIONS = 5000
+CHANNELS = 2000
+
+
+def traced_bytes(method):
+    """ Returns how many bytes were still allocated after calling method, and what it returned. """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = method()
+    gc.collect()
+    kept = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, result
+
+
+def make_transports(count):
+    transports = []
+    for index in range(count):
+        address = IPv4Address("TCP", "10.{}.{}.{}".format((index >> 16) & 255, (index >> 8) & 255, index & 255), 6667)
+        transports.append((address, NullTransport(peerAddress=address)))
+    return transports
+
+
+def connect(server, transports):
+    protocols = []
+    for index, (address, transport) in enumerate(transports):
+        client_protocol = server.buildProtocol(address)
+        client_protocol.makeConnection(transport)
+        send_line(client_protocol, "NICK idle{}".format(index))
+        send_line(client_protocol, "USER idle{} 0 * :idle{}".format(index, index))
+        protocols.append(client_protocol)
+    return protocols
+
+
+def unslotted_copy(cls):
+    """ A copy of the class, and of its slotted bases, with the same methods but without __slots__. """
+    slot_names = set()
+    for name in cls.__dict__.get("__slots__", []):
+        if name.startswith("__") and not name.endswith("__"):  # Name mangled, EG: IRCUser's __nickname.
+            name = "_{}{}".format(cls.__name__.lstrip("_"), name)
+        slot_names.add(name)
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in slot_names and k not in ("__slots__", "__dict__")}
+    bases = tuple(unslotted_copy(x) if "__slots__" in x.__dict__ else x for x in cls.__bases__)
+    return type(cls.__name__, bases, namespace)
+
+
+@contextmanager
+def unslotted():
+    """ Have the server make unslotted IRCProtocols, IRCUsers and IRCChannels while in the block. """
+    patched = [(server.irc_server, "IRCProtocol"), (server.irc_protocol.protocol, "IRCUser"),
+               (server.irc_protocol.commands.channel, "IRCChannel")]
+    originals = [getattr(module, name) for module, name in patched]
+    for (module, name), original in zip(patched, originals):
+        setattr(module, name, unslotted_copy(original))
+    try:
+        yield
+    finally:
+        for (module, name), original in zip(patched, originals):
+            setattr(module, name, original)
+
+
+def make_bench_server():
+    """ The reactor doesn't run here, so the DelayedCalls the outputflusher cancels would pile up in it. """
+    server = make_server()
+    server.outputflusher.clock = Clock()
+    return server
+
+
+def idle_connection_bytes():
+    server = make_bench_server()
+    transports = make_transports(CONNECTIONS)
+    kept, _ = traced_bytes(lambda: connect(server, transports))
+    return kept / CONNECTIONS
+
+
+def channel_bytes():
+    server = make_bench_server()
+    server.channelmanager.journal = None  # The journal queues records until the reactor runs, which it doesn't here.
+    client_protocol = connect(server, make_transports(1))[0]
+
+    def join_channels():
+        for index in range(CHANNELS):
+            send_line(client_protocol, "JOIN #channel{}".format(index))
+    kept, _ = traced_bytes(join_channels)
+    return kept / CHANNELS
+
+
+if __name__ == '__main__':
+    slotted = [idle_connection_bytes(), channel_bytes()]
+    with unslotted():
+        reference = [idle_connection_bytes(), channel_bytes()]
+    print_table(["", "bytes/idle conn", "bytes/channel"], [
+        ["unslotted"] + reference, ["slotted"] + slotted, ["saved"] + [x - y for x, y in zip(reference, slotted)]
+    ])
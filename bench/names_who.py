@@ -0,0 +1,58 @@
+"""
+Measures NAMES and WHO replies against channel size. The "names format" column formats the whole list through
+Twisted's IRC.names for every recipient, which is how NAMES used to be sent, and is kept as a reference; "names cached"
+goes through IRCChannel.send_names, which reuses the channel's encoded chunks. "who at once" builds a tuple per member
+and formats all of them through Twisted's IRC.who in one call, which is how WHO used to be answered; "who longest
+step" is the longest any one step of the streamed reply takes, which is the most a WHO holds everyone else up for.
+
+Usage: python -m bench.names_who
+"""
+from bench.common import make_server, connect_client, send_line, time_per_call, print_table, NullTransport
+from twisted.internet.task import Clock
+from timeit import default_timer
+
+CHANNEL_SIZES = [100, 1000, 10000]
+
+
+def run(channel_size):
+    server = make_server()
+    server.outputflusher.clock = Clock()
+    members = []
+    for index in range(channel_size):
+        client_protocol, _ = connect_client(server, index, "member{}".format(index), NullTransport)
+        send_line(client_protocol, "JOIN #bench")
+        members.append(client_protocol)
+    channel = server.channels["#bench"]
+    requester = members[0]
+    user = requester.user_instance
+    iterations = max(100000 // channel_size, 10)
+
+    def names_format():
+        requester.names(user.nickname, channel.channel_name, channel.get_nicknames())
+        requester.output = []
+
+    def names_cached():
+        channel.send_names(user)
+        requester.output = []
+
+    def who_at_once():
+        member_info = [tuple([x.username, x.hostmask, requester.hostname, x.nickname, x.status, 0, x.realname])
+                       for members in (channel.users, channel.remote_users) for x in members]
+        requester.who(user.nickname, channel.channel_name, member_info)
+        requester.output = []
+
+    longest_step = 0
+    steps = channel.who(user, requester.hostname)
+    while True:
+        start = default_timer()
+        chunk = next(steps, None)
+        longest_step = max(longest_step, default_timer() - start)
+        if chunk is None:
+            break
+    return (channel_size, time_per_call(names_format, iterations), time_per_call(names_cached, iterations),
+            time_per_call(who_at_once, 10) / 1000, longest_step * 1000)
+
+
+if __name__ == '__main__':
+    print_table(["members", "names format us", "names cached us", "who at once ms", "who longest step ms"],
+                [run(x) for x in CHANNEL_SIZES])
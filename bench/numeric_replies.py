@@ -0,0 +1,45 @@
+"""
+Measures what building an encoded numeric reply costs, for a reply with a fixed text and one with a parameter. The
+"format" column formats the server name, numeric and nickname into every reply and then encodes it, which is how
+RPLHelper used to build them, and is kept as a reference. The "template" column goes through RPLHelper, which starts
+from the user's cached head and a pre-encoded tail.
+
+Usage: python -m bench.numeric_replies
+"""
+from bench.common import make_server, connect_client, time_per_call, print_table
+from twisted.words.protocols.irc import ERR_UNKNOWNMODE, ERR_NEEDMOREPARAMS
+
+ITERATIONS = 500000
+
+
+def run():
+    server = make_server()
+    client_protocol, _ = connect_client(server, 0, "bench")
+    user = client_protocol.user_instance
+
+    def format_unknownmode():
+        return (":{} {} {} :Unknown Mode".format(user.server_host, ERR_UNKNOWNMODE, user.nickname) + "\r\n").encode(
+            "utf-8")
+
+    def format_needmoreparams():
+        return (":{} {} {} {} :Not enough parameters".format(
+            user.server_host, ERR_NEEDMOREPARAMS, user.nickname, "PRIVMSG") + "\r\n").encode("utf-8")
+
+    def template_needmoreparams():
+        return user.err_needmoreparams("PRIVMSG")
+
+    assert format_unknownmode() == user.err_unknownmode()
+    assert format_needmoreparams() == template_needmoreparams()
+    rows = []
+    for name, format_method, template_method in [
+        ("err_unknownmode", format_unknownmode, user.err_unknownmode),
+        ("err_needmoreparams", format_needmoreparams, template_needmoreparams),
+    ]:
+        format_time = time_per_call(format_method, ITERATIONS)
+        template_time = time_per_call(template_method, ITERATIONS)
+        rows.append([name, format_time, template_time, format_time / template_time])
+    return rows
+
+
+if __name__ == '__main__':
+    print_table(["reply", "format us", "template us", "speedup"], run())
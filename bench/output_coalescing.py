@@ -0,0 +1,82 @@
+"""
+Measures the cost of delivering channel messages when several members talk during the same reactor iteration. The
+"direct" columns write every line to the transport as it is sent, which is how output used to be written, and are
+kept as a reference. The "coalesced" columns queue lines and let the OutputFlusher write each connection's lines as
+one string at the end of the iteration. Both write into Twisted's own transport buffering, minus the socket. The
+calls columns are how many transport calls each delivered message took; on a TLS connection each is a TLS record.
+
+Usage: python -m bench.output_coalescing
+"""
+from bench.common import make_server, connect_client, time_per_call, print_table
+from twisted.internet.abstract import FileDescriptor
+
+CHANNEL_SIZE = 200
+SENDERS_PER_ITERATION = [1, 5, 20, 50]
+ITERATIONS = 200
+
+
+class CountingTransport(FileDescriptor):
+    """ Twisted's own buffering write path, minus the socket. Counts the calls made into it. """
+    calls = 0
+    connected = 1
+
+    def __init__(self, peerAddress):
+        FileDescriptor.__init__(self)
+        self.peer_address = peerAddress
+
+    def getPeer(self):
+        return self.peer_address
+
+    def getHost(self):
+        return self.peer_address
+
+    def startWriting(self):
+        pass
+
+    def clear(self):
+        self._tempDataBuffer = []
+        self._tempDataLen = 0
+
+    def write(self, data):
+        CountingTransport.calls += 1
+        FileDescriptor.write(self, data)
+
+    def writeSequence(self, data):
+        CountingTransport.calls += 1
+        FileDescriptor.writeSequence(self, data)
+
+
+def run(senders_per_iteration):
+    server = make_server()
+    members = []
+    for index in range(CHANNEL_SIZE):
+        client_protocol, _ = connect_client(server, index, "user{}".format(index), CountingTransport)
+        client_protocol.dataReceived(b"JOIN #bench\r\n")
+        members.append(client_protocol)
+    server.outputflusher.flush()
+    senders = members[:senders_per_iteration]
+    line = b"PRIVMSG #bench :The quick brown fox jumps over the lazy dog\r\n"
+    deliveries = senders_per_iteration * (CHANNEL_SIZE - 1) * ITERATIONS
+
+    def iteration():
+        for sender in senders:
+            sender.dataReceived(line)
+        server.outputflusher.flush()
+        for member in members:  # What the socket would have sent.
+            member.transport.clear()
+
+    def measure():
+        CountingTransport.calls = 0
+        elapsed = time_per_call(iteration, ITERATIONS) * ITERATIONS
+        return elapsed / deliveries, CountingTransport.calls / deliveries
+
+    coalesced_time, coalesced_calls = measure()
+    for member in members:  # Back to writing every line straight to the transport.
+        member.send_encoded_line = member.transport.write
+    direct_time, direct_calls = measure()
+    return senders_per_iteration, direct_time, coalesced_time, direct_calls, coalesced_calls
+
+
+if __name__ == '__main__':
+    print_table(["senders/iter", "direct us/msg", "coalesced us/msg", "direct calls", "coalesced calls"],
+                [run(x) for x in SENDERS_PER_ITERATION])
@@ -0,0 +1,33 @@
+"""
+Measures the cost of a private PRIVMSG and a WHOIS as the number of connected users grows. With the server's
+nickname index both should stay flat instead of growing with the user count.
+
+Usage: python -m bench.privmsg_lookup
+"""
+from bench.common import make_server, connect_client, send_line, time_per_call, print_table
+
+USER_COUNTS = [100, 1000, 10000, 20000]
+ITERATIONS = 5000
+
+
+def run(user_count):
+    server = make_server()
+    sender, sender_transport = connect_client(server, 0, "sender")
+    last_transport = None
+    for index in range(1, user_count):
+        _, last_transport = connect_client(server, index, "user{}".format(index))
+    target = "user{}".format(user_count - 1)  # The last user registered is the worst case for a linear scan.
+
+    def privmsg():
+        send_line(sender, "PRIVMSG {} :hello there".format(target))
+        last_transport.clear()
+
+    def whois():
+        send_line(sender, "WHOIS {}".format(target))
+        sender_transport.clear()
+
+    return user_count, time_per_call(privmsg, ITERATIONS), time_per_call(whois, ITERATIONS)
+
+
+if __name__ == '__main__':
+    print_table(["users", "PRIVMSG (us)", "WHOIS (us)"], [run(x) for x in USER_COUNTS])
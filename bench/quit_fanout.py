@@ -0,0 +1,64 @@
+"""
+Measures what a QUIT costs when the user shares many channels with the same neighbours. The "per channel" columns
+broadcast the QUIT from every channel the user was in, which is how QUITs used to be sent, and are kept as a
+reference. The "neighbours" columns go through IRCProtocol.leave_channels, which sends it once to each neighbour.
+NICK changes are fanned out the same way.
+
+Usage: python -m bench.quit_fanout
+"""
+from bench.common import make_server, connect_client, send_line, print_table, NullTransport
+from server.irc_channel.channel import QuitReason, quit_text
+from twisted.internet.task import Clock
+from timeit import default_timer
+
+NEIGHBOURS = 200
+CHANNEL_COUNTS = [1, 5, 20, 50]
+ITERATIONS = 200
+
+
+def run(channel_count):
+    server = make_server()
+    server.outputflusher.clock = Clock()
+    quitter, _ = connect_client(server, 0, "quitter", NullTransport)
+    neighbours = [connect_client(server, index, "neighbour{}".format(index), NullTransport)[0]
+                  for index in range(1, NEIGHBOURS + 1)]
+    channels = []
+    for index in range(channel_count):
+        channel_name = "#bench{}".format(index)
+        for client_protocol in [quitter] + neighbours:
+            send_line(client_protocol, "JOIN {}".format(channel_name))
+        channels.append(server.channels[channel_name])
+    user = quitter.user_instance
+
+    def rejoin():
+        for channel in channels:
+            channel.users[user] = None
+            user.channels[channel] = None
+        for client_protocol in neighbours:
+            client_protocol.output = []
+
+    def per_channel():
+        text = quit_text(QuitReason.UNSPECIFIED)
+        for channel in list(user.channels):
+            channel.unmap_user(user)
+            channel.broadcast_from(user, text)
+
+    def fan_out():
+        quitter.leave_channels()
+
+    results = []
+    for method in (per_channel, fan_out):
+        elapsed = 0
+        for _ in range(ITERATIONS):
+            rejoin()
+            start = default_timer()
+            method()
+            elapsed += default_timer() - start
+        results.append(sum(len(x.output) for x in neighbours))
+        results.append(elapsed / ITERATIONS * 1e6)
+    return [channel_count] + results
+
+
+if __name__ == '__main__':
+    print_table(["channels", "per channel lines", "per channel us", "neighbours lines", "neighbours us"],
+                [run(x) for x in CHANNEL_COUNTS])
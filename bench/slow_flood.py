@@ -0,0 +1,52 @@
+"""
+Measures what a line from a flooder costs the server in channels of different sizes. The "unlimited" columns are the
+channel without a mode, where every line is written to every other member. The "+S" columns are the channel set +S,
+with the flooder's allowance used up, where the line is refused with one 404 back to the flooder before it's fanned
+out. "writes" is how many lines the server queued for one flood line.
+
+Usage: python -m bench.slow_flood
+"""
+from bench.common import make_server, connect_client, send_line, print_table, time_per_call, NullTransport
+from twisted.internet.task import Clock
+
+MEMBER_COUNTS = [10, 100, 1000, 10000]
+ITERATIONS = 2000
+
+
+class CountingTransport(NullTransport):
+    """ Counts the writes instead of keeping them. """
+    writes = 0
+
+    def write(self, data):
+        CountingTransport.writes += data.count(b"\r\n")
+
+    def writeSequence(self, data):
+        CountingTransport.writes += sum(x.count(b"\r\n") for x in data)
+
+
+def run(member_count):
+    server = make_server()
+    server.outputflusher.clock = Clock()
+    flooder, _ = connect_client(server, 0, "flooder", CountingTransport)
+    send_line(flooder, "JOIN #flood")
+    for index in range(1, member_count):
+        send_line(connect_client(server, index, "member{}".format(index), CountingTransport)[0], "JOIN #flood")
+
+    def flood():
+        send_line(flooder, "PRIVMSG #flood :The quick brown fox jumps over the lazy dog")
+
+    results = [member_count]
+    for mode in (None, "+S 1/3600"):
+        if mode is not None:
+            send_line(flooder, "MODE #flood {}".format(mode))
+            flood()  # Uses up the allowance.
+        CountingTransport.writes = 0
+        flood()
+        results.append(CountingTransport.writes)
+        results.append(time_per_call(flood, ITERATIONS))
+    return results + [results[2] / results[4]]
+
+
+if __name__ == '__main__':
+    print_table(["members", "unlimited writes", "unlimited us", "+S writes", "+S us", "speedup"],
+                [run(x) for x in MEMBER_COUNTS])
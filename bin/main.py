@@ -1,8 +1,15 @@
 from server.irc_config.config import IRCConfig
 from server.irc_server import ChatServer
+from server.irc_bus.hub import WorkerHub
+from server.irc_stats import MetricsResource, COMMAND_SAMPLE_INTERVAL
 from twisted.internet import reactor, task
-from twisted.internet.endpoints import serverFromString
-from os import getcwd, path, getuid
+from twisted.internet.endpoints import serverFromString, UNIXServerEndpoint
+from twisted.internet.protocol import ProcessProtocol
+from twisted.web.server import Site
+from socket import socket, AF_INET, AF_INET6, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, SO_REUSEPORT
+from os import getcwd, path, getuid, environ, pathsep
+from sys import argv, executable
+from tempfile import mkdtemp
 
 import twisted.internet.defer
 
@@ -18,14 +25,24 @@ def setup_loopingcalls(server, server_settings, maintenance_settings):
     if ratelimitclearinterval != 0:
         task.LoopingCall(server.maintenance_ratelimiter).start(ratelimitclearinterval)
 
-    if flushinterval != 0:  # not implemented
+    if flushinterval != 0:
         task.LoopingCall(server.maintenance_flush_server).start(flushinterval)
 
     if channelscaninterval != 0:
         task.LoopingCall(server.maintenance_delete_old_channels).start(channelscaninterval)
 
-    if pinginterval != 0:
-        task.LoopingCall(server.do_pings).start(pinginterval)
+    if pinginterval != 0:  # Clients are pinged as they go idle, the ping manager only needs to tick.
+        task.LoopingCall(server.do_pings).start(server.pingmanager.tick_length)
+
+    task.LoopingCall(server.stats.sample_commands).start(COMMAND_SAMPLE_INTERVAL)
+
+
+def restore_server_state(server):
+    """ Restore the channels saved by previous runs, and make sure queued changes get written before shutdown. """
+    restored_channels = server.restore_state()
+    if server.journal is not None:
+        print("Restored {} channels.".format(restored_channels))
+        reactor.addSystemEventTrigger("before", "shutdown", server.journal.wait_until_idle)
 
 
 def create_endpoints(server, server_settings, ssl_settings):
@@ -46,15 +63,93 @@ def create_endpoints(server, server_settings, ssl_settings):
         else:
             ssl_endpoint = serverFromString(reactor,
                                             "ssl:{}:privateKey={}:certKey={}".format(ssl_port, ssl_key, ssl_cert))
-            ssl_endpoint.listen(server)
+            ssl_endpoint.listen(server).addCallback(server.acceptthrottle.add_port)
             print("SSL Endpoint is now listening on port 6697.")
     if not ssl_only:
         print("Creating endpoint for port '{}', interface '{}'".format(port, interface))
         endpoint = serverFromString(reactor, "tcp:{}:interface={}".format(port, interface))
-        endpoint.listen(server)
+        endpoint.listen(server).addCallback(server.acceptthrottle.add_port)
         print("Endpoint is now listening on port '{}'".format(port))
 
 
+def create_metrics_endpoint(server, server_settings, worker_id=None):
+    """ Serve the server's stats to Prometheus on localhost, if MetricsPort is set. Every worker has its own stats,
+    so each one listens on MetricsPort + its worker number. """
+    metrics_port = server_settings.MetricsPort
+    if metrics_port == 0:
+        return
+    if worker_id is not None:
+        metrics_port += worker_id
+    reactor.listenTCP(metrics_port, Site(MetricsResource(server.stats)), interface="127.0.0.1")
+    print("Metrics are now served on 127.0.0.1:{}".format(metrics_port))
+
+
+def listen_reuseport(factory, port, interface):
+    """ Bind a listening socket with SO_REUSEPORT set and hand it to the reactor. Every worker does this on the same
+    port, and the kernel spreads incoming connections across them. """
+    family = AF_INET6 if ':' in interface else AF_INET
+    listen_socket = socket(family, SOCK_STREAM)
+    listen_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    listen_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+    listen_socket.bind((interface, int(port)))
+    listen_socket.listen(1024)
+    listen_socket.setblocking(False)
+    listening_port = reactor.adoptStreamPort(listen_socket.fileno(), family, factory)
+    listen_socket.close()  # The reactor keeps its own duplicate of the descriptor.
+    return listening_port
+
+
+def create_worker_endpoints(server, server_settings, ssl_settings, worker_id):
+    """ The same as create_endpoints, but for a worker process, which has to share the ports with its siblings. """
+    port = server_settings.Port
+    interface = server_settings.Interface
+    if ssl_settings.SSLEnabled:
+        if ssl_settings.SSLKeyPath is None or ssl_settings.SSLCertPath is None:
+            print("Worker {}: Error constructing SSL Endpoint: Missing key/cert file.".format(worker_id))
+            if ssl_settings.SSLOnly:
+                print("Worker {}: Error: SSLOnly is enabled and no SSL endpoint was created. Terminating.".format(
+                    worker_id))
+                exit()
+        else:
+            from twisted.internet.ssl import DefaultOpenSSLContextFactory
+            from twisted.protocols.tls import TLSMemoryBIOFactory
+            context_factory = DefaultOpenSSLContextFactory(ssl_settings.SSLKeyPath, ssl_settings.SSLCertPath)
+            server.acceptthrottle.add_port(listen_reuseport(TLSMemoryBIOFactory(context_factory, False, server),
+                                                            ssl_settings.SSLPort, interface))
+            print("Worker {}: SSL Endpoint is now listening on port '{}'".format(worker_id, ssl_settings.SSLPort))
+    if not ssl_settings.SSLOnly:
+        server.acceptthrottle.add_port(listen_reuseport(server, port, interface))
+        print("Worker {}: Endpoint is now listening on port '{}'".format(worker_id, port))
+
+
+class WorkerProcessProtocol(ProcessProtocol):
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+
+    def processEnded(self, reason):
+        print("Worker {} exited: {}".format(self.worker_id, reason.value))
+
+
+def start_workers(worker_count):
+    """ Start the hub the workers talk to each other through, then spawn the worker processes. Each worker is this
+    script started again with --worker, and inherits this process' stdout/stderr. """
+    bus_path = path.join(mkdtemp(), "crow-bus.sock")
+    project_root = path.dirname(path.dirname(path.abspath(__file__)))
+    worker_environment = dict(environ, PYTHONUNBUFFERED="1",
+                              PYTHONPATH=pathsep.join(x for x in [project_root, environ.get("PYTHONPATH")] if x))
+
+    def spawn_workers(_):
+        for worker_id in range(worker_count):
+            reactor.spawnProcess(
+                WorkerProcessProtocol(worker_id), executable,
+                [executable, path.abspath(__file__), "--worker", str(worker_id), bus_path],
+                env=worker_environment, childFDs={1: 1, 2: 2}
+            )
+        print("Started {} workers.".format(worker_count))
+
+    UNIXServerEndpoint(reactor, bus_path).listen(WorkerHub()).addCallback(spawn_workers)
+
+
 if __name__ == '__main__':
     if getuid() == 0:  # Prevent from running as root
         print("Error: You can not run this application as root.")
@@ -69,9 +164,27 @@ if __name__ == '__main__':
         for output in config_output:
             print(output)
 
-    server_instance = ChatServer(server_config)
-
-    setup_loopingcalls(server_instance, server_config.ServerSettings, server_config.MaintenanceSettings)
-    create_endpoints(server_instance, server_config.ServerSettings, server_config.SSLSettings)
+    flush_directory = server_config.MaintenanceSettings.FlushDirectory
+    server_config.MaintenanceSettings.FlushDirectory = path.join(path.dirname(ini_path), flush_directory)
+    profile_directory = server_config.ServerSettings.ProfileDirectory
+    server_config.ServerSettings.ProfileDirectory = path.join(path.dirname(ini_path), profile_directory)
+
+    if len(argv) == 4 and argv[1] == "--worker":  # Spawned by start_workers as one of several workers.
+        worker_id = int(argv[2])
+        server_instance = ChatServer(server_config, worker_id)
+        restore_server_state(server_instance)
+        server_instance.bus.connect(argv[3])
+        setup_loopingcalls(server_instance, server_config.ServerSettings, server_config.MaintenanceSettings)
+        create_worker_endpoints(server_instance, server_config.ServerSettings, server_config.SSLSettings, worker_id)
+        create_metrics_endpoint(server_instance, server_config.ServerSettings, worker_id)
+    elif server_config.ServerSettings.Workers > 1:
+        start_workers(server_config.ServerSettings.Workers)
+    else:
+        server_instance = ChatServer(server_config)
+        restore_server_state(server_instance)
+
+        setup_loopingcalls(server_instance, server_config.ServerSettings, server_config.MaintenanceSettings)
+        create_endpoints(server_instance, server_config.ServerSettings, server_config.SSLSettings)
+        create_metrics_endpoint(server_instance, server_config.ServerSettings)
 
     reactor.run()
@@ -0,0 +1,145 @@
+from twisted.internet import reactor
+from server.irc_clientlimiter import address_bits, IPV6_TAG
+from collections import OrderedDict
+from time import monotonic
+
+
+def roll_window(window, index):
+    """ Move a [window index, previous window's count, current window's count] window on to window index. """
+    if window[0] != index:
+        window[1] = window[2] if window[0] == index - 1 else 0
+        window[2] = 0
+        window[0] = index
+
+
+def window_estimate(window, position):
+    """ How many accepts the sliding window ending at position (in windows, eg. 12.25 is a quarter of the way into
+    window 12) holds: all of the current window's, and the part of the previous one's it still overlaps. """
+    return window[1] * (1 - (position - window[0])) + window[2]
+
+
+class AcceptThrottle:
+    """
+    Limits how fast new connections are accepted, so that when tens of thousands of clients reconnect at once, eg.
+    after a restart, the ones already let in can register and join their channels instead of queueing behind
+    everyone else's. There is a limit for the whole server (per worker, when there are several) and one for every
+    subnet, both counted over a sliding window: the count for the current window, plus the previous window's count
+    weighted by how much of it the sliding window still covers.
+    When the server wide rate is reached, the listening ports stop accepting until it drops again, so the rest of
+    the storm waits in the kernel's accept queue without costing the server anything. Connections a port had already
+    accepted by then are let in rather than refused, since sending them away would only have them reconnect into the
+    same storm. A subnet over its own rate has its connections refused. Subnets' windows are kept in order of last
+    use, and ones which are empty again are dropped a few at a time as new ones are made, the same way the
+    RateLimiter's buckets are.
+    Checked by ChatServer.buildProtocol before the ClientLimiter.
+    """
+    sweep_per_insert = 2  # Empty subnet windows dropped whenever a new one is made.
+    resume_headroom = 0.1  # Accepting resumes once the rate has dropped this fraction of the limit under it.
+
+    def __init__(self, rate, subnet_rate, ipv4_subnet, ipv6_subnet, stats, clock=reactor):
+        """
+        Args:
+            rate (tuple): How many connections the server accepts, and over how many seconds, as (calls, seconds).
+            subnet_rate (tuple): The same for each subnet.
+            ipv4_subnet (int): How many leading bits of an IPv4 address make up its subnet.
+            ipv6_subnet (int): The same for IPv6 addresses.
+            stats (ServerStats): Where the throttled connections are counted.
+        """
+        self.calls, self.seconds = rate
+        self.subnet_calls, self.subnet_seconds = subnet_rate
+        self.shifts = {32: 32 - ipv4_subnet, 128: 128 - ipv6_subnet}
+        self.tags = {32: 0, 128: IPV6_TAG}
+        self.stats = stats
+        self.clock = clock
+        self.window = [0, 0, 0]
+        self.subnet_windows = OrderedDict()  # Subnet key -> window
+        self.ports = []  # The listening ports paused while the server wide rate is reached.
+        self.resume_call = None
+        self.paused_at = None
+        stats.add_gauge("accept_throttle_subnets", lambda: len(self.subnet_windows))
+
+    def add_port(self, port):
+        """ Register a listening port to pause. Returns it, so it can be added as a callback to endpoint.listen. """
+        self.ports.append(port)
+        return port
+
+    def allow(self, host):
+        """ Count an accepted connection from the host, and pause accepting if it takes the server over its rate.
+        Returns False if its subnet is over its rate, in which case it should be refused. """
+        now = monotonic()
+        position = now / self.seconds
+        window = self.window
+        roll_window(window, int(position))
+        window[2] += 1
+        if window_estimate(window, position) >= self.calls:
+            self.pause(now)
+        try:
+            value, bits = address_bits(host)
+        except (OSError, TypeError):
+            return True
+        key = self.tags[bits] | value >> self.shifts[bits]
+        position = now / self.subnet_seconds
+        index = int(position)
+        subnet_window = self.subnet_windows.get(key)
+        if subnet_window is None:
+            self.sweep(self.sweep_per_insert, index)
+            subnet_window = self.subnet_windows[key] = [index, 0, 0]
+        else:
+            self.subnet_windows.move_to_end(key)
+            roll_window(subnet_window, index)
+        if window_estimate(subnet_window, position) >= self.subnet_calls:
+            self.stats.increment("accepts_throttled_subnet")
+            return False
+        subnet_window[2] += 1
+        return True
+
+    def sweep(self, limit, index):
+        """ Drop up to `limit` subnet windows which are empty by window index. """
+        subnet_windows = self.subnet_windows
+        dropped = 0
+        while dropped < limit and subnet_windows:
+            key, window = next(iter(subnet_windows.items()))
+            if window[0] >= index - 1:
+                break
+            del subnet_windows[key]
+            dropped += 1
+        return dropped
+
+    def pause(self, now):
+        """ Stop the listening ports accepting until the server wide rate has dropped enough to let some more in. """
+        if self.resume_call is not None or not self.ports:
+            return
+        for port in self.ports:
+            port.stopReading()
+        self.stats.increment("accept_pauses")
+        self.paused_at = now
+        self.resume_call = self.clock.callLater(self.resume_delay(now), self.resume)
+
+    def target(self):
+        """ The sliding window's count at which accepting resumes. """
+        return self.calls - int(self.calls * self.resume_headroom)
+
+    def resume_delay(self, now):
+        """ Seconds until the sliding window drops under the limit, less the headroom. The previous window's weight
+        drops steadily through the current one, and if that isn't enough, the current one's in the next. """
+        target = self.target()
+        position = now / self.seconds
+        window = self.window
+        index = window[0]
+        previous, current = window[1], window[2]
+        if current < target:  # Previous * (1 - fraction) + current < target, within the current window.
+            resume_position = index + 1 - (target - current) / previous
+        else:  # Current * (1 - fraction) < target, within the next window.
+            resume_position = index + 2 - target / current
+        return max(resume_position - position, 0) * self.seconds
+
+    def resume(self):
+        """ Start the ports accepting again. A port accepts as many connections as it can in one go, and more every
+        time it empties its queue, which after a pause would be most of the storm at once; they're let back in at the
+        headroom a batch, so a batch fills the window rather than running past it. """
+        self.resume_call = None
+        self.stats.increment("accept_paused_ms", int((monotonic() - self.paused_at) * 1000))
+        batch = max(self.calls - self.target(), 1)
+        for port in self.ports:
+            port.numberAccepts = batch
+            port.startReading()
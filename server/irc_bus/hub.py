@@ -0,0 +1,200 @@
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+from utils.irc_casemapping import irc_lower
+from json import dumps, loads
+
+
+class WorkerHubProtocol(LineReceiver):
+    """ The hub's end of a connection from one worker process. """
+    delimiter = b"\n"
+    MAX_LENGTH = 1 << 20
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.worker_id = None
+
+    def connectionLost(self, reason=None):
+        self.hub.worker_lost(self)
+
+    def lineReceived(self, line):
+        self.hub.message_received(self, line, loads(line))
+
+    def send_message(self, message):
+        self.sendLine(dumps(message).encode("utf-8"))
+
+
+class WorkerHub(Factory):
+    """
+    Runs in the parent process when Workers > 1 and relays bus messages between the worker processes over a Unix
+    socket. Most messages are forwarded untouched to every other worker, but the hub is the authority on which
+    worker owns a nickname and who created a channel first, and it remembers enough state, down to each channel's
+    mode, owner and operator accounts, to bring a worker which connects late up to date. Nicknames and channel names
+    are remembered by their irc_lower keys.
+    """
+    def __init__(self):
+        self.workers = {}  # worker id -> WorkerHubProtocol
+        self.nick_owners = {}  # nickname key -> worker id
+        self.nick_details = {}  # nickname key -> the last nick message published for it
+        self.nick_channels = {}  # nickname key -> set of channel keys the user is in
+        self.channel_creates = {}  # channel key -> the create message of the worker which created it first
+        self.channel_state = {}  # channel key -> {op: the last mode, owner or op_accounts message published for it}
+        self.owned_channels = {}  # nickname key -> set of channel keys whose last owner message names them
+        self.lost_creates = set()  # (channel key, worker id) of creates which came second, see owner
+        self.handlers = {
+            "hello": self.hello,
+            "nick": self.nick,
+            "user": self.user,
+            "release": self.release,
+            "create": self.create,
+            "mode": self.channel_update,
+            "owner": self.owner,
+            "op_accounts": self.channel_update,
+            "delete": self.delete,
+            "join": self.join,
+            "part": self.part,
+            "channel": self.forward,
+            "neighbours": self.forward,
+            "privmsg": self.privmsg,
+        }
+
+    def buildProtocol(self, addr):
+        return WorkerHubProtocol(self)
+
+    def message_received(self, worker, line, message):
+        self.handlers[message["op"]](worker, line, message)
+
+    def forward(self, sender, line, message=None):
+        for worker in self.workers.values():
+            if worker is not sender:
+                worker.sendLine(line)
+
+    def worker_lost(self, worker):
+        """ Release every nickname the worker owned, which also takes them out of their channels everywhere. """
+        if self.workers.get(worker.worker_id) is worker:
+            del self.workers[worker.worker_id]
+        for nickname in [x for x in self.nick_owners if self.nick_owners[x] == worker.worker_id]:
+            self.release_nickname(nickname)
+            self.forward(worker, dumps({"op": "release", "nick": nickname}).encode("utf-8"))
+
+    def hello(self, worker, line, message):
+        """ Register a worker and replay the current state of its siblings to it. """
+        worker.worker_id = message["worker"]
+        self.workers[worker.worker_id] = worker
+        for create_message in self.channel_creates.values():
+            worker.send_message(create_message)
+        for nickname, nick_message in self.nick_details.items():
+            if self.nick_owners[nickname] != worker.worker_id:
+                worker.send_message(nick_message)
+                for channel_name in self.nick_channels[nickname]:
+                    worker.send_message({"op": "join", "channel": channel_name, "nick": nickname})
+        for state in self.channel_state.values():  # After the nicknames, which the owner messages refer to.
+            for state_message in state.values():
+                worker.send_message(state_message)
+
+    def release_nickname(self, nickname):
+        del self.nick_owners[nickname]
+        del self.nick_details[nickname]
+        self.owned_channels.pop(nickname, None)
+        return self.nick_channels.pop(nickname)
+
+    def nick(self, worker, line, message):
+        nickname = irc_lower(message["nick"])
+        old_nickname = irc_lower(message["old"]) if message["old"] is not None else None
+        owned_old_nickname = self.nick_owners.get(old_nickname) == worker.worker_id
+        if self.nick_owners.get(nickname, worker.worker_id) != worker.worker_id:
+            # The worker already moved its user off the old nickname, so release it before telling it to pick again.
+            if owned_old_nickname:
+                self.release_nickname(old_nickname)
+                self.forward(worker, dumps({"op": "release", "nick": old_nickname}).encode("utf-8"))
+            return worker.send_message({"op": "collision", "nick": message["nick"]})
+        if old_nickname is not None and not owned_old_nickname:
+            # Its user lost the old nickname to a collision and was released, so to the others it's a new user.
+            message["old"] = None
+            line = dumps(message).encode("utf-8")
+        channels = set()
+        owned_channels = set()
+        if owned_old_nickname:
+            owned_channels = self.owned_channels.pop(old_nickname, owned_channels)
+            channels = self.release_nickname(old_nickname)
+        for channel_key in owned_channels:  # So a worker connecting later finds the owner under their new nickname.
+            self.channel_state[channel_key]["owner"]["nick"] = message["nick"]
+        if owned_channels:
+            self.owned_channels[nickname] = owned_channels
+        self.nick_owners[nickname] = worker.worker_id
+        self.nick_details[nickname] = message
+        self.nick_channels[nickname] = channels
+        self.forward(worker, line)
+
+    def user(self, worker, line, message):
+        nickname = irc_lower(message["nick"])
+        if self.nick_owners.get(nickname) == worker.worker_id:
+            self.nick_details[nickname].update(username=message["username"], realname=message["realname"],
+                                               hostmask=message["hostmask"])
+            self.forward(worker, line)
+
+    def release(self, worker, line, message):
+        nickname = irc_lower(message["nick"])
+        if self.nick_owners.get(nickname) == worker.worker_id:
+            self.release_nickname(nickname)
+            self.forward(worker, line)
+
+    def create(self, worker, line, message):
+        """ The first worker to create a channel owns its owner account. A later creator is sent the first one. """
+        channel_key = irc_lower(message["channel"])
+        if channel_key in self.channel_creates:
+            self.lost_creates.add((channel_key, worker.worker_id))
+            return worker.send_message(self.channel_creates[channel_key])
+        self.channel_creates[channel_key] = message
+        self.forward(worker, line)
+
+    def channel_update(self, worker, line, message):
+        self.channel_state.setdefault(irc_lower(message["channel"]), {})[message["op"]] = message
+        self.forward(worker, line)
+
+    def owner(self, worker, line, message):
+        """ Workers send an owner message straight after every create. It's dropped if the create came second, since
+        that worker's owner account is void. """
+        channel_key = irc_lower(message["channel"])
+        if (channel_key, worker.worker_id) in self.lost_creates:
+            return self.lost_creates.discard((channel_key, worker.worker_id))
+        if message["nick"] is not None and self.nick_owners.get(irc_lower(message["nick"])) != worker.worker_id:
+            return  # Sent under a nickname it lost to a collision, it's sent again under the new one.
+        self.disown(channel_key)
+        if message["nick"] is not None:
+            self.owned_channels.setdefault(irc_lower(message["nick"]), set()).add(channel_key)
+        self.channel_update(worker, line, message)
+
+    def disown(self, channel_key):
+        previous = self.channel_state.get(channel_key, {}).get("owner")
+        if previous is not None and previous["nick"] is not None:
+            self.owned_channels.get(irc_lower(previous["nick"]), set()).discard(channel_key)
+
+    def delete(self, worker, line, message):
+        """ Forget the channel, so it can be created afresh, and tell the other workers to delete their copy. """
+        channel_key = irc_lower(message["channel"])
+        self.disown(channel_key)
+        self.channel_creates.pop(channel_key, None)
+        self.channel_state.pop(channel_key, None)
+        for channels in self.nick_channels.values():
+            channels.discard(channel_key)
+        self.forward(worker, line)
+
+    def join(self, worker, line, message):
+        """ Joins and parts are only taken from the worker which owns the nickname. One which lost it to a collision
+        sends its user's joins again once the user has a new nickname. """
+        nickname = irc_lower(message["nick"])
+        if self.nick_owners.get(nickname) == worker.worker_id:
+            self.nick_channels[nickname].add(irc_lower(message["channel"]))
+            self.forward(worker, line)
+
+    def part(self, worker, line, message):
+        nickname = irc_lower(message["nick"])
+        if self.nick_owners.get(nickname) == worker.worker_id:
+            self.nick_channels[nickname].discard(irc_lower(message["channel"]))
+            self.forward(worker, line)
+
+    def privmsg(self, worker, line, message):
+        """ Private messages only go to the worker the target is connected to. """
+        owner = self.workers.get(self.nick_owners.get(irc_lower(message["nick"])))
+        if owner is not None:
+            owner.sendLine(line)
@@ -0,0 +1,55 @@
+from twisted.words.protocols.irc import lowQuote
+from utils.irc_casemapping import irc_lower
+
+
+class RemoteProtocol:
+    """ Stands in for the protocol instance of a user connected to a sibling worker. Anything written to it is
+    routed to that user's worker through the bus. """
+    def __init__(self, bus, remote_user):
+        self.bus = bus
+        self.remote_user = remote_user
+
+    def privmsg(self, sender, recip, message):
+        self.sendLine(":{} PRIVMSG {} :{}".format(sender, recip, lowQuote(message)))
+
+    def sendLine(self, line):
+        self.bus.publish_privmsg(self.remote_user.nickname, line)
+
+    def send_encoded_line(self, line):
+        self.sendLine(line[:-2].decode("utf-8"))
+
+
+class RemoteUser:
+    """
+    Represents a user connected to a sibling worker. Remote users are mapped in the server's nickname index and in
+    the remote_users of the channels they are in, so lookups and NAMES/WHO/WHOIS treat them like local users.
+    """
+    def __init__(self, bus, worker, details):
+        self.protocol = RemoteProtocol(bus, self)
+        self.worker = worker
+        self.nickname = None
+        self.key = None
+        self.username = None
+        self.realname = None
+        self.hostmask = None
+        self.sign_on_time = details["sign_on_time"]
+        self.last_msg_time = details["sign_on_time"]
+        self.channels = {}
+        self.modes = []
+        self.status = "H"
+        self.operator = False
+        self.update(details)
+
+    def update(self, details):
+        """ Update the details from a nick/user bus message. """
+        self.nickname = details["nick"]
+        self.key = irc_lower(self.nickname)
+        self.username = details["username"]
+        self.realname = details["realname"]
+        self.hostmask = details["hostmask"]
+
+    def get_modes(self, accessor_nickname=None, accessor_is_operator=None):
+        return "MODE is not available for users connected to another worker."
+
+    def set_mode(self, mode, accessor_nickname=None, accessor_is_operator=None):
+        return "MODE is not available for users connected to another worker."
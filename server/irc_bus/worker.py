@@ -0,0 +1,297 @@
+from twisted.internet import reactor
+from twisted.internet.endpoints import UNIXClientEndpoint
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+from server.irc_bus.remote_user import RemoteUser
+from server.irc_channel.channel import IRCChannel, encode_line
+from utils.irc_random_nick_generation import generate_random_nick
+from utils.irc_casemapping import irc_lower
+from json import dumps, loads
+
+
+class WorkerBusProtocol(LineReceiver):
+    """ The worker's connection to the hub. Every line is one JSON encoded bus message. """
+    delimiter = b"\n"
+    MAX_LENGTH = 1 << 20
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def connectionMade(self):
+        self.bus.hub_connected(self)
+
+    def connectionLost(self, reason=None):
+        self.bus.hub_disconnected(reason)
+
+    def lineReceived(self, line):
+        self.bus.message_received(loads(line))
+
+
+class WorkerBus:
+    """
+    Keeps one worker process consistent with its siblings when running with Workers > 1. Local nickname, channel
+    creation, mode, owner, operator account, deletion and membership changes are published to the hub (see hub.py),
+    and the changes published by the siblings are applied here: their users are mapped into this worker's nickname
+    index and channels as RemoteUsers, and lines they broadcast to a channel are delivered to this worker's members of
+    it. Nicknames and channel names are sent as they were given, and looked up by their irc_lower keys.
+    """
+    def __init__(self, worker_id, nicknames, channels, channelmanager):
+        self.worker_id = worker_id
+        self.nicknames = nicknames
+        self.channels = channels
+        self.channelmanager = channelmanager
+        self.remote_users = {}  # Nickname key -> RemoteUser, including ones shadowed by a local user in a collision.
+        self.connection = None
+        self.pending = []  # Messages published before the hub connection was made.
+        self.handlers = {
+            "nick": self.remote_nick,
+            "user": self.remote_user_details,
+            "release": self.remote_release,
+            "collision": self.nick_collision,
+            "create": self.remote_create,
+            "join": self.remote_join,
+            "part": self.remote_part,
+            "mode": self.remote_mode,
+            "owner": self.remote_owner,
+            "op_accounts": self.remote_op_accounts,
+            "delete": self.remote_delete,
+            "channel": self.remote_channel_line,
+            "neighbours": self.remote_neighbours_line,
+            "privmsg": self.remote_privmsg,
+        }
+
+    def connect(self, socket_path):
+        return UNIXClientEndpoint(reactor, socket_path).connect(Factory.forProtocol(lambda: WorkerBusProtocol(self)))
+
+    def hub_connected(self, connection):
+        self.connection = connection
+        connection.sendLine(dumps({"op": "hello", "worker": self.worker_id}).encode("utf-8"))
+        for line in self.pending:
+            connection.sendLine(line)
+        self.pending = []
+
+    def hub_disconnected(self, reason):
+        """ Without the hub this worker can't stay consistent with the others, and the hub only goes away when the
+        parent process does, so stop the worker. """
+        print("Worker {}: Lost the connection to the hub, stopping.".format(self.worker_id))
+        self.connection = None
+        if reactor.running:
+            reactor.stop()
+
+    def publish(self, message):
+        line = dumps(message).encode("utf-8")
+        if self.connection is None:
+            self.pending.append(line)
+        else:
+            self.connection.sendLine(line)
+
+    def message_received(self, message):
+        self.handlers[message["op"]](message)
+
+    # Publishing local changes.
+    @staticmethod
+    def user_details(user):
+        return {"nick": user.nickname, "username": user.username, "realname": user.realname,
+                "hostmask": user.hostmask, "sign_on_time": user.sign_on_time}
+
+    def publish_nick(self, user, old_nickname):
+        message = self.user_details(user)
+        message["op"] = "nick"
+        message["old"] = old_nickname
+        message["worker"] = self.worker_id
+        self.publish(message)
+
+    def publish_user(self, user):
+        message = self.user_details(user)
+        message["op"] = "user"
+        self.publish(message)
+
+    def publish_release(self, nickname):
+        self.publish({"op": "release", "nick": nickname})
+
+    def publish_create(self, channel):
+        self.publish({"op": "create", "channel": channel.channel_name, "account": channel.channel_owner_account,
+                      "last_owner_login": channel.last_owner_login})
+
+    def publish_join(self, channel, user):
+        self.publish({"op": "join", "channel": channel.channel_name, "nick": user.nickname})
+
+    def publish_part(self, channel, user):
+        self.publish({"op": "part", "channel": channel.channel_name, "nick": user.nickname})
+
+    def publish_mode(self, channel):
+        slow_flood = channel.slow_flood
+        self.publish({"op": "mode", "channel": channel.channel_name,
+                      "slow_flood": None if slow_flood is None else list(slow_flood)})
+
+    def publish_owner(self, channel):
+        """ The channel's owner logged in or left. Siblings hold off expiring it while the owner is logged in. """
+        owner = channel.channel_owner
+        self.publish({"op": "owner", "channel": channel.channel_name,
+                      "nick": None if owner is None else owner.nickname, "last_owner_login": channel.last_owner_login})
+
+    def publish_op_accounts(self, channel, op_accounts):
+        self.publish({"op": "op_accounts", "channel": channel.channel_name, "op_accounts": op_accounts})
+
+    def publish_delete(self, channel):
+        self.publish({"op": "delete", "channel": channel.channel_name})
+
+    def publish_channel_line(self, channel, line):
+        self.publish({"op": "channel", "channel": channel.channel_name, "line": line})
+
+    def publish_neighbours_line(self, channel_names, line):
+        self.publish({"op": "neighbours", "channels": channel_names, "line": line})
+
+    def publish_privmsg(self, nickname, line):
+        self.publish({"op": "privmsg", "nick": nickname, "line": line})
+
+    # Applying changes published by sibling workers.
+    def index_remote_user(self, remote_user):
+        """ Map a remote user into the nickname index unless a local user is (temporarily) holding the nickname. """
+        if isinstance(self.nicknames.get(remote_user.key, remote_user), RemoteUser):
+            self.nicknames[remote_user.key] = remote_user
+
+    def unindex_nickname(self, key):
+        if isinstance(self.nicknames.get(key), RemoteUser):
+            del self.nicknames[key]
+
+    def remote_nick(self, message):
+        old_key = irc_lower(message["old"]) if message["old"] is not None else None
+        remote_user = self.remote_users.pop(old_key, None)
+        if remote_user is None:
+            remote_user = RemoteUser(self, message["worker"], message)
+        else:
+            self.unindex_nickname(old_key)
+            remote_user.update(message)
+            for channel in remote_user.channels:
+                channel.nicknames = None
+        self.remote_users[remote_user.key] = remote_user
+        self.index_remote_user(remote_user)
+
+    def remote_user_details(self, message):
+        remote_user = self.remote_users.get(irc_lower(message["nick"]))
+        if remote_user is not None:
+            remote_user.update(message)
+
+    def remote_release(self, message):
+        remote_user = self.remote_users.pop(irc_lower(message["nick"]), None)
+        if remote_user is not None:
+            self.unindex_nickname(remote_user.key)
+            for channel in list(remote_user.channels):
+                channel.remove_remote_user(remote_user)
+
+    def nick_collision(self, message):
+        """ A sibling claimed the nickname first. Give the local user a random nickname, the same way a client
+        which keeps picking nicknames in use gets one. The hub released the user along with the nickname, so the
+        siblings are told about it as a new user, with its channels and the ones it's logged in as the owner of. """
+        nickname = message["nick"]
+        key = irc_lower(nickname)
+        user = self.nicknames.get(key)
+        if user is None or isinstance(user, RemoteUser):
+            return
+        random_nickname = generate_random_nick(user.protocol, self.nicknames, user.illegal_characters, user.nick_length)
+        user.notice("***Nickname {} was claimed on another server worker first.***".format(nickname))
+        results = user.set_nickname(random_nickname, self.nicknames)
+        if results is not None:
+            user.protocol.sendLine(results)
+        for channel in user.channels:
+            self.publish_join(channel, user)
+            if channel.channel_owner is user:
+                self.publish_owner(channel)
+        if key in self.remote_users:
+            self.index_remote_user(self.remote_users[key])
+
+    def remote_create(self, message):
+        """ A sibling created a channel. If this worker created it at the same time, the sibling's owner account wins
+        since the hub saw it first, and whoever was logged in here as the owner is logged out. """
+        channel_name = message["channel"]
+        channel = self.channels.get(irc_lower(channel_name))
+        if channel is None:
+            channel = IRCChannel(channel_name, self.channelmanager, self)
+            self.channels[channel.key] = channel
+        elif channel.channel_owner_account == message["account"]:  # Already known, eg. restored from the journal.
+            return
+        elif channel.channel_owner is not None:
+            channel.channel_owner.notice("***{} already existed on another server worker. The owner account details"
+                                         " you were sent are void.***".format(channel_name))
+            channel.channel_owner = None
+        channel.channel_owner_account = message["account"]
+        channel.last_owner_login = message["last_owner_login"]
+        self.channelmanager.schedule_expiry(channel)
+        channel.journal_create()
+
+    def remote_join(self, message):
+        remote_user = self.remote_users.get(irc_lower(message["nick"]))
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if remote_user is not None and channel is not None:
+            channel.add_remote_user(remote_user)
+
+    def remote_part(self, message):
+        remote_user = self.remote_users.get(irc_lower(message["nick"]))
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if remote_user is not None and channel is not None:
+            channel.remove_remote_user(remote_user)
+
+    def remote_mode(self, message):
+        """ A sibling's channel owner changed the channel's mode. Their MODE line comes separately, as a channel line,
+        and the slow flood limit is kept by every worker for its own members. """
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if channel is not None:
+            slow_flood = message["slow_flood"]
+            channel.set_slow_flood(None if slow_flood is None else tuple(slow_flood))
+            channel.journal_update(modes=list(channel.channel_modes), slow_flood=slow_flood)
+
+    def remote_owner(self, message):
+        """ A sibling's user logged in as the channel's owner, or the owner left. A remote owner stands in as the
+        channel_owner here, which keeps the channel from expiring and anyone else from logging in as the owner. """
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if channel is None:
+            return
+        nickname = message["nick"]
+        channel.channel_owner = None if nickname is None else self.remote_users.get(irc_lower(nickname))
+        channel.last_owner_login = message["last_owner_login"]
+        if channel.channel_owner is not None:
+            channel.scheduled_for_deletion = False
+        channel.journal_update(last_owner_login=channel.last_owner_login,
+                               scheduled_for_deletion=channel.scheduled_for_deletion)
+        self.channelmanager.schedule_expiry(channel)
+
+    def remote_op_accounts(self, message):
+        """ A sibling's channel owner changed the operator accounts. Whoever is logged in here to an account which
+        is still there stays logged in. """
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if channel is None:
+            return
+        current_users = {name: x["current_user"] for name, x in channel.op_accounts.items()}
+        channel.op_accounts = {
+            name: {"current_user": current_users.get(name), "password": x["password"], "permissions": x["permissions"]}
+            for name, x in message["op_accounts"].items()
+        }
+        channel.journal_op_accounts(publish=False)
+
+    def remote_delete(self, message):
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if channel is not None and not channel.deleted:
+            self.channelmanager.delete_channel(channel, publish=False)
+
+    def remote_channel_line(self, message):
+        channel = self.channels.get(irc_lower(message["channel"]))
+        if channel is not None:
+            channel.deliver_encoded_line(encode_line(message["line"]))
+
+    def remote_neighbours_line(self, message):
+        """ A line from a sibling's user to everyone in any of a list of channels, which each of this worker's members
+        of them is sent once. """
+        members = {}
+        for channel_name in message["channels"]:
+            channel = self.channels.get(irc_lower(channel_name))
+            if channel is not None:
+                members.update(channel.users)
+        line = encode_line(message["line"])
+        for user in members:
+            user.protocol.send_encoded_line(line)
+
+    def remote_privmsg(self, message):
+        user = self.nicknames.get(irc_lower(message["nick"]))
+        if user is not None and not isinstance(user, RemoteUser):
+            user.protocol.sendLine(message["line"])
@@ -2,19 +2,66 @@
 from .decorators import *
 from .op_account_mgt_methods import *
 from utils.irc_quitreason_enum import QuitReason
-from time import time
+from utils.irc_casemapping import irc_lower
+from twisted.words.protocols.irc import lowQuote, RPL_NAMREPLY, RPL_WHOREPLY
+from time import time, monotonic
+
+WHO_LINES_PER_CHUNK = 100  # WHO replies are streamed this many lines at a time.
+
+
+def encode_line(line):
+    """ Terminate and encode a line the same way IRC.sendLine does, so it can be written to any number of members
+    without being formatted again. """
+    return (line + "\r\n").encode("utf-8")
+
+
+def parse_rate(text):
+    """ A lines/seconds mode argument, EG: 5/10, as a (lines, seconds) tuple, or None if it isn't one. """
+    lines, _, seconds = text.partition("/")
+    if not (lines.isdigit() and seconds.isdigit()) or int(lines) < 1 or int(seconds) < 1:
+        return None
+    return int(lines), int(seconds)
+
+
+def quit_text(reason, leave_message=None, timeout_seconds=None):
+    """ The text of the QUIT line sent after a user's prefix when they leave the server, which is the same in every
+    channel they were in. """
+    if reason.value == QuitReason.DISCONNECTED.value:
+        if leave_message is None:
+            leave_message = "User Quit Network."
+    elif reason.value == QuitReason.TIMEOUT.value and timeout_seconds is not None:
+        leave_message = timeout_seconds
+    else:
+        leave_message = "Unspecified Reason."
+    return reason.value.format(leave_message)
 
 
 class IRCChannel:
-    """ Represent channels on the server and implement methods for handling them and participants. """
+    """ Represent channels on the server and implement methods for handling them and participants. Slotted, and the
+    permission lists which are the same for every channel are class attributes. """
     # ToDo: A lot of these can be combined into one property I think.
-    def __init__(self, name, channelmanager):
+    op_default_perms = ("ban", "kick", "mute")
+    valid_perms = ("ban", "kick", "mute", "topic", "motd")  # bad, but will do for now.
+    valid_modes = ("S",)
+    __slots__ = ["channel_name", "key", "encoded_name", "channel_owner", "last_owner_login", "scheduled_for_deletion",
+                 "deleted", "expiry_deadline", "users", "nicknames", "names_chunks", "remote_users", "bus",
+                 "op_accounts", "channel_modes", "slow_flood", "flood_interval", "channel_owner_account",
+                 "channel_manager"]
+
+    def __init__(self, name, channelmanager, bus=None):
         self.channel_name = name
+        self.key = irc_lower(name)  # What the server's channels are keyed by.
+        self.encoded_name = name.encode("utf-8")
         self.channel_owner = None
         self.last_owner_login = None
         self.scheduled_for_deletion = False
+        self.expiry_deadline = None  # When the ChannelManager's next sweep is due to look at it, if ever.
         self.deleted = False
-        self.users = []
+        self.users = {}  # The participating IRCUsers, in order of joining -> their slow flood allowance (see +S).
+        self.nicknames = None  # Cached result of get_nicknames, reset whenever someone joins, leaves or is renamed.
+        self.names_chunks = None  # The nicknames encoded for 353 lines, made again whenever the nicknames are.
+        self.remote_users = {}  # RemoteUsers in the channel who are connected to sibling workers.
+        self.bus = bus  # The WorkerBus when running with more than one worker, otherwise None.
 
         """
         Op_Accounts = {
@@ -26,10 +73,10 @@ class IRCChannel:
             }
         """
         self.op_accounts = {}
-        self.op_default_perms = ["ban", "kick", "mute"]
-        self.valid_perms = ["ban", "kick", "mute", "topic", "motd"]  # bad, but will do for now.
 
         self.channel_modes = []
+        self.slow_flood = None  # (lines, seconds) each member can send while the channel is +S, otherwise None.
+        self.flood_interval = None  # Seconds a member's line takes to be allowed again, seconds / lines.
         self.channel_owner_account = []
         self.channel_manager = channelmanager
 
@@ -48,39 +95,117 @@ class IRCChannel:
         if user in self.users:
             return
 
-        user.protocol.join(user.hostmask, self.channel_name)
-        user.channels.append(self)
-        self.users.append(user)
-        join_rpl = ":{} JOIN :{}".format(user.hostmask, self.channel_name)
-        [x.protocol.sendLine(join_rpl) for x in self.users if x is not user]
+        user.channels[self] = None
+        self.users[user] = None
+        self.nicknames = None
+        if self.bus is not None:
+            self.bus.publish_join(self, user)
+        self.broadcast_from(user, " JOIN :" + self.channel_name)  # Including to the user, as their JOIN's reply.
         self.send_names(user)
 
     def remove_user(self, user, leave_message, reason=QuitReason.UNSPECIFIED, timeout_seconds=None):
-        """ Unmap a user instance from the channel and broadcast the reason. """
+        """ Unmap a user instance from the channel and broadcast the reason. A user leaving the server is taken out of
+        all their channels at once by IRCProtocol.leave_channels instead, so their QUIT is only sent once to each
+        neighbour. """
+        if user not in self.users:
+            return
         if reason.value == QuitReason.LEFT.value:
             if leave_message is None:
                 leave_message = "{} :User Left Channel.".format(self.channel_name)
             else:
                 leave_message = "{} :{}".format(self.channel_name, leave_message)
-        elif reason.value == QuitReason.DISCONNECTED.value:
-            if leave_message is None:
-                leave_message = "User Quit Network."
-        elif reason.value == QuitReason.TIMEOUT.value and timeout_seconds is not None:
-            leave_message = timeout_seconds
+            text = reason.value.format(leave_message)
         else:
-            leave_message = "Unspecified Reason."
+            text = quit_text(reason, leave_message, timeout_seconds)
+        self.unmap_user(user)
+        self.broadcast_from(user, text)
+
+    def unmap_user(self, user):
+        """ Take a user out of the channel without telling anyone. """
         if user is self.channel_owner:
             self.channel_owner = None
             self.last_owner_login = time()  # So it won't be deleted if the owner logged in 7 days ago and never
             # logged out, thus never resetting the last owner login time to something that would prevent deletion.
+            self.journal_update(last_owner_login=self.last_owner_login)
+            self.channel_manager.schedule_expiry(self)
+            if self.bus is not None:
+                self.bus.publish_owner(self)
 
-        self.users.remove(user)
-        self.broadcast_line(reason.value.format(user.hostmask, leave_message))
-        user.channels.remove(self)
+        del self.users[user]
+        self.nicknames = None
+        if self.bus is not None:
+            self.bus.publish_part(self, user)
+        del user.channels[self]
 
     def get_nicknames(self):
-        """ Get all the nicknames of the currently participating users in the channel. """
-        return [x.nickname for x in self.users]
+        """ Get all the nicknames of the currently participating users in the channel. The list is cached until the
+        membership or someone's nickname changes, so don't modify it. """
+        if self.nicknames is None:
+            self.nicknames = [x.nickname for x in self.users] + [x.nickname for x in self.remote_users]
+            self.names_chunks = None
+        return self.nicknames
+
+    def get_names_chunks(self, user):
+        """ The nicknames in the channel, encoded and joined into chunks which fit in a 353 line to any user on this
+        server, each ending with the line's terminator. Cached along with get_nicknames. """
+        nicknames = self.get_nicknames()
+        if self.names_chunks is None:
+            head_length = len(":{} {} ".format(user.server_host, RPL_NAMREPLY)) + user.nick_length + len(" = :")
+            limit = 510 - head_length - len(self.encoded_name)
+            chunks = []
+            chunk = []
+            chunk_length = 0  # The length of the chunk's nicknames joined together, plus one.
+            for nickname in nicknames:
+                encoded_nickname = nickname.encode("utf-8")
+                if chunk and chunk_length + len(encoded_nickname) > limit:
+                    chunks.append(b" ".join(chunk) + b"\r\n")
+                    chunk = []
+                    chunk_length = 0
+                chunk.append(encoded_nickname)
+                chunk_length += len(encoded_nickname) + 1
+            if chunk:
+                chunks.append(b" ".join(chunk) + b"\r\n")
+            self.names_chunks = chunks
+        return self.names_chunks
+
+    def add_remote_user(self, remote_user):
+        """ Map a user from a sibling worker to the channel. Their JOIN line is delivered separately by the bus. """
+        self.remote_users[remote_user] = None
+        remote_user.channels[self] = None
+        self.nicknames = None
+
+    def remove_remote_user(self, remote_user):
+        if remote_user in self.remote_users:
+            del self.remote_users[remote_user]
+            del remote_user.channels[self]
+            self.nicknames = None
+            if remote_user is self.channel_owner:  # Their worker went away without saying they left.
+                self.channel_owner = None
+                self.channel_manager.schedule_expiry(self)
+
+    def journal_create(self):
+        """ Record the creation of the channel in the server journal, if the server details are being saved. """
+        journal = self.channel_manager.journal
+        if journal is not None:
+            journal.record("create", self.channel_name, account=list(self.channel_owner_account),
+                           last_owner_login=self.last_owner_login)
+
+    def journal_update(self, **fields):
+        """ Record a change to the channel's saved details in the server journal. Values must be fresh copies. """
+        journal = self.channel_manager.journal
+        if journal is not None:
+            journal.record("update", self.channel_name, **fields)
+
+    def journal_op_accounts(self, publish=True):
+        """ Record the operator accounts after a change, and share them with the sibling workers unless the change
+        came from one. """
+        op_accounts = {
+            name: {"password": x["password"], "permissions": list(x["permissions"])}
+            for name, x in self.op_accounts.items()
+        }
+        self.journal_update(op_accounts=op_accounts)
+        if publish and self.bus is not None:
+            self.bus.publish_op_accounts(self, op_accounts)
 
     @authorization_required(requires_channel_owner=True)
     def get_operator(self, caller, name=None):
@@ -88,75 +213,183 @@ class IRCChannel:
 
     @authorization_required(requires_channel_owner=True)
     def add_operator(self, caller, name):
-        return add_operator(self, caller, name)
+        output = add_operator(self, caller, name)
+        self.journal_op_accounts()
+        return output
 
     @authorization_required(requires_channel_owner=True)
     def delete_operator(self, caller, name):
-        return delete_operator(self, caller, name)
+        output = delete_operator(self, caller, name)
+        self.journal_op_accounts()
+        return output
 
     @authorization_required(requires_channel_owner=True)
     def set_operator_name(self, caller, name, new_name):
-        return set_operator_name(self, caller, name, new_name)
+        output = set_operator_name(self, caller, name, new_name)
+        self.journal_op_accounts()
+        return output
 
     @authorization_required(requires_channel_owner=True)
     def set_operator_password(self, caller, name, new_password):
-        return set_operator_password(self, caller, name, new_password)
+        output = set_operator_password(self, caller, name, new_password)
+        self.journal_op_accounts()
+        return output
 
     def who(self, user, server_host):
-        """ Return information about the channel to the caller. Used for WHO commands. """
-        if user.nickname not in self.get_nicknames():
-            return user.rplhelper.err_notonchannel("You must be on the channel to perform a /who")
-        return [tuple([x.username, x.hostmask, server_host, x.nickname, x.status, 0, x.realname]) for x in self.users]
+        """ Return information about the channel to the caller. Used for WHO commands. The reply is returned as an
+        iterator of encoded chunks of lines for IRCProtocol.stream_reply, or an error reply if the caller can't see
+        it. """
+        if user not in self.users:
+            return user.err_notonchannel(self.channel_name, "You must be on the channel to perform a /who")
+        return self.who_chunks(user, server_host, list(self.users) + list(self.remote_users))
+
+    def who_chunks(self, user, server_host, members):
+        """ The lines are only made as each chunk is asked for, from the members as they were when the WHO arrived. """
+        head = ":{} {} {} {} ".format(server_host, RPL_WHOREPLY, user.nickname, self.channel_name)
+        for start in range(0, len(members), WHO_LINES_PER_CHUNK):
+            yield "".join([
+                "{}{} {} {} {} {} :0 {}\r\n".format(
+                    head, x.username, x.hostmask, server_host, x.nickname, x.status, x.realname)
+                for x in members[start:start + WHO_LINES_PER_CHUNK]
+            ]).encode("utf-8")
+        yield user.rpl_endofwho(self.channel_name)
 
     def login_owner(self, name, password, user):
         """
         Attempt to map a user as an owner. If the channel currently has someone set as an owner/the person
         issuing the command isn't in the channel, return error.
         """
-        if user.nickname not in self.get_nicknames():
-            return user.rplhelper.err_noprivileges("You must be on the channel to login as the owner.")
+        if user not in self.users:
+            return user.err_noprivileges("You must be on the channel to login as the owner.")
         elif name != self.channel_owner_account[0] or password != self.channel_owner_account[1]:
-            return user.rplhelper.err_passwordmismatch()
+            return user.err_passwordmismatch()
         elif self.channel_owner is not None:
-            return user.rplhelper.err_noprivileges("Channel already has an acting owner.")
+            return user.err_noprivileges("Channel already has an acting owner.")
         else:
             self.channel_owner = user
             self.last_owner_login = int(time())
             if self.scheduled_for_deletion:
                 pass  # ToDo: Tell everyone channel will not be deleted.
             self.scheduled_for_deletion = False
+            self.journal_update(last_owner_login=self.last_owner_login, scheduled_for_deletion=False)
+            self.channel_manager.schedule_expiry(self)  # Not due again until the owner leaves.
+            if self.bus is not None:
+                self.bus.publish_owner(self)
             return "You have logged in as the channel owner of {}".format(self.channel_name)
 
     def send_names(self, user):
-        """ Sends the nicknames of users currently participating in the channel to the target user. """
-        user.protocol.names(user.nickname, self.channel_name, self.get_nicknames())
+        """ Sends the nicknames of users currently participating in the channel to the target user. Only the head of
+        each line is made for them, the nicknames come from get_names_chunks. """
+        protocol = user.protocol
+        head = user.reply_head(RPL_NAMREPLY) + b" = " + self.encoded_name + b" :"
+        for chunk in self.get_names_chunks(user):
+            protocol.send_encoded_line(head + chunk)
+        protocol.send_encoded_line(user.rpl_endofnames(self.channel_name))
+
+    def rename_user(self, user):
+        """ When a user is renamed, update the names list. The NICK line is sent once to each of the user's neighbours
+        by IRCUser.broadcast_to_neighbours, rather than by every channel they're in. """
+        self.nicknames = None
 
-    def rename_user(self, user, new_nick):
-        """ When a user is renamed, update the names list and send a notice to everyone in the channel. """
-        for user_ in self.users:
-            if user_.protocol is not user:
-                user_.protocol.sendLine(":{} NICK {}".format(user.hostmask, new_nick))
+    def get_modes(self, user):
+        """ The channel's modes and their arguments, for MODE #channel. Anyone can look them up. """
+        arguments = ["{}/{}".format(*self.slow_flood)] if self.slow_flood is not None else []
+        return user.rpl_channelmodeis(self.channel_name, "".join(self.channel_modes), arguments)
 
-    def get_modes(self):
-        return "getting channel modes not implemented"  # ToDo
+    @authorization_required(requires_channel_owner=True)
+    def set_mode(self, caller, mode, argument=None):
+        """ Handle a request from the channel owner to change the channel's mode. The only one so far is 'S' (slow
+        flood): +S limits how many lines each member can send to the channel, given as lines/seconds or the server's
+        SlowFloodRate if it isn't, and -S lifts the limit. The change is announced to the channel like any MODE. """
+        if mode is None or len(mode) != 2 or mode[1] not in self.valid_modes:
+            return caller.err_unknownmode()
+        if mode[0] == '-':
+            if self.slow_flood is None:
+                return
+            rate = None
+            text = " MODE {} -S".format(self.channel_name)
+        else:
+            rate = self.channel_manager.slow_flood_rate if argument is None else parse_rate(argument)
+            if rate is None:
+                return caller.err_invalidmodeparam(self.channel_name, "S", argument or "*",
+                                                   "The slow flood rate must be lines/seconds, EG: 5/10")
+            text = " MODE {} +S {}/{}".format(self.channel_name, *rate)
+        self.set_slow_flood(rate)
+        self.journal_update(modes=list(self.channel_modes), slow_flood=None if rate is None else list(rate))
+        if self.bus is not None:
+            self.bus.publish_mode(self)
+        self.broadcast_from(caller, text)
 
-    def set_mode(self):
-        return "setting channel modes not implemented"  # ToDo
+    def set_slow_flood(self, rate):
+        """ Set +S with a (lines, seconds) rate, or take it off with None. Members' allowances are kept either way;
+        ones left over from an earlier +S are long since full again by the next one. """
+        self.slow_flood = rate
+        if rate is None:
+            self.flood_interval = None
+            if "S" in self.channel_modes:
+                self.channel_modes.remove("S")
+        else:
+            self.flood_interval = rate[1] / rate[0]
+            if "S" not in self.channel_modes:
+                self.channel_modes.append("S")
+
+    def consume_line(self, user):
+        """
+        Take a line from a member's slow flood allowance, before the line is fanned out to the channel. Returns 0 if
+        they can send it, otherwise how many seconds until they can.
+        The allowance is a token bucket of `lines` tokens refilling over `seconds`, kept as one number: the time it
+        will be full again, which each line pushes back by flood_interval. A line is allowed while that's no more than
+        `seconds` away. It's the member's value in users, so it goes when they leave; None is a full bucket.
+        """
+        if self.slow_flood is None:
+            return 0
+        now = monotonic()
+        full_at = self.users[user]
+        if full_at is None or full_at < now:
+            full_at = now
+        wait = full_at - now + self.flood_interval - self.slow_flood[1]
+        if wait > 0:
+            return wait
+        self.users[user] = full_at + self.flood_interval
+        return 0
 
     def delete_channel(self):
         self.channel_manager.delete_channel(self)
 
     def broadcast_message(self, message, sender):
-        for user in self.users:
-            if user.hostmask != sender:
-                user.protocol.privmsg(sender, self.channel_name, message)
+        """ Send a PRIVMSG from the sender (an IRCUser) to everyone else in the channel. """
+        line = b"".join((
+            sender.prefix, b" PRIVMSG ", self.encoded_name, b" :", lowQuote(message).encode("utf-8"), b"\r\n"
+        ))
+        self.deliver_encoded_line(line, sender)
+        if self.remote_users:
+            self.bus.publish_channel_line(self, line[:-2].decode("utf-8"))
+
+    def broadcast_from(self, user, text, exclude=None):
+        """ Send a line on behalf of a user to everyone in the channel, optionally skipping one user. The line is the
+        user's cached prefix followed by text, so their hostmask isn't formatted into it again. """
+        line = user.prefix + text.encode("utf-8") + b"\r\n"
+        self.deliver_encoded_line(line, exclude)
+        if self.remote_users:
+            self.bus.publish_channel_line(self, line[:-2].decode("utf-8"))
 
-    def broadcast_line(self, line):
+    def broadcast_line(self, line, exclude=None):
+        """ Send a line to everyone in the channel, optionally skipping one user. The line is only encoded once. """
+        self.deliver_encoded_line(encode_line(line), exclude)
+        if self.remote_users:
+            self.bus.publish_channel_line(self, line)
+
+    def deliver_encoded_line(self, line, exclude=None):
+        """ Write an encoded line to the members connected to this worker. """
         for user in self.users:
-            user.protocol.sendLine(line)
+            if user is not exclude:
+                user.protocol.send_encoded_line(line)
 
     def broadcast_notice(self, notice):
-        for user in self.users:
-            notice_line = ":{} NOTICE {} :{}".format(user.hostmask, self.channel_name, notice)
-            user.protocol.sendLine(notice_line)
+        """ Send a NOTICE from the server to the members connected to this worker, encoded once for all of them. Every
+        worker sweeps its own copy of the channel, so it isn't published to the siblings. """
+        if not self.users:
+            return
+        server_host = next(iter(self.users)).server_host
+        self.deliver_encoded_line(encode_line(":{} NOTICE {} :{}".format(server_host, self.channel_name, notice)))
 
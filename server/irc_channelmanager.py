@@ -1,34 +1,136 @@
+from server.irc_channel.channel import IRCChannel
+from heapq import heappush, heappop, heapify
 from time import time
 
+DAY = 86400
+WARNING_DAYS = 3  # Channels are warned on every sweep once they have fewer than this many days left.
+
 
 class ChannelManager:
     """ Used to delete old channels on the server, delete channels in general, and prevent the creation of further
-    channels for a given host. Also, warn channels that are approaching their expiration date."""
-    def __init__(self, channels, channel_ultimatum):
+    channels for a given host. Also, warn channels that are approaching their expiration date.
+    Channels without an owner logged in are kept in a heap of (deadline, channel key), by the time the next sweep
+    has something to do with them: warn them, schedule them for deletion or delete them. A sweep only pops the
+    channels which are due, rather than looking at every channel. Whenever a channel's last_owner_login or owner
+    changes, schedule_expiry pushes its new deadline; the old entry is left in the heap, and skipped when popped since
+    it no longer matches the channel's expiry_deadline. """
+    def __init__(self, channels, channel_ultimatum, journal=None, slow_flood_rate=None):
         self.channels = channels
         self.ultimatum = channel_ultimatum
+        self.journal = journal  # ChannelJournal, or None if the server details are not being saved.
+        self.slow_flood_rate = slow_flood_rate  # The (lines, seconds) a channel set +S without an argument gets.
+        self.expiry_heap = []  # (deadline, channel key)
+
+    def restore_channels(self, bus=None):
+        """ Recreate the channels saved in the journal. Nobody is logged in as the owner or an operator of them. """
+        for channel_name, details in self.journal.load().items():
+            channel = IRCChannel(channel_name, self, bus)
+            channel.channel_owner_account = details["account"]
+            channel.last_owner_login = details["last_owner_login"]
+            channel.scheduled_for_deletion = details["scheduled_for_deletion"]
+            channel.channel_modes = details["modes"]
+            if details.get("slow_flood") is not None:  # Not in details saved before +S existed.
+                channel.set_slow_flood(tuple(details["slow_flood"]))
+            channel.op_accounts = {
+                name: {"current_user": None, "password": x["password"], "permissions": x["permissions"]}
+                for name, x in details["op_accounts"].items()
+            }
+            self.channels[channel.key] = channel
+            self.schedule_expiry(channel)
+            if bus is not None:
+                bus.publish_create(channel)
+                bus.publish_owner(channel)
+        return len(self.channels)
+
+    def schedule_expiry(self, channel, now=None):
+        """ Work out when the channel is next due for a sweep and push it onto the expiry heap. Channels with an owner
+        logged in aren't due until the owner leaves, and channels which are overdue or scheduled for deletion are due
+        at the next sweep. """
+        if channel.channel_owner is not None or channel.last_owner_login is None:
+            channel.expiry_deadline = None
+            return
+        if now is None:
+            now = time()
+        elapsed_days = int((now - channel.last_owner_login) / DAY)
+        time_remaining = self.ultimatum - elapsed_days
+        if channel.scheduled_for_deletion or time_remaining <= 0:
+            deadline = now
+        elif time_remaining >= WARNING_DAYS:  # Nothing happens until the first warning.
+            deadline = channel.last_owner_login + (self.ultimatum - WARNING_DAYS + 1) * DAY
+        else:  # Warned again, or scheduled for deletion, once another day has passed.
+            deadline = channel.last_owner_login + (elapsed_days + 1) * DAY
+        channel.expiry_deadline = deadline
+        heappush(self.expiry_heap, (deadline, channel.key))
+        if len(self.expiry_heap) > 2 * len(self.channels) + 64:  # Mostly stale entries, drop them.
+            self.compact_expiry_heap()
+
+    def compact_expiry_heap(self):
+        channels = self.channels
+        self.expiry_heap = [
+            (deadline, channel_key) for deadline, channel_key in self.expiry_heap
+            if channel_key in channels and channels[channel_key].expiry_deadline == deadline
+        ]
+        heapify(self.expiry_heap)
+
+    def pop_due_channels(self, now):
+        """ Pop every channel whose deadline has passed, skipping stale entries. The channels are left without a
+        deadline until they've been handled, so that one set by the owner logging in or out in the meantime shows. """
+        due = {}
+        expiry_heap = self.expiry_heap
+        while expiry_heap and expiry_heap[0][0] <= now:
+            deadline, channel_key = heappop(expiry_heap)
+            channel = self.channels.get(channel_key)
+            if channel is not None and channel.expiry_deadline == deadline:
+                channel.expiry_deadline = None
+                due[channel_key] = channel
+        return list(due.values())
+
+    def channel_maintenance(self, scheduler):
+        """ Warn, schedule for deletion or delete the channels which are due, one channel per step of a job run by the
+        MaintenanceScheduler. Returns the job's Deferred. """
+        current_time = time()
+        due_channels = self.pop_due_channels(current_time)
+        return scheduler.run("channel_expiry", self.expire_channels(due_channels, current_time), len(due_channels))
+
+    def expire_channels(self, due_channels, current_time):
+        """ Handle one of the due channels per step. """
+        for channel in due_channels:
+            self.expire_channel(channel, current_time)
+            yield
+
+    def expire_channel(self, channel, current_time):
+        """ A channel scheduled for deletion during a sweep is due again straight away, but only deleted by the next
+        one, so the owner has until then to log in. Every channel is popped before any is handled, which also means
+        none are deleted while being iterated. """
+        if channel.deleted or channel.expiry_deadline is not None or channel.channel_owner is not None:
+            return  # The owner logged in or out since, and schedule_expiry was called again.
+        if channel.scheduled_for_deletion:
+            return self.delete_channel(channel)
+        time_elapsed = int((current_time - channel.last_owner_login) / DAY)  # how many days since the last login
+        time_remaining = self.ultimatum - time_elapsed
+        if time_remaining <= 0:
+            channel.broadcast_notice("ALERT - Channel is now scheduled for deletion!")
+            channel.broadcast_notice("Deletion will be cancelled if owner logs in before next sweep.")
+            channel.scheduled_for_deletion = True
+            channel.journal_update(scheduled_for_deletion=True)
+        elif time_remaining < WARNING_DAYS:
+            channel.broadcast_notice("ALERT - Channel will be scheduled for deletion in {}"
+                                     " days if owner does not login.".format(time_remaining))
+        self.schedule_expiry(channel, current_time)
 
-    def channel_maintenance(self):
-        for _channel in self.channels:
-            channel = self.channels[_channel]
-            current_time = int(time())
-            time_elapsed = int((current_time - channel.last_owner_login) / 86400)  # how many days since the last login
-            time_remaining = self.ultimatum - time_elapsed
-            if channel.channel_owner is None:
-                if channel.scheduled_for_deletion:
-                    self.delete_channel(channel)
-                else:
-                    if time_remaining <= 0:
-                        channel.broadcast_notice("ALERT - Channel is now scheduled for deletion!")
-                        channel.broadcast_notice("Deletion will be cancelled if owner logs in before next sweep.")
-                        channel.scheduled_for_deletion = True
-                    elif time_remaining < 3:
-                        channel.broadcast_notice("ALERT - Channel will be scheduled for deletion in {}"
-                                                 " days if owner does not login.".format(time_remaining))
-
-    def delete_channel(self, channel):
+    def delete_channel(self, channel, publish=True):
+        """ Part everyone from the channel and forget it. With several workers, the siblings delete their copy too,
+        unless the deletion came from one of them. """
         channel.deleted = True  # Prevent anyone from joining while the deletion process occurs
+        channel.expiry_deadline = None
         for user in channel.users:
-            user.channels.remove(channel)
-            user.protocol.sendLine(":{} PART {} :Channel was deleted.".format(user.hostmask, channel.channel_name))
-        del self.channels[channel.channel_name]  # Unmap it from main channel dictionary
+            del user.channels[channel]
+            user.protocol.send_encoded_line(
+                user.prefix + " PART {} :Channel was deleted.\r\n".format(channel.channel_name).encode("utf-8"))
+        for remote_user in channel.remote_users:
+            del remote_user.channels[channel]
+        del self.channels[channel.key]  # Unmap it from main channel dictionary
+        if self.journal is not None:
+            self.journal.record("delete", channel.channel_name)
+        if publish and channel.bus is not None:
+            channel.bus.publish_delete(channel)
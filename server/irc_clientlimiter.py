@@ -1,23 +1,87 @@
+from socket import inet_pton, AF_INET, AF_INET6
+
+IPV6_TAG = 1 << 128  # Set in the keys of IPv6 prefixes, so they never equal the key of an IPv4 one.
+IPV4_MAPPED = bytes(10) + b"\xff\xff"  # The first 12 bytes of an IPv4 address mapped into IPv6, eg. ::ffff:1.2.3.4
+
+
+def address_bits(host):
+    """ An address as an integer and how many bits it has. IPv4 addresses mapped into IPv6 count as IPv4. """
+    if ":" in host:
+        packed = inet_pton(AF_INET6, host.split("%", 1)[0])  # Without any zone, eg. fe80::1%eth0
+        if packed[:12] == IPV4_MAPPED:
+            return int.from_bytes(packed[12:], "big"), 32
+        return int.from_bytes(packed, "big"), 128
+    return int.from_bytes(inet_pton(AF_INET, host), "big"), 32
+
+
 class ClientLimiter:
-    def __init__(self):
-        """ For every host connected to the server, associate a value representing how many connections they have. """
-        self.client_hosts = {}
+    """
+    Counts the connections from every network prefix, and refuses new ones from a prefix which already has the most
+    it's allowed. Addresses are counted by their first ipv4_prefix or ipv6_prefix bits rather than as exact hosts,
+    so someone handed a whole IPv6 /64 can't get around the limit by picking a new address for every connection.
+    Exemptions give particular networks, eg. a shared NAT or a bouncer, a higher limit of their own, or none. The most
+    specific exemption covering an address applies to its prefix. They're kept by prefix length, so finding it takes
+    one lookup per distinct length, longest first, and they're only looked at once a prefix reaches max_clients.
+    Checked by ChatServer.buildProtocol before a protocol is built for the connection.
+    """
+    def __init__(self, max_clients, ipv4_prefix=32, ipv6_prefix=64, exemptions=()):
+        """
+        Args:
+            max_clients (int): How many connections a prefix can have.
+            ipv4_prefix (int): How many bits of an IPv4 address make up the prefix it's counted under.
+            ipv6_prefix (int): The same for IPv6 addresses.
+            exemptions (list): (IPv4Network or IPv6Network, limit) tuples. A limit of None means no limit, and a
+            limit below max_clients has no effect.
+        """
+        self.max_clients = max_clients
+        self.shifts = {32: 32 - ipv4_prefix, 128: 128 - ipv6_prefix}
+        self.tags = {32: 0, 128: IPV6_TAG}
+        self.client_prefixes = {}  # Prefix key -> how many connections it has.
+        self.exemptions = {}  # (address bits, prefix length) -> {network as an integer, shifted: limit}
+        for network, limit in exemptions:
+            bits = network.max_prefixlen
+            self.exemptions.setdefault((bits, network.prefixlen), {})[
+                int(network.network_address) >> (bits - network.prefixlen)] = limit
+        self.exemption_lengths = sorted(self.exemptions, key=lambda x: x[1], reverse=True)
 
-    def add_entry(self, host):
-        if host not in self.client_hosts:
-            self.client_hosts[host] = 1
-        else:
-            self.client_hosts[host] += 1
+    def prefix_key(self, host):
+        value, bits = address_bits(host)
+        return self.tags[bits] | value >> self.shifts[bits]
 
-    def remove_entry(self, host):
-        if host in self.client_hosts:
-            if self.client_hosts[host] == 1:
-                del self.client_hosts[host]
-            else:
-                self.client_hosts[host] -= 1
-
-    def host_has_too_many_clients(self, host, max_clients):
-        if host in self.client_hosts and self.client_hosts[host] > max_clients:
+    def limit_for(self, host):
+        """ The limit for the prefix host is counted under, or None if there isn't one. """
+        value, bits = address_bits(host)
+        for exemption_bits, length in self.exemption_lengths:
+            if exemption_bits == bits:
+                networks = self.exemptions[(bits, length)]
+                network = value >> (bits - length)
+                if network in networks:
+                    return networks[network]
+        return self.max_clients
+
+    def add_entry(self, host):
+        """ Count a new connection from the host. Returns False, without counting it, if its prefix is at its limit.
+        Hosts which aren't IP addresses aren't limited. """
+        try:
+            key = self.prefix_key(host)
+        except (OSError, TypeError):
             return True
-        return False
+        count = self.client_prefixes.get(key, 0)
+        if count >= self.max_clients:
+            limit = self.limit_for(host)
+            if limit is not None and count >= limit:
+                return False
+        self.client_prefixes[key] = count + 1
+        return True
 
+    def remove_entry(self, host):
+        """ Stop counting a connection counted by add_entry. """
+        try:
+            key = self.prefix_key(host)
+        except (OSError, TypeError):
+            return
+        count = self.client_prefixes.get(key)
+        if count == 1:
+            del self.client_prefixes[key]
+        elif count is not None:
+            self.client_prefixes[key] = count - 1
@@ -37,6 +37,26 @@ class IRCConfig(SentryConfig):
             criteria=None,
             description=ServerWelcomeDescription
         )
+        CommandCategories = SentryOption(
+            default="connection,channel,user,oper,channel_accounts",
+            criteria=CommandCategoriesCriteria,
+            description=CommandCategoriesDescription
+        )
+        Workers = SentryOption(
+            default=1,
+            criteria=[IntRequired, WorkersCriteria],
+            description=WorkersDescription
+        )
+        MetricsPort = SentryOption(
+            default=0,
+            criteria=IntRequired,
+            description=MetricsPortDescription
+        )
+        ProfileDirectory = SentryOption(
+            default="crow_profiles",
+            criteria=StringRequired,
+            description=ProfileDirectoryDescription
+        )
 
     class MaintenanceSettings(SentrySection):
         RateLimitClearInterval = SentryOption(
@@ -49,6 +69,11 @@ class IRCConfig(SentryConfig):
             criteria=IntRequired,
             description=FlushIntervalDescription
         )
+        FlushDirectory = SentryOption(
+            default="crow_data",
+            criteria=StringRequired,
+            description=FlushDirectoryDescription
+        )
         ChannelScanInterval = SentryOption(
             default=1,
             criteria=IntRequired,
@@ -59,6 +84,11 @@ class IRCConfig(SentryConfig):
             criteria=IntRequired,
             description=ChannelUltimatumDescription
         )
+        MaintenanceSliceBudget = SentryOption(
+            default=5,
+            criteria=IntRequired,
+            description=MaintenanceSliceBudgetDescription
+        )
 
     class UserSettings(SentrySection):
         MaxUsernameLength = SentryOption(
@@ -76,12 +106,79 @@ class IRCConfig(SentryConfig):
             criteria=[IntRequired, MaxClientsCriteria],
             description=MaxClientsDescription
         )
+        IPv4ClientPrefix = SentryOption(
+            default=32,
+            criteria=[IntRequired, IPv4PrefixCriteria],
+            description=IPv4ClientPrefixDescription
+        )
+        IPv6ClientPrefix = SentryOption(
+            default=64,
+            criteria=[IntRequired, IPv6PrefixCriteria],
+            description=IPv6ClientPrefixDescription
+        )
+        ClientLimitExemptions = SentryOption(
+            default="",
+            criteria=ClientLimitExemptionsCriteria,
+            description=ClientLimitExemptionsDescription
+        )
+        AcceptRate = SentryOption(
+            default="500/1",
+            criteria=RateLimitCriteria,
+            description=AcceptRateDescription
+        )
+        SubnetAcceptRate = SentryOption(
+            default="50/10",
+            criteria=RateLimitCriteria,
+            description=SubnetAcceptRateDescription
+        )
+        IPv4AcceptSubnet = SentryOption(
+            default=24,
+            criteria=[IntRequired, IPv4PrefixCriteria],
+            description=IPv4AcceptSubnetDescription
+        )
+        IPv6AcceptSubnet = SentryOption(
+            default=48,
+            criteria=[IntRequired, IPv6PrefixCriteria],
+            description=IPv6AcceptSubnetDescription
+        )
+        SlowFloodRate = SentryOption(
+            default="5/10",
+            criteria=RateLimitCriteria,
+            description=SlowFloodRateDescription
+        )
+        SendQ = SentryOption(
+            default=262144,
+            criteria=[IntRequired, SendQCriteria],
+            description=SendQDescription
+        )
+        OperatorSendQ = SentryOption(
+            default=1048576,
+            criteria=[IntRequired, SendQCriteria],
+            description=OperatorSendQDescription
+        )
         Operators = SentryOption(
             default={"Admin": "Password", "Admin2": "Password2"},
             criteria=None,
             description=OperatorsDescription
         )
 
+    class RateLimitSettings(SentrySection):
+        OPER = SentryOption(
+            default="3/30",
+            criteria=RateLimitCriteria,
+            description=OPERRateLimitDescription
+        )
+        CHOPER = SentryOption(
+            default="2/10",
+            criteria=RateLimitCriteria,
+            description=CHOPERRateLimitDescription
+        )
+        CHOWNER = SentryOption(
+            default="3/30",
+            criteria=RateLimitCriteria,
+            description=CHOWNERRateLimitDescription
+        )
+
     class SSLSettings(SentrySection):
         SSLEnabled = SentryOption(
             default=False,
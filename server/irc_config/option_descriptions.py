@@ -15,7 +15,8 @@ PortDescription = "This is the port the server will listen on. Common IRC ports
 InterfaceDescription = "What network interface to bind to. 127.0.0.1 is localhost. " \
                        "To listen on all interfaces, use 0.0.0."
 
-PingIntervalDescription = "How often clients connected to the server should be pinged, in minutes. " \
+PingIntervalDescription = "How long a client may go without sending anything before it is pinged, in minutes. " \
+                          "A pinged client which stays silent for another interval is timed out. " \
                           "Default value is 3. If set to 0, clients will not be pinged. (they won't be timed out.)"
 
 ServerNameDescription = "The name communicated to the client on initial connection."
@@ -26,17 +27,37 @@ ServerDescriptionDescription = "Describes the server. At the moment it is only u
 ServerWelcomeDescription = "The welcome message echoed to the client on initial connection. " \
                 "The client's nickname is appended to the end of it."
 
+CommandCategoriesDescription = "Which categories of commands the server loads, separated by commas. " \
+                               "Valid categories are connection, channel, user, oper and channel_accounts. " \
+                               "The connection commands (NICK, USER, QUIT...) are always loaded."
+
+WorkersDescription = "How many worker processes to run. Each worker has its own reactor and listens on the same " \
+                     "port through SO_REUSEPORT (Linux only), and the workers keep their users and channels " \
+                     "consistent through a local Unix socket. Default value is 1, which runs everything in one process."
+
+MetricsPortDescription = "The port to serve the server's stats on in the Prometheus text format, over HTTP on " \
+                         "127.0.0.1 only. With several workers, each worker serves its own stats on this port + its " \
+                         "worker number. Default value is 0, which disables it. Operators can see the same stats " \
+                         "with STATS."
+
+ProfileDirectoryDescription = "The directory the profiles operators take with PROFILE are dumped to. Relative paths " \
+                              "are relative to the directory crow.ini is in."
+
 
 # MaintenanceSettings option descriptions
 RateLimitClearIntervalDescription = "How much time in minutes to wait before clearing old entries in the " \
-                                    "rate limiter dictionary. Default is every 5 minutes. If set to 0, then " \
-                                    "ratelimiter entries will not be removed. (not recommended)"
+                                    "rate limiter. Default is every 5 minutes. Old entries are also cleared a few at " \
+                                    "a time as new ones are made, so if set to 0, the last few entries from before " \
+                                    "the server went quiet will just stay around until then."
 
-FlushIntervalDescription = "(Not Implemented)FlushInterval: How much time in hours to wait before flushing " \
-                           "current server details (current channels + their opers, owner, modes, and banlists) + " \
-                           "the server's own banlist. The default value is 1 hour. " \
+FlushIntervalDescription = "How much time in hours to wait before compacting the saved server details " \
+                           "(current channels + their opers, owner and modes) into a new snapshot. Changes are " \
+                           "journaled as they happen in between. The default value is 1 hour. " \
                            "If set to 0, these will not be saved."
 
+FlushDirectoryDescription = "The directory the saved server details (snapshot + journal) are kept in. Relative " \
+                            "paths are relative to the directory crow.ini is in. They are restored on startup."
+
 ChannelScanIntervalDescription = "How many days to wait before running the old channel scan. " \
                                  "Default value is 1. If the interval is 0, then old channels will not be removed."
 
@@ -52,13 +73,50 @@ ChannelUltimatumDescription = "(If ChannelScanInterval is 0, this value will not
                               "Also, once a channel is slated for deletion on the next scan, if an owner logs in " \
                               "before the scan occurs, then the channel will be saved."
 
+MaintenanceSliceBudgetDescription = "How many milliseconds of bulk maintenance work (channel expiry, rate limiter " \
+                                    "sweeps) to do at a time before handling clients again. Default value is 5."
+
 
 # UserSettings option descriptions
 MaxUsernameLengthDescription = "The maximum amount of characters a username can be."
 
 MaxNicknameLengthDescription = "The maximum amount of characters a nickname can be."
 
-MaxClientsDescription = "How many clients a host can have connected at the same time."
+MaxClientsDescription = "How many clients a host can have connected at the same time. Hosts are counted by their " \
+                        "network prefix, see IPv4ClientPrefix and IPv6ClientPrefix."
+
+IPv4ClientPrefixDescription = "How many leading bits of an IPv4 address are counted as one host for MaxClients. " \
+                              "Default value is 32, every address on its own."
+
+IPv6ClientPrefixDescription = "How many leading bits of an IPv6 address are counted as one host for MaxClients. " \
+                              "Default value is 64, since a single user is usually given a whole /64."
+
+ClientLimitExemptionsDescription = "Networks which get a higher MaxClients of their own, or none. Separate each " \
+                                   "network with a comma, and give it a limit with =, " \
+                                   "EG: 127.0.0.1/32, 10.0.0.0/8=50. Default is none."
+
+AcceptRateDescription = "How many new connections the server accepts, and over how many seconds, EG: 500/1. Once " \
+                        "it's reached, the rest wait to be accepted until the rate drops. With more than one worker, " \
+                        "every worker has this limit of its own. Default value is 500/1."
+
+SubnetAcceptRateDescription = "How many new connections a subnet can make, and over how many seconds. Connections " \
+                              "over the rate are refused. Default value is 50/10."
+
+IPv4AcceptSubnetDescription = "How many leading bits of an IPv4 address make up its subnet for SubnetAcceptRate. " \
+                              "Default value is 24."
+
+IPv6AcceptSubnetDescription = "How many leading bits of an IPv6 address make up its subnet for SubnetAcceptRate. " \
+                              "Default value is 48."
+
+SlowFloodRateDescription = "How many lines each member of a channel set +S (slow flood) can send to it, and over " \
+                           "how many seconds, when the channel owner doesn't give a rate of their own. " \
+                           "Default value is 5/10."
+
+SendQDescription = "How many bytes can be waiting to be sent to a client which isn't reading fast enough, on top " \
+                   "of what the connection itself buffers, before it is disconnected with 'SendQ exceeded'. " \
+                   "Default is 262144 (256 KiB)."
+
+OperatorSendQDescription = "The same as SendQ, for clients logged in as an IRC operator. Default is 1048576 (1 MiB)."
 
 OperatorsDescription = "A list of operator usernames and their associated passwords. " \
                        "Separate each username:password pair with a comma. " \
@@ -66,6 +124,14 @@ OperatorsDescription = "A list of operator usernames and their associated passwo
                        "that previous username will have it's password value replaced " \
                        "by the subsequent username's associated password."
 
+# RateLimitSettings option descriptions
+OPERRateLimitDescription = "How many OPER attempts a host can make, and over how many seconds. " \
+                           "EG: 3/30 allows 3 attempts at once, and then one more every 10 seconds. Default is 3/30."
+
+CHOPERRateLimitDescription = "How many CHOPER attempts a host can make, and over how many seconds. Default is 2/10."
+
+CHOWNERRateLimitDescription = "How many CHOWNER attempts a host can make, and over how many seconds. Default is 3/30."
+
 # SSLSettings option descriptions
 SSLEnabledDescription = "Attempt to use SSL on the given SSL port. Must set the keypath and certpath options."
 SSLPortDescription = "What port to use for SSL. The default port of 6697 should suffice. Other valid SSL ports are " \
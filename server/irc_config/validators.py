@@ -1,5 +1,7 @@
 from sentry_config.criteria import *
 from os import path
+from ipaddress import ip_network
+from server.irc_protocol.command_manager import COMMAND_CATEGORIES
 
 """
 This module contains the criteria checks for options in the config file.
@@ -30,6 +32,88 @@ class MaxClientsCriteria(SentryCriteria):
             return "The max clients per user can not be 0."
 
 
+class IPv4PrefixCriteria(SentryCriteria):
+    def criteria(self, value):
+        if value < 0 or value > 32:
+            return "An IPv4 prefix length must be between 0 and 32."
+
+
+class IPv6PrefixCriteria(SentryCriteria):
+    def criteria(self, value):
+        if value < 0 or value > 128:
+            return "An IPv6 prefix length must be between 0 and 128."
+
+
+class ClientLimitExemptionsCriteria(SentryCriteria):
+    @property
+    def required_type(self):
+
+        def exemption_list_maker(value):
+            exemptions = []
+            for exemption in [x.strip() for x in value.split(',') if x.strip() != ""]:
+                network, _, limit = exemption.partition("=")
+                exemptions.append((ip_network(network.strip(), strict=False), int(limit) if limit else None))
+            return exemptions
+
+        return exemption_list_maker
+
+    @property
+    def type_error_message(self):
+        return "This option must be a comma separated list of networks, each optionally followed by its own client " \
+               "limit EG: option = 127.0.0.1/32, 10.0.0.0/8=50, 2001:db8::/32=20"
+
+    def criteria(self, value):
+        if any(limit is not None and limit < 1 for network, limit in value):
+            return "An exempted network's client limit must be at least 1."
+
+
+class SendQCriteria(SentryCriteria):
+    def criteria(self, value):
+        if value < 512:
+            return "The SendQ can not be less than 512 bytes, the length of a single IRC line."
+
+
+class WorkersCriteria(SentryCriteria):
+    def criteria(self, value):
+        if value < 1:
+            return "The server needs at least 1 worker."
+
+
+class CommandCategoriesCriteria(SentryCriteria):
+    @property
+    def required_type(self):
+
+        def category_list_maker(value):
+            return [x.strip().lower() for x in value.split(',') if x.strip() != ""]
+
+        return category_list_maker
+
+    def criteria(self, value):
+        unknown_categories = [x for x in value if x not in COMMAND_CATEGORIES]
+        if len(unknown_categories) != 0:
+            return "Unknown command categories: {}. Valid categories are: {}".format(
+                ", ".join(unknown_categories), ", ".join(COMMAND_CATEGORIES))
+
+
+class RateLimitCriteria(SentryCriteria):
+    @property
+    def required_type(self):
+
+        def rate_limit_maker(value):
+            calls, seconds = value.split("/")
+            return int(calls), int(seconds)
+
+        return rate_limit_maker
+
+    @property
+    def type_error_message(self):
+        return "This option must be a number of calls and a number of seconds EG: option = 3/30"
+
+    def criteria(self, value):
+        if value[0] < 1 or value[1] < 1:
+            return "The number of calls and the number of seconds must both be at least 1."
+
+
 class SSLFilePathCriteria(SentryCriteria):
     def criteria(self, value):
         if not path.exists(value):
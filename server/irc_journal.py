@@ -0,0 +1,156 @@
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+from collections import deque
+from functools import partial
+from json import dumps, loads, dump, load
+from os import path, makedirs, listdir, replace, remove, fsync
+
+
+def apply_record(state, record):
+    """ Apply one journal record to a state dict (channel name -> persistent channel details). """
+    operation = record["op"]
+    channel_name = record["channel"]
+    if operation == "create":
+        state[channel_name] = {
+            "account": record["account"],
+            "last_owner_login": record["last_owner_login"],
+            "scheduled_for_deletion": False,
+            "op_accounts": {},
+            "modes": [],
+            "slow_flood": None
+        }
+    elif operation == "delete":
+        state.pop(channel_name, None)
+    elif channel_name in state:  # update
+        state[channel_name].update(record["fields"])
+
+
+class ChannelJournal:
+    """
+    Persists channel state (owner accounts, op accounts, last owner login, modes) as an append-only journal of
+    changes plus periodic compacted snapshots, all inside one directory:
+        snapshot.json: {"generation": g, "channels": {...}} - the state before journal generation g.
+        journal.<g>.log: one JSON record per line.
+    Records are only queued on the reactor thread. Writing them, and dumping snapshots, is done in the reactor's
+    threadpool one job at a time, and the writer applies every record it writes to its own copy of the state, so a
+    snapshot never has to walk the live channels.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot_path = path.join(directory, "snapshot.json")
+        self.generation = 0
+        self.state = {}  # Only touched by the writer once the journal has been loaded.
+        self.pending_records = []
+        self.jobs = deque()
+        self.writing = False
+        self.idle_waiters = []
+
+    def journal_path(self, generation):
+        return path.join(self.directory, "journal.{}.log".format(generation))
+
+    def journal_generations(self):
+        generations = []
+        for file_name in listdir(self.directory):
+            if file_name.startswith("journal.") and file_name.endswith(".log"):
+                generations.append(int(file_name.split(".")[1]))
+        return sorted(generations)
+
+    def load(self):
+        """ Load the last snapshot and replay the journal tail over it. Returns the restored state. Called once on
+        startup, before the reactor runs. """
+        makedirs(self.directory, exist_ok=True)
+        state = {}
+        generation = 0
+        if path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as snapshot_file:
+                snapshot = load(snapshot_file)
+            state = snapshot["channels"]
+            generation = snapshot["generation"]
+        journal_generations = self.journal_generations()
+        for journal_generation in journal_generations:
+            if journal_generation < generation:
+                continue
+            with open(self.journal_path(journal_generation)) as journal_file:
+                for line in journal_file:
+                    try:
+                        record = loads(line)
+                    except ValueError:  # A record torn by a crash, nothing valid can follow it.
+                        break
+                    apply_record(state, record)
+        self.state = state
+        # Never append to a journal which may end with a torn record.
+        self.generation = max(journal_generations + [generation - 1]) + 1
+        return state
+
+    def record(self, operation, channel_name, **fields):
+        """ Queue a change. Every value passed in must be a fresh copy, since it is serialized later on another
+        thread. """
+        if operation == "update":
+            self.pending_records.append({"op": operation, "channel": channel_name, "fields": fields})
+        else:
+            fields["op"] = operation
+            fields["channel"] = channel_name
+            self.pending_records.append(fields)
+        self.run_jobs()
+
+    def snapshot(self):
+        """ Start a new journal generation and write a compacted snapshot of everything before it. """
+        self.queue_pending_records()
+        self.generation += 1
+        self.jobs.append(partial(self.write_snapshot, self.generation))
+        self.run_jobs()
+
+    def wait_until_idle(self):
+        """ Returns a Deferred which fires once everything queued so far is on disk. Used on shutdown. """
+        self.run_jobs()
+        if not self.writing:
+            return None
+        waiter = Deferred()
+        self.idle_waiters.append(waiter)
+        return waiter
+
+    def queue_pending_records(self):
+        if self.pending_records:
+            self.jobs.append(partial(self.append_records, self.generation, self.pending_records))
+            self.pending_records = []
+
+    def run_jobs(self):
+        """ Start the next job if none is running. Records queued while a job runs are batched into one write. """
+        if self.writing:
+            return
+        if not self.jobs:
+            self.queue_pending_records()
+            if not self.jobs:
+                for waiter in self.idle_waiters:
+                    waiter.callback(None)
+                self.idle_waiters = []
+                return
+        self.writing = True
+        deferred = deferToThread(self.jobs.popleft())
+        deferred.addErrback(lambda failure: print("Error writing the channel journal: {}".format(failure.value)))
+        deferred.addBoth(self.job_done)
+
+    def job_done(self, _):
+        self.writing = False
+        reactor.callLater(0, self.run_jobs)
+
+    # These run in the threadpool.
+    def append_records(self, generation, records):
+        with open(self.journal_path(generation), "a") as journal_file:
+            journal_file.write("".join(dumps(x, separators=(",", ":")) + "\n" for x in records))
+            journal_file.flush()
+            fsync(journal_file.fileno())
+        for record in records:
+            apply_record(self.state, record)
+
+    def write_snapshot(self, generation):
+        temporary_path = self.snapshot_path + ".tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            dump({"generation": generation, "channels": self.state}, snapshot_file, separators=(",", ":"))
+            snapshot_file.flush()
+            fsync(snapshot_file.fileno())
+        replace(temporary_path, self.snapshot_path)
+        for journal_generation in self.journal_generations():
+            if journal_generation < generation:
+                remove(self.journal_path(journal_generation))
@@ -1,38 +1,102 @@
-from time import time
-from copy import copy
-from random import choice
+from time import monotonic
+from random import choice, uniform
 from string import ascii_uppercase, ascii_lowercase, digits
 
+# Indexes into a connection's entry.
+SLOT, DEADLINE, LAST_SEEN, PING_TOKEN, PING_TIME = range(5)
+
 
 class PingManager:
-    def __init__(self, users):
-        self.users = users
-        self.ping_queue = {}
+    """
+    Tracks the liveness of every connection with a hashed timing wheel. Each connection has a deadline: while it is
+    idle, the time it should be pinged, and while a PING is outstanding, the time it times out. The wheel has one slot
+    per tick, and a deadline goes in the slot for the tick it falls in, so ping_users only looks at the slots which
+    came due since it last ran instead of every connection.
+    Inbound traffic only updates the connection's last seen time. Deadlines are checked against it lazily when their
+    slot comes up, so clients which keep talking are never pinged.
+    """
+    tick_length = 1  # Seconds. ping_users should be called this often.
+
+    def __init__(self, ping_interval):
+        """
+        Args:
+            ping_interval (int): Seconds a connection may be idle before it's pinged, and how long it then has to
+            respond. If 0, nobody is pinged.
+        """
+        self.interval = ping_interval
+        self.slot_count = int(2 * ping_interval / self.tick_length) + 2
+        self.slots = [{} for _ in range(self.slot_count)]
+        self.ping_queue = {}  # protocol -> entry, see the indexes above.
+        self.current_tick = int(monotonic() / self.tick_length)
+
+    def schedule(self, protocol, entry, deadline):
+        """ Move a connection's entry to the slot of its new deadline. """
+        del self.slots[entry[SLOT]][protocol]
+        entry[DEADLINE] = deadline
+        entry[SLOT] = int(deadline / self.tick_length) % self.slot_count
+        self.slots[entry[SLOT]][protocol] = entry
+
+    def add_user(self, protocol):
+        """ Start tracking a new connection. The first deadline is jittered so that connections which arrive together,
+        like after a restart, don't all get pinged in the same tick. """
+        if self.interval == 0:
+            return
+        now = monotonic()
+        deadline = now + self.interval * uniform(0.5, 1)
+        slot = int(deadline / self.tick_length) % self.slot_count
+        entry = [slot, deadline, now, None, None]
+        self.ping_queue[protocol] = entry
+        self.slots[slot][protocol] = entry
+
+    def activity(self, protocol):
+        """ Called whenever data arrives from a connection. """
+        entry = self.ping_queue.get(protocol)
+        if entry is not None:
+            entry[LAST_SEEN] = monotonic()
 
     def ping_users(self):
-        ping_msg = ''.join([choice(ascii_lowercase + ascii_uppercase + digits) for i in range(15)])
-        if len(self.ping_queue) != 0:  # Some people have failed to respond since the last ping. Disconnect them.
-            queue_copy = copy(self.ping_queue)
-            for user in queue_copy:
-                if user in self.users:  # Make sure they didn't disconnect and weren't removed from the queue(somehow)
-                    user_last_ping = self.ping_queue[user][1]
-                    time_elapsed = user_last_ping - int(time())
-                    user.irc_QUIT([], [], time_elapsed)
-                del self.ping_queue[user]  # Not going to bother creating more overhead by calling remove from queue
-        for user in self.users:  # Anyway, ping everyone who is still here.
-            ping_time = int(time())
-            self.ping_queue[user] = [user, ping_time, ping_msg]
-            user.sendLine("PING :{}".format(ping_msg))
-
-    def pong_received(self, user, ping_message):
-        if user in self.ping_queue:  # Ignore someone who is sending a PONG response manually.
-            if len(ping_message) == 0 or self.ping_queue[user][2] != ping_message[0]:  # Validate response
-                user_last_ping = self.ping_queue[user][1]
-                time_elapsed = user_last_ping - int(time())
-                user.irc_QUIT([], [], time_elapsed)
-            del self.ping_queue[user]
-
-    def remove_from_queue(self, user):
+        """ Process the slots which came due since the last call: ping idle connections, time out the ones which
+        haven't said anything since they were pinged, and push everyone else's deadline back. """
+        now = monotonic()
+        now_tick = int(now / self.tick_length)
+        first_tick = max(self.current_tick, now_tick - self.slot_count)
+        self.current_tick = now_tick
+        ping_token = None
+        for tick in range(first_tick, now_tick):  # Only the ticks which have completely passed.
+            slot = self.slots[tick % self.slot_count]
+            due = [(protocol, entry) for protocol, entry in slot.items() if entry[DEADLINE] <= now]
+            for protocol, entry in due:
+                if entry[PING_TOKEN] is not None and entry[LAST_SEEN] <= entry[PING_TIME]:
+                    self.remove_from_queue(protocol)
+                    protocol.quit(timeout_seconds=int(now - entry[PING_TIME]))
+                elif entry[LAST_SEEN] + self.interval > now:  # Heard from them recently enough.
+                    entry[PING_TOKEN] = None
+                    self.schedule(protocol, entry, entry[LAST_SEEN] + self.interval)
+                else:
+                    if ping_token is None:  # One token is shared by everyone pinged in the same call.
+                        ping_token = ''.join([choice(ascii_lowercase + ascii_uppercase + digits) for i in range(15)])
+                    entry[PING_TOKEN] = ping_token
+                    entry[PING_TIME] = now
+                    self.schedule(protocol, entry, now + self.interval)
+                    protocol.sendLine("PING :{}".format(ping_token))
+
+    def pong_received(self, protocol, ping_message):
+        entry = self.ping_queue.get(protocol)
+        if entry is not None and entry[PING_TOKEN] is not None:  # Ignore someone sending a PONG response manually.
+            if len(ping_message) == 0 or entry[PING_TOKEN] != ping_message[0]:  # Validate response
+                self.remove_from_queue(protocol)
+                return protocol.quit(timeout_seconds=int(monotonic() - entry[PING_TIME]))
+            # Their deadline is left where it is, the slot will push it back when it comes up.
+            entry[PING_TOKEN] = None
+            entry[LAST_SEEN] = monotonic()
+
+    def pings_outstanding(self):
+        """ How many connections were pinged and haven't been heard from since. Counted when asked for, since it's
+        only wanted for the stats. """
+        return sum(1 for x in self.ping_queue.values() if x[PING_TOKEN] is not None and x[LAST_SEEN] <= x[PING_TIME])
+
+    def remove_from_queue(self, protocol):
         """ Called by a client when it disconnects on its own. """
-        if user in self.ping_queue:
-            del self.ping_queue[user]
+        entry = self.ping_queue.pop(protocol, None)
+        if entry is not None:
+            del self.slots[entry[SLOT]][protocol]
@@ -0,0 +1,134 @@
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
+from collections import Counter
+from threading import Thread, Event, Lock, get_ident
+from os import path, makedirs
+from time import strftime, monotonic
+import sys
+
+SAMPLE_INTERVAL = 0.005  # Seconds between samples, 200 a second.
+SWITCH_INTERVAL = 0.0005  # The GIL switch interval while profiling, see SamplingProfiler.start.
+DEFAULT_DURATION = 60  # Seconds a profile runs for when PROFILE START isn't given a duration.
+MAX_DURATION = 600
+IDLE_FUNCTIONS = {"doPoll", "doSelect", "doIteration", "doKEvent", "doWaitForMultipleEvents"}  # Reactors waiting.
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler for the reactor thread, started and stopped by operators with PROFILE. While it runs, a
+    thread of its own looks at the reactor thread's stack every SAMPLE_INTERVAL seconds and counts it under the irc_
+    handler or maintenance task it was in; stacks outside of both count as "reactor", or "idle" while it waits for
+    events. While it isn't running there's no thread and nothing hooked into the server, so it costs nothing.
+    Dumps are written in the collapsed stack format, one "category;outer frame;...;inner frame samples" line per
+    stack, which flamegraph.pl and speedscope read.
+    """
+    def __init__(self, directory, task_names, file_prefix="profile", clock=reactor):
+        """
+        Args:
+            directory (str): Where dumps are written.
+            task_names (list): The names of the methods LoopingCalls run, to count their samples separately.
+            file_prefix (str): What dump file names start with, so several workers can share the directory.
+        """
+        self.directory = directory
+        self.task_names = set(task_names)
+        self.file_prefix = file_prefix
+        self.clock = clock
+        self.samples = Counter()  # (category, collapsed stack) -> samples
+        self.samples_lock = Lock()
+        self.labels = {}  # code object -> frame label, so each one is only formatted once.
+        self.thread = None
+        self.stop_event = None
+        self.stop_call = None
+        self.started_at = 0.0
+        self.elapsed = 0.0
+        self.switch_interval = None
+        self.dumps = 0
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    @property
+    def sample_count(self):
+        with self.samples_lock:
+            return sum(self.samples.values())
+
+    def start(self, duration=DEFAULT_DURATION):
+        """ Start sampling the calling thread, which has to be the reactor's, and stop after duration seconds. The
+        samples from the previous run are thrown away. Returns the duration, clamped to 1 - MAX_DURATION.
+        The sampling thread can only look at the reactor thread's stack once it gets the GIL, which the reactor thread
+        only gives up every switch interval (5ms by default) or when it waits for events. Anything shorter than that
+        would nearly always be sampled as idle, so the switch interval is lowered while profiling. """
+        duration = max(1, min(duration, MAX_DURATION))
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, SWITCH_INTERVAL))
+        with self.samples_lock:
+            self.samples = Counter()
+        self.stop_event = Event()
+        self.thread = Thread(target=self.sample, args=(get_ident(), self.stop_event), name="profiler", daemon=True)
+        self.started_at = monotonic()
+        self.thread.start()
+        self.stop_call = self.clock.callLater(duration, self.stop)
+        return duration
+
+    def stop(self):
+        if not self.running:
+            return
+        if self.stop_call.active():
+            self.stop_call.cancel()
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        sys.setswitchinterval(self.switch_interval)
+        self.elapsed = monotonic() - self.started_at
+
+    def sample(self, thread_id, stop_event):
+        """ Runs in the profiler's thread until stop_event is set. """
+        labels = self.labels
+        task_names = self.task_names
+        while not stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:  # The reactor thread is gone.
+                return
+            innermost_name = frame.f_code.co_name
+            category = None
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = "{} ({}:{})".format(
+                        code.co_name, path.basename(code.co_filename), code.co_firstlineno)
+                stack.append(label)
+                if code.co_name.startswith("irc_") or code.co_name in task_names:
+                    category = code.co_name  # Keeps going, so the outermost one wins.
+                frame = frame.f_back
+            if category is None:
+                category = "idle" if innermost_name in IDLE_FUNCTIONS else "reactor"
+            stack.reverse()
+            with self.samples_lock:
+                self.samples[category, ";".join(stack)] += 1
+
+    def summary(self):
+        """ Returns (category, samples) pairs, most samples first. """
+        categories = Counter()
+        with self.samples_lock:
+            for (category, _), count in self.samples.items():
+                categories[category] += count
+        return categories.most_common()
+
+    def dump(self):
+        """ Write the samples so far to a new file in the directory, in the reactor's threadpool. Returns a Deferred
+        which fires with the file's path. """
+        with self.samples_lock:
+            lines = ["{};{} {}".format(category, stack, count) for (category, stack), count in self.samples.items()]
+        self.dumps += 1
+        file_name = "{}-{}-{}.collapsed".format(self.file_prefix, strftime("%Y%m%d-%H%M%S"), self.dumps)
+        return deferToThread(self.write_dump, path.join(self.directory, file_name), lines)
+
+    @staticmethod
+    def write_dump(file_path, lines):
+        makedirs(path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as dump_file:
+            dump_file.write("\n".join(lines) + "\n")
+        return file_path
@@ -0,0 +1,48 @@
+from collections import namedtuple
+from importlib import import_module
+
+"""
+The command handlers live in the category modules of server.irc_protocol.commands. Each handler is a function taking
+the protocol instance as its first argument, registered with the command decorator below. The CommandManager imports
+the enabled categories once when the server starts and builds a single dispatch table out of them, which
+IRCProtocol.handleCommand looks every line up in.
+"""
+
+CommandEntry = namedtuple("CommandEntry", ["handler", "min_params", "usage", "rate_limited"])
+
+CORE_CATEGORIES = ["connection"]  # Loaded whether or not they're enabled in crow.ini, clients can't register without.
+COMMAND_CATEGORIES = ["connection", "channel", "user", "oper", "channel_accounts"]
+
+
+def command(name, min_params=0, usage=None, rate_limited=False):
+    """
+    Decorator - Registers the decorated function as the handler for an IRC command in its category module.
+    Args:
+        name (str): The command, EG: JOIN.
+        min_params (int): The minimum amount of arguments the command requires.
+        usage (str): If specified, this is appended in a new line after the not enough parameters error message.
+        rate_limited (bool): Whether calls are limited per host by the limit of the same name in the RateLimitSettings
+        section of crow.ini.
+    The handlers all take the same three parameters: the protocol instance, prefix, and params, where params is the
+    list of arguments passed to the command by the client.
+    """
+    def command_decorator(handler):
+        handler.irc_command = (name, CommandEntry(handler, min_params, usage, rate_limited))
+        return handler
+    return command_decorator
+
+
+class CommandManager:
+    def __init__(self, categories):
+        """
+        Args:
+            categories (list): The names of the command categories to load, as set in crow.ini.
+        """
+        self.categories = CORE_CATEGORIES + [x for x in categories if x not in CORE_CATEGORIES]
+        self.commands = {}  # command -> CommandEntry
+        for category in self.categories:
+            category_module = import_module("server.irc_protocol.commands.{}".format(category))
+            for member in vars(category_module).values():
+                if hasattr(member, "irc_command"):
+                    name, entry = member.irc_command
+                    self.commands[name] = entry
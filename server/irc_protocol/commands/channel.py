@@ -0,0 +1,79 @@
+""" Commands for joining, leaving and looking up channels. Channels are looked up by their irc_lower keys, so any
+casing of a channel's name finds it. """
+from server.irc_channel.channel import IRCChannel, QuitReason
+from server.irc_protocol.command_manager import command
+from utils.irc_casemapping import irc_lower
+from time import time
+from secrets import token_urlsafe
+
+
+@command("JOIN", 1)
+def irc_JOIN(self, prefix, params):
+    """ When a user attempts to join a channel, prevent them if they have no nickname. Otherwise, check if the
+     channel name exists. If it doesn't, make a new channel and put them as the owner, send them the owner
+     details. Otherwise, try to have the channel add them."""
+    # ToDo: Implement everything here: http://riivo.talviste.ee/irc/rfc/index.php?page=command.php&cid=8
+
+    if self.user_instance.nickname is None:
+        return self.sendLine("Failed to join channel: Your nickname is not set.")
+
+    channel = params[0]
+    if channel[0] != '#':
+        channel = '#' + channel
+    channel_key = irc_lower(channel)
+
+    if channel_key not in self.channels:
+        owner_name = token_urlsafe(16)
+        owner_password = token_urlsafe(32)
+        new_channel = IRCChannel(channel, self.channelmanager, self.bus)
+        new_channel.channel_owner = self.user_instance
+        new_channel.channel_owner_account = [owner_name, owner_password]
+        new_channel.last_owner_login = int(time())
+        self.channels[channel_key] = new_channel
+        new_channel.journal_create()
+        if self.bus is not None:
+            self.bus.publish_create(new_channel)
+            self.bus.publish_owner(new_channel)
+        self.user_instance.send_msg(
+            self.user_instance.nickname,
+            "You are now logged in as the owner of {}".format(channel)
+        )
+        self.user_instance.send_msg(
+            self.user_instance.nickname,
+            "Owner account details for {} are: {}:{} - Don't lose them.".format(channel, owner_name, owner_password)
+        )
+
+    # Map this protocol instance to the channel's current clients,
+    # and then add this channel to the list of channels the user is connected to.
+    # If any errors occur, echo them to the client.
+    results = self.channels[channel_key].add_user(self.user_instance)
+    if results is not None:
+        self.sendLine(results)
+
+
+@command("PART", 1)
+def irc_PART(self, prefix, params):
+    """ When a user leaves a channel, check if their client issued a leave message. If not, a default
+     one will be used. Remove the user from the channel the client was in w/ the leave message."""
+    channel = self.channels.get(irc_lower(params[0]))
+    if channel is None:
+        return self.send_encoded_line(self.user_instance.err_nosuchchannel(params[0]))
+    if self.user_instance not in channel.users:
+        return self.send_encoded_line(self.user_instance.err_notonchannel(params[0], "You're not on that channel"))
+    leave_message = None
+    if len(params) == 2:
+        leave_message = params[1]
+    channel.remove_user(self.user_instance, leave_message, reason=QuitReason.LEFT)
+
+
+@command("WHO", 1)
+def irc_WHO(self, prefix, params):
+    """ Attempt to perform a WHO lookup on a channel """
+    target_channel = params[0]
+    channel = self.channels.get(irc_lower(target_channel))
+    if channel is not None:
+        results = channel.who(self.user_instance, self.hostname)
+        if type(results) is bytes:  # An error reply.
+            return self.send_encoded_line(results)
+        return self.stream_reply(results)
+    return self.sendLine(self.user_instance.err_nosuchchannel(target_channel))
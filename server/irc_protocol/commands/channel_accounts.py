@@ -0,0 +1,91 @@
+""" Commands for managing and logging in to the owner and operator accounts of channels. """
+from server.irc_protocol.command_manager import command
+from utils.irc_casemapping import irc_lower
+
+
+@command("CHOPERPERMS")
+def irc_CHOPERPERMS(self, prefix, params):
+    """
+    Usage will be: CHOPERPERMS <channel> <operator> <add, remove, None> <perms>
+    List or set permissions an operator has. If operator == *, then list or set default permissions for all
+    operators.
+    """
+    pass
+
+
+@command("CHOPER", rate_limited=True)
+def irc_CHOPER(self, prefix, params):
+    """ Not implemented - This is for logging in as a channel operator. """
+    """
+    Usage will be:
+        /CHOPER <channel> <account name> <password>
+    """
+    pass
+
+
+@command("CHOPERS", 1, "Usage: CHOPERS <channel> <None, Operator_Name> <None, Add, Delete, Password, Name> "
+                       "<New Name/New Password> - Manage a channel's operator accounts. "
+                       "Refer to COMMANDS.md for more information.")
+def irc_CHOPERS(self, prefix, params):
+    """ Manages the operator accounts on a supplied channel. """
+    param_count = len(params)
+    target_channel = self.channels.get(irc_lower(params[0]))
+    if target_channel is None:
+        return self.sendLine(self.user_instance.err_nosuchchannel(params[0]))
+    target_operator = None
+    command = None
+    if param_count != 1:
+        target_operator = params[0]
+        if param_count >= 2:
+            command = params[1].lower()
+
+    command_method_dict = {
+        None: target_channel.get_operator,
+        "add": target_channel.add_operator,
+        "delete": target_channel.delete_operator,
+        "name": target_channel.set_operator_name,
+        "password": target_channel.set_operator_password
+    }
+
+    if target_operator is None:  # List all operator names on the channel
+        output = target_channel.get_operator(self.user_instance)
+    else:  # Manage a specific account/Add and Delete accounts
+        account_name = None
+        param = None
+        if command == "add" or command == "delete" or command is None:
+            if param_count >= 3:
+                account_name = params[2]
+            method = command_method_dict.get(command)
+            output = method(self.user_instance, account_name)
+        else:  # Changing the name/password of an account, listing details pertaining to a specific account.
+            command = None
+            if param_count >= 2:
+                account_name = params[1]
+            if param_count >= 3:  # Managing an account
+                command = params[2]
+
+            if command == "name" or command == "password":
+                if param_count >= 4:
+                    param = params[3]
+                method = command_method_dict.get(command)
+                output = method(self.user_instance, account_name, param)
+            else:  # List account details
+                output = target_channel.get_operator(self.user_instance, account_name)
+    return self.sendLine(output)
+
+
+@command("CHOWNER", 3, "Usage: CHOWNER <channel> <owner_name> <pass> - Logs in to the specified channel as an "
+                       "owner.", rate_limited=True)
+def irc_CHOWNER(self, prefix, params):
+    if len(params) < 3:
+        self.sendLine(self.user_instance.err_needmoreparams("CHOWNER"))
+    if params[0][0] != '#':
+        params[0] = '#' + params[0]
+    channel_name = params[0]
+    name = params[1]
+    password = params[2]
+    user = self.user_instance
+    channel = self.channels.get(irc_lower(channel_name))
+    if channel is None:
+        return self.sendLine(self.user_instance.err_nosuchchannel(channel_name))
+    self.sendLine(channel.login_owner(name, password, user))
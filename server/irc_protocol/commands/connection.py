@@ -0,0 +1,72 @@
+""" Commands for registering with and leaving the server. These are always loaded. """
+from twisted.words.protocols.irc import RPL_WELCOME, RPL_ISUPPORT
+from server.irc_protocol.command_manager import command
+from utils.irc_casemapping import CASEMAPPING
+
+
+@command("PONG")
+def irc_PONG(self, prefix, params):
+    self.pingmanager.pong_received(self, params)
+
+
+@command("QUIT")
+def irc_QUIT(self, prefix, params):
+    """ When a user disconnects from the server, check if their client issued a leave message. If not, a default
+     one will be used. """
+    leave_message = None
+    if len(params) == 1:
+        leave_message = params[0]
+    self.quit(leave_message)
+
+
+@command("NICK", 1)
+def irc_NICK(self, prefix, params):
+    """ When a client issues a NICK command on join/to rename themselves, check it against the server's nickname
+     index, also if this is their first time connecting, send them a welcome with the nickname. (to be moved later)"""
+    attempted_nickname = params[0]
+    if self.user_instance.nickname is None and self.user_instance.nickattempts == 0:
+        self.sendLine(":{} {} {} :{}".format(
+            self.hostname, RPL_WELCOME,
+            attempted_nickname,
+            self.config.ServerSettings.ServerWelcome + ", {}!".format(attempted_nickname))
+        )
+        self.sendLine(":{} {} {} CASEMAPPING={} CHANTYPES=# CHANMODES=,,S, NICKLEN={} :are supported by this server"
+                      .format(self.hostname, RPL_ISUPPORT, attempted_nickname, CASEMAPPING,
+                              self.user_instance.nick_length))
+    results = self.user_instance.set_nickname(attempted_nickname, self.nicknames)
+    if results is not None:
+        self.sendLine(results)
+
+
+@command("USER")
+def irc_USER(self, prefix, params):
+    """ When a user first joins the client sends a USER command with information about the client. Verify it's
+    all valid. If it's not valid, then kick them."""
+    try:
+        username = params[0]
+        realname = params[3]
+        self.user_instance.username = username
+        self.user_instance.realname = realname
+        if self.bus is not None and self.user_instance.nickname is not None:
+            self.bus.publish_user(self.user_instance)
+    except (ValueError, IndexError) as e:
+        error_message = str(e)
+        if type(e) == IndexError:
+            error_message = "*** Your client did not supply enough parameters to make a valid USER command. ***"
+        self.sendLine(error_message)
+        self.lose_connection()
+
+
+@command("CAP")
+def irc_CAP(self, prefix, params):
+    """
+    Not implemented - this is supposed to return the list of capabilities supported by the server.
+    https://ircv3.net/specs/core/capability-negotiation-3.1.html
+    """
+    pass
+
+
+@command("COMMANDS")
+def irc_COMMANDS(self, prefix, params):
+    """ Not implemented - return a list of commands the server uses """
+    pass
@@ -0,0 +1,85 @@
+""" Commands for IRC operators. """
+from server.irc_protocol.command_manager import command
+from server.irc_profiler import DEFAULT_DURATION
+
+
+@command("OPER", 2, "Usage: OPER <username> <password> - Logs you in as an IRC operator.", rate_limited=True)
+def irc_OPER(self, prefix, params):
+    user = self.user_instance
+    if user.operator:
+        return self.sendLine("You are already an operator.")
+    username = params[0]
+    password = params[1]
+    if username in self.operators:
+        if self.operators[username] == password:
+            user.operator = True
+            self.sendLine(user.set_mode('+o'))
+            return self.sendLine(user.rpl_youreoper())
+    self.sendLine(self.user_instance.err_passwordmismatch())
+
+
+def format_milliseconds(seconds):
+    return "overflow" if seconds is None else "{:.3f}ms".format(seconds * 1000)
+
+
+@command("STATS", 0, "Usage: STATS [m|z] - m: Sampled command handler times. z: Server counters and gauges.")
+def irc_STATS(self, prefix, params):
+    """ Operator only. With no query, both reports are sent. """
+    if not self.user_instance.operator:
+        return self.sendLine(self.user_instance.err_noprivileges())
+    queries = [params[0]] if params else ["m", "z"]
+    for query in queries:
+        if query == "m":
+            for command_name, histogram in sorted(self.stats.commands.items()):
+                count = histogram.count
+                if not count:
+                    continue
+                description = "avg {} p50 <={} p99 <={}".format(
+                    format_milliseconds(histogram.total_seconds / count), format_milliseconds(histogram.quantile(0.5)),
+                    format_milliseconds(histogram.quantile(0.99)))
+                self.sendLine(self.user_instance.rpl_statscommands(command_name, count, description))
+        elif query == "z":
+            for name, value in sorted(self.stats.counters.items()):
+                self.sendLine(self.user_instance.rpl_statsdebug(query, "{} {}".format(name, value)))
+            for name, value in sorted(self.stats.gauge_values().items()):
+                self.sendLine(self.user_instance.rpl_statsdebug(query, "{} {}".format(name, value)))
+        self.sendLine(self.user_instance.rpl_endofstats(query))
+
+
+@command("PROFILE", 1, "Usage: PROFILE START [seconds]|STOP|DUMP - Samples where the server spends its time.")
+def irc_PROFILE(self, prefix, params):
+    """ Operator only. See SamplingProfiler. """
+    if not self.user_instance.operator:
+        return self.sendLine(self.user_instance.err_noprivileges())
+    profiler = self.profiler
+    action = params[0].upper()
+    if action == "START":
+        if profiler.running:
+            return self.sendLine(self.user_instance.server_notice("The profiler is already running."))
+        duration = DEFAULT_DURATION
+        if len(params) > 1:
+            try:
+                duration = int(params[1])
+            except ValueError:
+                return self.sendLine(self.user_instance.server_notice("The duration has to be a number of seconds."))
+        duration = profiler.start(duration)
+        self.sendLine(self.user_instance.server_notice(
+            "Profiling for {} seconds. PROFILE STOP stops early, PROFILE DUMP saves the samples.".format(duration)))
+    elif action == "STOP":
+        if not profiler.running:
+            return self.sendLine(self.user_instance.server_notice("The profiler isn't running."))
+        profiler.stop()
+        self.sendLine(self.user_instance.server_notice("Stopped after {} samples over {:.1f} seconds.".format(
+            profiler.sample_count, profiler.elapsed)))
+    elif action == "DUMP":
+        sample_count = profiler.sample_count
+        if sample_count == 0:
+            return self.sendLine(self.user_instance.server_notice("There are no samples to dump."))
+        for category, count in profiler.summary()[:10]:
+            self.sendLine(self.user_instance.server_notice("{:>6.1%} {}".format(count / sample_count, category)))
+        profiler.dump().addCallbacks(
+            lambda file_path: self.sendLine(self.user_instance.server_notice("Dumped to {}".format(file_path))),
+            lambda failure: self.sendLine(self.user_instance.server_notice("Dump failed: {}".format(failure.value)))
+        )
+    else:
+        self.sendLine(self.commands["PROFILE"].usage)
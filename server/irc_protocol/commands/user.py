@@ -0,0 +1,115 @@
+""" Commands for messaging and looking up users, and for user modes. """
+from server.irc_protocol.command_manager import command
+from utils.irc_casemapping import irc_lower
+from time import time
+
+
+@command("PRIVMSG", 2)
+def irc_PRIVMSG(self, prefix, params):
+    results = self.user_instance.send_msg(params[0], params[1])
+    if results is not None:
+        self.sendLine(results)
+
+
+@command("WHOIS", 1)
+def irc_WHOIS(self, prefix, params):
+    """ Attempt to perform a WHOIS on another user."""
+    target_nickname = params[0]
+    target_user = self.nicknames.get(irc_lower(target_nickname))
+    if target_user is not None:
+        target_nickname = target_user.nickname  # As they set it, rather than as it was asked for.
+        target_username = target_user.username
+        target_hostmask = target_user.hostmask
+        target_realname = target_user.realname
+        target_server_name = self.server_name
+        target_server_description = self.server_description
+        target_is_operator = target_user.operator
+        target_last_msg_time = time() - target_user.last_msg_time
+        target_signon_time = target_user.sign_on_time
+        target_channels = [x.channel_name for x in target_user.channels]
+        receiver_nickname = self.user_instance.nickname
+        if len(target_channels) == 0:
+            target_channels.append("User is not in any channels.")
+        return self.whois(
+            receiver_nickname, target_nickname, target_username, target_hostmask, target_realname,
+            target_server_name, target_server_description, target_is_operator, target_last_msg_time,
+            target_signon_time, target_channels
+        )
+    return self.sendLine(self.user_instance.err_nosuchnick(target_nickname))
+
+
+@command("AWAY")
+def irc_AWAY(self, prefix, params):
+    """ If a reason is supplied by the user, then it is assumed they are setting themselves away. Otherwise it is
+     assumed they are marking themselves as unaway. """
+    reason = None
+    if len(params) != 0:
+        reason = params[0]
+    self.sendLine(self.user_instance.away(reason))
+
+
+@command("MODE", 1)
+def irc_MODE(self, prefix, params):
+    """ Called when a user either:
+        A: Wants to check their own modes (params will be 1), [their_nickname]
+        B: Wants to check someone else's modes (params will be 2), [location_it_occurred_in, target_nick]
+        C: Wants to check a channel's modes (params will be 1), [the_channel]
+        D: Wants to set their own mode (params will be 2), [their_nickname, mode]
+        E: Wants to set someone else's mode (params will be 3), [location, target_nick, mode]
+        F: Wants to set a channel's mode. (params will be 2), [location, mode]
+        G: Wants to set a channel's mode with an argument. (params will be 3), [location, mode, argument]
+     """
+    param_count = len(params)
+    this_client = self.user_instance  # Check if this client's nickname is in the params.
+    # Only the params which could be nicknames are mapped, not the mode or channel, and each only once.
+    param_keys = [irc_lower(x) for x in params if x[0] not in '#+-']
+    client_nickname_in_list = next((x for x in param_keys if x == this_client.key), None)
+    mode = next((x for x in params if x[0] in '+-' and len(x) >= 2), None)
+    location_name = next((x for x in params if x[0] == '#'), None)
+    location = None if location_name is None else self.channels.get(irc_lower(location_name))
+
+    # Make this an anonymous function since I don't want to do this lookup unless I need to.
+    def get_target_user():
+        return next((self.nicknames[x] for x in param_keys if x != this_client.key and x in self.nicknames), None)
+
+    if param_count == 1:  # Checking a channel's modes, checking this client's modes.
+        if client_nickname_in_list is None and location is not None:
+            return self.sendLine(location.get_modes(this_client))
+        elif client_nickname_in_list is None and location_name is None:
+            return self.sendLine(self.user_instance.err_nosuchchannel(params[0]))
+        return self.sendLine(this_client.get_modes())
+
+    if param_count == 2:  # Setting this client's mode, setting a channel's mode, checking someone else's modes.
+        if client_nickname_in_list is None:
+            target_user = get_target_user()
+            if location_name is None:
+                if target_user is None:
+                    return self.sendLine(self.user_instance.err_nosuchnick(params[-1]))
+                return self.sendLine(target_user.get_modes(this_client.nickname, this_client.operator))
+            else:
+                if location is not None:
+                    results = location.set_mode(this_client, mode)
+                    if results is not None:
+                        self.sendLine(results)
+                    return
+                return self.sendLine(self.user_instance.err_nosuchchannel(location_name))
+        if mode is not None:
+            return self.sendLine(this_client.set_mode(mode))
+        return self.sendLine(self.user_instance.err_unknownmode())
+
+    if param_count == 3 and params[0] == location_name and params[1] == mode:  # Setting a channel's mode
+        if location is not None:
+            results = location.set_mode(this_client, mode, params[2])
+            if results is not None:
+                self.sendLine(results)
+            return
+        return self.sendLine(self.user_instance.err_nosuchchannel(location_name))
+
+    if param_count == 3:  # Setting another user's mode
+        target_user = get_target_user()
+        if target_user is None:
+            return self.sendLine(self.user_instance.err_nosuchnick(params[1]))
+        elif mode is None:
+            return self.sendLine(self.user_instance.err_unknownmode())
+        else:
+            return self.sendLine(target_user.set_mode(mode, this_client.nickname, this_client.operator))
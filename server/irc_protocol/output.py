@@ -0,0 +1,48 @@
+from twisted.internet import reactor
+
+
+class OutputFlusher:
+    """
+    Connections queue the lines they send instead of writing each one to their transport. The first line a connection
+    queues registers it here, and at the start of the next reactor iteration every registered connection's queued
+    lines are joined and handed to its transport in one write. Joining them here is cheaper than writeSequence, which
+    walks the lines one by one in Python, and gives TLS connections one record instead of one per line. The bytes
+    written are added to the server's stats.
+    """
+    def __init__(self, stats, clock=reactor):
+        self.stats = stats
+        self.clock = clock
+        self.pending = []
+        self.dropped = []
+        self.flush_call = None
+
+    def schedule(self, protocol):
+        self.pending.append(protocol)
+        if self.flush_call is None:
+            self.flush_call = self.clock.callLater(0, self.flush)
+
+    def drop(self, protocol):
+        """ Disconnect a client which exceeded its SendQ on the next flush. It's usually found out in the middle of a
+        channel broadcast, where it can't be removed from the channel yet. """
+        self.dropped.append(protocol)
+        if self.flush_call is None:
+            self.flush_call = self.clock.callLater(0, self.flush)
+
+    def flush(self):
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+        pending, self.pending = self.pending, []
+        bytes_out = 0
+        for protocol in pending:  # protocol.flush_output(), inlined since this runs for every connection with output.
+            output = protocol.output
+            if output and not protocol.producer_paused:  # Paused output is written by IRCProtocol.resumeProducing.
+                protocol.output = []
+                data = output[0] if len(output) == 1 else b"".join(output)
+                bytes_out += len(data)
+                protocol.transport.write(data)
+        self.stats.bytes_out += bytes_out
+        if self.dropped:
+            dropped, self.dropped = self.dropped, []
+            for protocol in dropped:
+                protocol.drop_sendq_exceeded()
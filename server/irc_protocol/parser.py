@@ -0,0 +1,104 @@
+"""
+Parses the lines clients send. Received data is kept as bytes and only cut at its last LF, so a character split
+across two reads is never decoded in halves, and a long line arriving over many reads isn't re-joined on every one.
+The complete lines are decoded once and each is broken into its tags, prefix, command and params in a single loop,
+producing the same prefix, command and params Twisted's parsemsg would for the same line.
+"""
+
+LF = b"\n"
+TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+class LineParser:
+    """ Parses the data received from one client. """
+    def __init__(self):
+        self.partial_line = []  # The pieces of the unterminated line at the end of the data received so far.
+
+    def feed(self, data):
+        """
+        Parse all the lines completed by the received data. LF alone also ends a line, for clients like mIRC.
+        Returns: A list of (tags, prefix, command, params) tuples, where tags is a dict of the IRCv3 message tags or
+        None if the line had none, and command is upper case.
+        """
+        if data.find(LF) + 1 == len(data) and not self.partial_line:  # The usual read, one whole line. Nothing to split.
+            message = parse_line(data.decode("utf-8", "replace")[:-1])
+            return [message] if message is not None else []
+        last_line_end = data.rfind(LF)
+        if last_line_end == -1:  # Nothing to parse yet, hold on to it without joining it to what came before.
+            self.partial_line.append(data)
+            return []
+        if last_line_end + 1 == len(data):  # The usual case, the read ends on a line. Decoded as is, without slicing.
+            remainder = None
+        else:
+            remainder = data[last_line_end + 1:]
+            data = data[:last_line_end]
+        if self.partial_line:
+            self.partial_line.append(data)
+            data = b"".join(self.partial_line)
+            self.partial_line = []
+        text = data.decode("utf-8", "replace")
+        if remainder is not None:
+            self.partial_line.append(remainder)
+
+        messages = []
+        for line in text.split("\n"):
+            message = parse_line(line)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+
+def parse_line(line):
+    """ Break one line, without its LF, into (tags, prefix, command, params). Returns None if there's no command. """
+    if len(line) <= 2:  # This is a blank line, at best.
+        return None
+    if line[-1] == "\r":
+        line = line[:-1]
+    tags = None
+    prefix = ""
+    if line[0] in "@:":
+        if line[0] == "@":
+            tags_end = line.find(" ")
+            if tags_end == -1:
+                return None
+            tags = parse_tags(line[1:tags_end])
+            line = line[tags_end + 1:].lstrip(" ")
+        if line[:1] == ":":
+            prefix_end = line.find(" ")
+            if prefix_end == -1:
+                return None
+            prefix = line[1:prefix_end]
+            line = line[prefix_end + 1:]
+    trailing_start = line.find(" :")
+    if trailing_start == -1:
+        params = line.split()
+    else:
+        params = line[:trailing_start].split()
+        params.append(line[trailing_start + 2:])
+    if not params:
+        return None
+    return tags, prefix, params.pop(0).upper(), params
+
+def parse_tags(raw_tags):
+    """ Parse the tags of a line (without the leading @) into a dict. Tags without a value are set to "". """
+    tags = {}
+    for tag in raw_tags.split(";"):
+        if tag == "":
+            continue
+        key, _, value = tag.partition("=")
+        if "\\" in value:
+            value = unescape_tag_value(value)
+        tags[key] = value
+    return tags
+
+
+def unescape_tag_value(value):
+    """ https://ircv3.net/specs/extensions/message-tags#escaping-values """
+    unescaped = []
+    characters = iter(value)
+    for character in characters:
+        if character == "\\":
+            character = next(characters, "")  # A trailing backslash is dropped.
+            character = TAG_ESCAPES.get(character, character)
+        unescaped.append(character)
+    return "".join(unescaped)
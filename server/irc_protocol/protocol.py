@@ -1,382 +1,252 @@
-# ToDo: Separate commands into their own modules by category or something, this is getting ridiculous.
-# ToDo: Maybe a command manager is in order? Such as every command is handled by it, and it lists the categories?
-from twisted.words.protocols.irc import IRC, protocol, RPL_WELCOME
-from server.irc_channel.channel import IRCChannel, QuitReason
+from twisted.words.protocols.irc import IRC, protocol
+from twisted.python import log
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
+from server.irc_channel.channel import QuitReason, quit_text
 from server.irc_user import IRCUser
-from server.irc_ratelimiter import rate_limiter
-from server.irc_rplhelper import RPLHelper
-from server.irc_protocol.param_count import min_param_count
 from server.irc_config.config import IRCConfig
+from server.irc_protocol.parser import LineParser
 from time import time
 from socket import getfqdn
-from secrets import token_urlsafe
+from functools import lru_cache
+from math import ceil
+from collections import deque
 
 # noinspection PyPep8Naming
 
 
+@lru_cache(maxsize=None)
+def server_hostname():
+    """ Looked up once, rather than for every connection. """
+    return getfqdn()
+
+
+@implementer(IPushProducer)
 class IRCProtocol(IRC):
-    def __init__(self, users, channels, config, ratelimiter, clientlimiter, pingmanager, channelmanager):
+    """ The attributes this class and Twisted's base classes set are listed in __slots__, so they're stored in slots
+    rather than looked up in a dict. IRC, Protocol and BaseProtocol don't declare __slots__ themselves, so every
+    instance still has a (normally empty) __dict__. """
+    __slots__ = ["connected", "transport", "users", "nicknames", "channels", "config", "server_name",
+                 "server_description", "operators", "hostname", "client_host", "user_instance", "ratelimiter",
+                 "clientlimiter", "pingmanager", "channelmanager", "commands", "bus", "parser", "outputflusher",
+                 "output", "stats", "profiler", "scheduler", "producer_paused", "held_output_size", "sendq",
+                 "sendq_exceeded", "reply_streams", "reply_task"]
+
+    def __init__(self, users, nicknames, channels, config, ratelimiter, clientlimiter, pingmanager, channelmanager,
+                 commandmanager, outputflusher, stats, profiler, scheduler, bus=None):
         """
-        Create a protocol instance for this client + set up a user/rplhelper instance. Pass references
-        to the ratelimiter, clientlimiter, pingmanager, and channelmanager.
+        Create a protocol instance for this client + set up a user instance. Pass references
+        to the ratelimiter, clientlimiter, pingmanager, channelmanager, outputflusher, stats, profiler and scheduler,
+        and the commandmanager's dispatch table. The protocol is registered as a push producer on its transport so it
+        knows when the client isn't keeping up with what's being sent to it. The client_host is set by
+        ChatServer.buildProtocol, which has already counted the connection with the clientlimiter.
         Args:
             users (OrderedDict): The server's current logged users.
+            nicknames (dict): The server's nickname index, mapping in use nicknames to their user instance.
             channels (OrderedDict): The server's current channels.
             config (IRCConfig): The server's config settings.
+            bus (WorkerBus): The bus to the sibling workers, if running with more than one worker.
         """
+        self.connected = 0  # The base classes' defaults, which the slots hide.
+        self.transport = None
         self.users = users
+        self.nicknames = nicknames
         self.channels = channels
         self.config = config
         self.server_name = self.config.ServerSettings.ServerName
         self.server_description = self.config.ServerSettings.ServerDescription
         self.operators = self.config.UserSettings.Operators
-        self.hostname = getfqdn()
+        self.hostname = server_hostname()
         self.client_host = None
-        self.rplhelper = RPLHelper(None)
         self.user_instance = None
         self.ratelimiter = ratelimiter
         self.clientlimiter = clientlimiter
         self.pingmanager = pingmanager
         self.channelmanager = channelmanager
+        self.commands = commandmanager.commands
+        self.bus = bus
+        self.parser = LineParser()
+        self.outputflusher = outputflusher
+        self.output = []  # Encoded lines waiting for the outputflusher to write them.
+        self.stats = stats
+        self.profiler = profiler
+        self.scheduler = scheduler
+        self.producer_paused = False  # Set while the transport's buffer is full, see pauseProducing.
+        self.held_output_size = 0
+        self.sendq = 0
+        self.sendq_exceeded = False
+        self.reply_streams = None  # Replies waiting to be streamed, see stream_reply.
+        self.reply_task = None
 
     def connectionMade(self):
         current_time_posix = time()
         max_nick_length = self.config.UserSettings.MaxNicknameLength
         max_user_length = self.config.UserSettings.MaxUsernameLength
-        max_clients = self.config.UserSettings.MaxClients
-        self.client_host = self.transport.getPeer().host
-        self.clientlimiter.add_entry(self.client_host)
-        if self.clientlimiter.host_has_too_many_clients(self.client_host, max_clients):
-            self.sendLine("You have too many clients connected to the server. Max clients: {}".format(max_clients))
-            self.transport.loseConnection()
-        else:
-            self.sendLine("You are now connected to %s" % self.server_name)
-            self.user_instance = IRCUser(
-                self, None, None, None, current_time_posix, current_time_posix,
-                self.client_host, None, [], 0, max_nick_length, max_user_length, self.rplhelper, self.hostname
-            )
-            self.users[self] = self.user_instance
+        self.sendLine("You are now connected to %s" % self.server_name)
+        self.user_instance = IRCUser(
+            self, None, None, None, current_time_posix, current_time_posix,
+            self.client_host, None, {}, 0, max_nick_length, max_user_length, self.hostname
+        )
+        self.users[self] = self.user_instance
+        self.pingmanager.add_user(self)
+        self.transport.registerProducer(self, True)
 
     def connectionLost(self, reason=protocol.connectionDone):
         # Make sure all circular references created by this object get cleaned up.
         self.clientlimiter.remove_entry(self.client_host)
         self.pingmanager.remove_from_queue(self)
+        if self.reply_task is not None:
+            self.reply_task.stop()
+            self.reply_task = None
         if self in self.users:
-            for channel in self.user_instance.channels:
-                quit_reason = QuitReason.UNSPECIFIED
-                channel.remove_user(self.user_instance, None, reason=quit_reason)
+            self.leave_channels(quit_reason=QuitReason.UNSPECIFIED)
             del self.users[self]
+        if self.user_instance is not None:
+            self.user_instance.release_nickname()
         self.user_instance = None
-        self.rplhelper.user_instance = None
-
-    def irc_unknown(self, prefix, command, params):
-        self.sendLine(self.rplhelper.err_unknowncommand(command))
-
-    def irc_PONG(self, prefix, params):
-        self.pingmanager.pong_received(self, params)
-
-    @min_param_count(1)
-    def irc_JOIN(self, prefix, params):
-        """ When a user attempts to join a channel, prevent them if they have no nickname. Otherwise, check if the
-         channel name exists. If it doesn't, make a new channel and put them as the owner, send them the owner
-         details. Otherwise, try to have the channel add them."""
-        # ToDo: Implement everything here: http://riivo.talviste.ee/irc/rfc/index.php?page=command.php&cid=8
-
-        if self.user_instance.nickname is None:
-            return self.sendLine("Failed to join channel: Your nickname is not set.")
-
-        channel = params[0].lower()
-        if channel[0] != '#':
-            channel = '#' + channel
-
-        if channel not in self.channels:
-            owner_name = token_urlsafe(16)
-            owner_password = token_urlsafe(32)
-            new_channel = IRCChannel(channel, self.channelmanager)
-            new_channel.channel_owner = self.user_instance
-            new_channel.channel_owner_account = [owner_name, owner_password]
-            new_channel.last_owner_login = int(time())
-            self.channels[channel] = new_channel
-            self.user_instance.send_msg(
-                self.user_instance.nickname,
-                "You are now logged in as the owner of {}".format(channel)
-            )
-            self.user_instance.send_msg(
-                self.user_instance.nickname,
-                "Owner account details for {} are: {}:{} - Don't lose them.".format(channel, owner_name, owner_password)
-            )
-
-        # Map this protocol instance to the channel's current clients,
-        # and then add this channel to the list of channels the user is connected to.
-        # If any errors occur, echo them to the client.
-        results = self.channels[channel].add_user(self.user_instance)
-        if results is not None:
-            self.sendLine(results)
-
-    def irc_QUIT(self, prefix, params, timeout_seconds=None):
-        """ When a user disconnects from the server, check if their client issued a leave message. If not, a default
-         one will be used. Remove the user from the channels the client was in w/ the leave message."""
-        leave_message = None
-        quit_reason = QuitReason.DISCONNECTED
+        self.output = []
+
+    def dataReceived(self, data):
+        """ Parse the lines with the LineParser instead of IRC.dataReceived, which decodes each read on its own and
+        re-joins and re-splits everything buffered on every call. """
+        self.pingmanager.activity(self)  # Any traffic from the client shows it's still alive, not just a PONG.
+        self.stats.bytes_in += len(data)
+        for tags, prefix, command, params in self.parser.feed(data):  # IRCv3 tags are parsed but nothing uses them yet.
+            self.handleCommand(command, prefix, params)
+
+    def handleCommand(self, command, prefix, params):
+        """ Look the command up in the dispatch table instead of getattr'ing an irc_ method, and run its rate limit and
+        parameter count checks off the table entry before calling the handler. While the stats are sampling, the
+        table's handlers are ones which time themselves, see ServerStats.sample_commands. """
+        entry = self.commands.get(command)
+        try:
+            if entry is None:
+                return self.irc_unknown(prefix, command, params)
+            if entry.rate_limited:
+                time_remaining = self.ratelimiter.consume(self.user_instance.host, command)
+                if time_remaining:
+                    return self.send_encoded_line(self.user_instance.err_noprivileges(
+                        "You are doing that too much. Please wait {} seconds and try again.".format(
+                            ceil(time_remaining))
+                    ))
+            if len(params) < entry.min_params:
+                self.send_encoded_line(self.user_instance.err_needmoreparams(command))
+                if entry.usage is not None:
+                    self.sendLine(entry.usage)
+                return
+            entry.handler(self, prefix, params)
+        except BaseException:
+            self.stats.increment("command_errors")
+            log.deferr()
+
+    def quit(self, leave_message=None, timeout_seconds=None, quit_reason=QuitReason.DISCONNECTED):
+        """ Remove the user from the channels the client was in w/ the leave message, and release their nickname. If
+        timeout_seconds is given, the client is being dropped for not responding to a PING. """
         if timeout_seconds is not None:
             quit_reason = QuitReason.TIMEOUT
-            self.transport.loseConnection()
-        if len(params) == 1:
-            leave_message = params[0]
+            self.lose_connection()
         if self in self.users:
-            for channel in self.user_instance.channels:
-                channel.remove_user(self.user_instance, leave_message, reason=quit_reason,
-                                    timeout_seconds=timeout_seconds)
+            self.leave_channels(leave_message, quit_reason, timeout_seconds)
             del self.users[self]
+            self.user_instance.release_nickname()
 
-    @min_param_count(1)
-    def irc_PART(self, prefix, params):
-        """ When a user leaves a channel, check if their client issued a leave message. If not, a default
-         one will be used. Remove the user from the channel the client was in w/ the leave message."""
-        channel = params[0]
-        leave_message = None
-        if len(params) == 2:
-            leave_message = params[1]
-        self.channels[channel].remove_user(self.user_instance, leave_message, reason=QuitReason.LEFT)
-
-    @min_param_count(2)
-    def irc_PRIVMSG(self, prefix, params):
-        results = self.user_instance.send_msg(params[0], params[1])
-        if results is not None:
-            self.sendLine(results)
-
-    @min_param_count(1)
-    def irc_NICK(self, prefix, params):
-        """ When a client issues a NICK command on join/to rename themselves, generate a list of in use nicknames,
-         also if this is their first time connecting, send them a welcome with the nickname. (to be moved later)"""
-        attempted_nickname = params[0]
-        in_use_nicknames = [self.users[x].nickname for x in self.users if self.users[x].nickname is not None]
-        if self.user_instance.nickname is None and self.user_instance.nickattempts == 0:
-            self.sendLine(":{} {} {} :{}".format(
-                self.hostname, RPL_WELCOME,
-                attempted_nickname,
-                self.config.ServerSettings.ServerWelcome + ", {}!".format(attempted_nickname))
-            )
-        results = self.user_instance.set_nickname(attempted_nickname, in_use_nicknames)
-        if results is not None:
-            self.sendLine(results)
-
-    def irc_USER(self, prefix, params):
-        """ When a user first joins the client sends a USER command with information about the client. Verify it's
-        all valid. If it's not valid, then kick them."""
-        try:
-            username = params[0]
-            realname = params[3]
-            self.user_instance.username = username
-            self.user_instance.realname = realname
-        except (ValueError, IndexError) as e:
-            error_message = str(e)
-            if type(e) == IndexError:
-                error_message = "*** Your client did not supply enough parameters to make a valid USER command. ***"
-            self.sendLine(error_message)
-            self.transport.loseConnection()
-
-    def irc_CAP(self, prefix, params):
-        """
-        Not implemented - this is supposed to return the list of capabilities supported by the server.
-        https://ircv3.net/specs/core/capability-negotiation-3.1.html
-        """
-        pass
-
-    @min_param_count(1)
-    def irc_WHO(self, prefix, params):
-        """ Attempt to perform a WHO lookup on a channel """
-        target_channel = params[0]
-        if target_channel in self.channels:
-            results = self.channels[target_channel].who(self.user_instance, self.hostname)
-            if type(results) is not str:  # Valid return type should be a list. Invalid is a string.
-                return self.who(self.user_instance.nickname, target_channel, results)
-            return self.sendLine(results)
-        return self.sendLine(self.rplhelper.err_nosuchchannel())
-
-    @min_param_count(1)
-    def irc_WHOIS(self, prefix, params):
-        """ Attempt to perform a WHOIS on another user."""
-        target_nickname = params[0]
-        target_user = next((self.users[x] for x in self.users if self.users[x].nickname == target_nickname), None)
-        if target_user is not None:
-            target_username = target_user.username
-            target_hostmask = target_user.hostmask
-            target_realname = target_user.realname
-            target_server_name = self.server_name
-            target_server_description = self.server_description
-            target_is_operator = target_user.operator
-            target_last_msg_time = time() - target_user.last_msg_time
-            target_signon_time = target_user.sign_on_time
-            target_channels = [x.channel_name for x in target_user.channels]
-            receiver_nickname = self.user_instance.nickname
-            if len(target_channels) == 0:
-                target_channels.append("User is not in any channels.")
-            return self.whois(
-                receiver_nickname, target_nickname, target_username, target_hostmask, target_realname,
-                target_server_name, target_server_description, target_is_operator, target_last_msg_time,
-                target_signon_time, target_channels
-            )
-        return self.sendLine(self.rplhelper.err_nosuchnick())
-
-    def irc_AWAY(self, prefix, params):
-        """ If a reason is supplied by the user, then it is assumed they are setting themselves away. Otherwise it is
-         assumed they are marking themselves as unaway. """
-        reason = None
-        if len(params) != 0:
-            reason = params[0]
-        self.sendLine(self.user_instance.away(reason))
-
-    @min_param_count(1)
-    def irc_MODE(self, prefix, params):
-        """ Called when a user either:
-            A: Wants to check their own modes (params will be 1), [their_nickname]
-            B: Wants to check someone else's modes (params will be 2), [location_it_occurred_in, target_nick]
-            C: Wants to check a channel's modes (params will be 1), [the_channel]
-            D: Wants to set their own mode (params will be 2), [their_nickname, mode]
-            E: Wants to set someone else's mode (params will be 3), [location, target_nick, mode]
-            F: Wants to set a channel's mode. (params will be 2), [location, mode]
-         """
-        param_count = len(params)
-        this_client = self.user_instance  # Check if this client's nickname is in the params.
-        client_nickname_in_list = next((x for x in params if x == this_client.nickname), None)
-        mode = next((x for x in params if x[0] in '+-' and len(x) >= 2), None)
-        location_name = next((x for x in params if x[0] == '#'), None)
-
-        # Make this an anonymous function since I don't want to do this loop unless I need to.
-        def get_target_protocol():
-            in_use_nicknames = [x.users[x].nickname for x in self.users if x.users[x].nickname is not None]
-            target_nick = next((x for x in params if x != self.user_instance.nickname and x in in_use_nicknames), None)
-            _target_protocol = next((x for x in self.users if x.users[x].nickname == target_nick), None)
-            return _target_protocol
-
-        if param_count == 1:  # Checking a channel's modes, checking this client's modes.
-            if client_nickname_in_list is None and location_name is not None and location_name in self.channels:
-                return self.sendLine(self.channels[location_name].get_modes())
-            elif client_nickname_in_list is None and location_name is None:
-                return self.sendLine(self.rplhelper.err_nosuchchannel())
-            return self.sendLine(this_client.get_modes())
-
-        if param_count == 2:  # Setting this client's mode, setting a channel's mode, checking someone else's modes.
-            if client_nickname_in_list is None:
-                target_protocol = get_target_protocol()
-                if location_name is None:
-                    if target_protocol is None:
-                        return self.sendLine(self.rplhelper.err_nosuchnick())
-                    return self.sendLine(self.users[target_protocol].get_modes(this_client.nickname, this_client.operator))
-                else:
-                    if location_name in self.channels:
-                        return self.sendLine(self.channels[location_name].set_mode(mode))
-                    return self.sendLine(self.rplhelper.err_nosuchchannel())
-            if mode is not None:
-                return self.sendLine(this_client.set_mode(mode))
-            return self.sendLine(self.rplhelper.err_unknownmode())
-
-        if param_count == 3:  # Setting another user's mode
-            target_protocol = get_target_protocol()
-            if target_protocol is None:
-                return self.sendLine(self.rplhelper.err_nosuchnick())
-            elif mode is None:
-                return self.sendLine(self.rplhelper.err_unknownmode())
-            else:
-                return self.sendLine(self.users[target_protocol].set_mode(mode, this_client.nickname, this_client.operator))
-
-    @rate_limiter("OPER", 10)
-    @min_param_count(2, "Usage: OPER <username> <password> - Logs you in as an IRC operator.")
-    def irc_OPER(self, prefix, params):
+    def leave_channels(self, leave_message=None, quit_reason=QuitReason.UNSPECIFIED, timeout_seconds=None):
+        """ Take the user out of all their channels, sending their QUIT once to everyone they shared any of them with
+        rather than once per shared channel. """
         user = self.user_instance
-        if user.operator:
-            return self.sendLine("You are already an operator.")
-        username = params[0]
-        password = params[1]
-        if username in self.operators:
-            if self.operators[username] == password:
-                user.operator = True
-                return self.sendLine(user.set_mode('+o') + "\r\n" + self.rplhelper.rpl_youreoper())
-        self.sendLine(self.rplhelper.err_passwordmismatch())
-
-    def irc_CHOPERPERMS(self, prefix, params):
-        """
-        Usage will be: CHOPERPERMS <channel> <operator> <add, remove, None> <perms>
-        List or set permissions an operator has. If operator == *, then list or set default permissions for all
-        operators.
-        """
-        pass
-
-    @rate_limiter("CHOPER", 5)
-    def irc_CHOPER(self, prefix, params):
-        """ Not implemented - This is for logging in as a channel operator. """
-        """
-        Usage will be:
-            /CHOPER <channel> <account name> <password>
-        """
+        if user.channels:
+            user.broadcast_to_neighbours(quit_text(quit_reason, leave_message, timeout_seconds))
+            for channel in list(user.channels):  # unmap_user unmaps the channel from this dict.
+                channel.unmap_user(user)
+
+    def sendLine(self, line):
+        """ Replies from RPLHelper are already encoded and terminated, so they're queued as they are. """
+        if type(line) is bytes:
+            return self.send_encoded_line(line)
+        self.send_encoded_line((line + "\r\n").encode("utf-8"))
+
+    def send_encoded_line(self, line):
+        """ Queue a line which has already been terminated and encoded, such as one shared by a channel broadcast.
+        Everything queued during a reactor iteration is written together by the outputflusher. """
+        output = self.output
+        if self.producer_paused:  # Held until the transport drains, counted against the client's SendQ.
+            if self.sendq_exceeded:
+                return
+            self.held_output_size += len(line)
+            if self.held_output_size > self.sendq:
+                self.sendq_exceeded = True
+                self.output = []
+                return self.outputflusher.drop(self)
+        elif not output:
+            self.outputflusher.schedule(self)
+        output.append(line)
+
+    def stream_reply(self, chunks):
+        """ Send a long reply, such as a WHO on a big channel, a chunk of encoded lines at a time in the scheduler's
+        slices rather than all at once, so one client asking for it doesn't hold everyone else up. The stream pauses
+        along with the protocol, so nothing more of it is made while the client isn't reading. A reply streamed while
+        another is still going is sent after it. """
+        if self.reply_streams is None:
+            self.reply_streams = deque()
+        self.reply_streams.append(chunks)
+        if self.reply_task is None:
+            self.reply_task = self.scheduler.cooperate(self.send_reply_streams())
+            if self.producer_paused:
+                self.reply_task.pause()
+
+    def send_reply_streams(self):
+        streams = self.reply_streams
+        while streams:
+            for chunk in streams.popleft():
+                self.send_encoded_line(chunk)
+                yield
+        self.reply_task = None
+
+    def pauseProducing(self):
+        """ Called by the transport when its buffer fills up because the client isn't reading fast enough. From here
+        on output is held instead, up to the SendQ of the client's connection class. """
+        self.producer_paused = True
+        if self.reply_task is not None:
+            self.reply_task.pause()
+        self.held_output_size = sum(len(x) for x in self.output)
+        if self.user_instance is not None and self.user_instance.operator:
+            self.sendq = self.config.UserSettings.OperatorSendQ
+        else:
+            self.sendq = self.config.UserSettings.SendQ
+        self.stats.increment("sendq_paused")
+
+    def resumeProducing(self):
+        """ Called by the transport once it has written its buffer out. Hand it everything held in the meantime. """
+        self.producer_paused = False
+        self.held_output_size = 0
+        if self.reply_task is not None:
+            self.reply_task.resume()
+        self.flush_output()
+
+    def stopProducing(self):
         pass
 
-    @min_param_count(1, "Usage: CHOPERS <channel> <None, Operator_Name> <None, Add, Delete, Password, Name> "
-                        "<New Name/New Password> - Manage a channel's operator accounts. "
-                        "Refer to COMMANDS.md for more information.")
-    def irc_CHOPERS(self, prefix, params):
-        """ Manages the operator accounts on a supplied channel. """
-        param_count = len(params)
-        if params[0] not in self.channels:
-            return self.sendLine(self.rplhelper.err_nosuchchannel())
-        target_channel = self.channels[params[0]]
-        target_operator = None
-        command = None
-        if param_count != 1:
-            target_operator = params[0]
-            if param_count >= 2:
-                command = params[1].lower()
-
-        command_method_dict = {
-            None: target_channel.get_operator,
-            "add": target_channel.add_operator,
-            "delete": target_channel.delete_operator,
-            "name": target_channel.set_operator_name,
-            "password": target_channel.set_operator_password
-        }
-
-        if target_operator is None:  # List all operator names on the channel
-            output = target_channel.get_operator(self.user_instance)
-        else:  # Manage a specific account/Add and Delete accounts
-            account_name = None
-            param = None
-            if command == "add" or command == "delete" or command is None:
-                if param_count >= 3:
-                    account_name = params[2]
-                method = command_method_dict.get(command)
-                output = method(self.user_instance, account_name)
-            else:  # Changing the name/password of an account, listing details pertaining to a specific account.
-                command = None
-                if param_count >= 2:
-                    account_name = params[1]
-                if param_count >= 3:  # Managing an account
-                    command = params[2]
+    def drop_sendq_exceeded(self):
+        """ Disconnect the client without waiting for the transport to write out its buffer, which it isn't
+        reading. Called by the outputflusher. """
+        self.stats.increment("sendq_exceeded")
+        self.transport.abortConnection()
+        self.quit(quit_reason=QuitReason.SENDQ_EXCEEDED)
+
+    def flush_output(self):
+        """ Write the queued lines to the transport as one string. """
+        output = self.output
+        if output:
+            self.output = []
+            data = output[0] if len(output) == 1 else b"".join(output)
+            self.stats.bytes_out += len(data)
+            self.transport.write(data)
+
+    def lose_connection(self):
+        """ Flush the queued lines before closing the connection, loseConnection only waits for the ones already
+        written to the transport. """
+        self.flush_output()
+        self.transport.loseConnection()
 
-                if command == "name" or command == "password":
-                    if param_count >= 4:
-                        param = params[3]
-                    method = command_method_dict.get(command)
-                    output = method(self.user_instance, account_name, param)
-                else:  # List account details
-                    output = target_channel.get_operator(self.user_instance, account_name)
-        return self.sendLine(output)
-
-    @rate_limiter("CHOWNER", 10)
-    @min_param_count(3, "Usage: CHOWNER <channel> <owner_name> <pass> - Logs in to the specified channel as an owner.")
-    def irc_CHOWNER(self, prefix, params):
-        if len(params) < 3:
-            self.sendLine(self.rplhelper.err_needmoreparams("CHOWNER"))
-        if params[0][0] != '#':
-            params[0] = '#' + params[2]
-        channel_name = params[0]
-        name = params[1]
-        password = params[2]
-        user = self.user_instance
-        if channel_name not in self.channels:
-            return self.sendLine(self.rplhelper.err_nosuchchannel())
-        self.sendLine(self.channels[channel_name].login_owner(name, password, user))
-
-    def irc_COMMANDS(self, prefix, params):
-        """ Not implemented - return a list of commands the server uses """
-        pass
+    def irc_unknown(self, prefix, command, params):
+        self.send_encoded_line(self.user_instance.err_unknowncommand(command))
@@ -1,72 +1,71 @@
-from time import time
-from copy import copy
+from time import monotonic
+from collections import OrderedDict
 
 
 class RateLimiter:
-    """ Store a dict of hosts which also have a dict of commands with the last time they called the command. """
-    def __init__(self):
-        self.limited_hosts = {}
-
-    def maintenance(self):
-        """ Clean up old entries in the dictionary (any hosts with commands who's last access time occurred more than
-         120 seconds ago will have said command removed from their record. If the host has no commands left after this
-         process, they are removed from the dictionary.)"""
-        limited_hosts_cached = copy(self.limited_hosts)
-        current_time = int(time())
-        for host in limited_hosts_cached:
-            for command in limited_hosts_cached[host]:
-                last_access_time = limited_hosts_cached[command]
-                if current_time - last_access_time >= 120:
-                    del self.limited_hosts[host][command]
-            if len(limited_hosts_cached[host]) == 0:
-                del self.limited_hosts[host]
-
-
-def rate_limiter(command, duration=5, output_error=True):
     """
-    A decorator which when applied to a command method that is called, will store the caller's
-    host in the dictionary of currently limited hosts. Subsequent calls to the method will
-    then compare the time of the current call to the previous call existing in the dictionary
-    for the given command, and if it passes, then the command will be processed as normally.
-    Otherwise, it will output a message if specified to.
-    Args:
-        command (str): The name of the command to map the method to. EG: if rate limiting nick, use NICK.
-        duration (int): How long should the host have to wait before being able to make another call.
-        output_error (bool): Whether or not to give the client the time remaining until he/she can make another call.
+    Keep a token bucket for every host + rate limited command pair. A bucket holds up to `calls` tokens, every call
+    takes one, and they refill at `calls` per `seconds`, so a host can make a short burst of calls but no more than
+    the configured rate over time.
+    Buckets are kept in order of last use. A bucket which hasn't been used for the longest configured period is full
+    again, which is no different from not having one, so expired buckets are always at the front and can be dropped
+    a few at a time without scanning the rest.
     """
-    def command_decorator(command_method):
-        def wrapper(*args):
-            assert duration <= 240
-            self = args[0]
-            caller_host = self.user_instance.host
-            limited_hosts = self.ratelimiter.limited_hosts
+    sweep_per_insert = 2  # Expired buckets dropped whenever a new one is made, keeps memory flat without maintenance.
+    sweep_per_step = 1000  # Expired buckets dropped per step of a maintenance job.
 
-            current_time = int(time())
-            limit_call = False
-            time_remaining = 0
+    def __init__(self, limits):
+        """
+        Args:
+            limits (dict): Maps command names to a (calls, seconds) tuple, as set in the RateLimitSettings section.
+        """
+        self.limits = {command.upper(): limit for command, limit in limits.items()}
+        self.max_period = max([seconds for calls, seconds in self.limits.values()], default=0)
+        self.buckets = OrderedDict()  # (host, command) -> [tokens, last_update]
 
-            if caller_host not in limited_hosts:
-                limited_hosts[caller_host] = {}
+    def consume(self, host, command):
+        """ Take a token from the host's bucket for the command. Returns 0 if the call is allowed, otherwise how many
+        seconds until it will be. """
+        if command not in self.limits:
+            return 0
+        calls, seconds = self.limits[command]
+        now = monotonic()
+        key = (host, command)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.sweep(self.sweep_per_insert, now)
+            bucket = self.buckets[key] = [calls, now]
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(calls, bucket[0] + (now - bucket[1]) * calls / seconds)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) * seconds / calls
+        bucket[0] -= 1
+        return 0
 
-            limited_commands = limited_hosts[caller_host]
+    def sweep(self, limit, now=None):
+        """ Drop up to `limit` buckets which have refilled. Returns how many were dropped. """
+        if now is None:
+            now = monotonic()
+        expired_before = now - self.max_period
+        buckets = self.buckets
+        dropped = 0
+        while dropped < limit and buckets:
+            key, bucket = next(iter(buckets.items()))
+            if bucket[1] > expired_before:
+                break
+            del buckets[key]
+            dropped += 1
+        return dropped
 
-            if command in limited_commands:
-                last_access_time = limited_commands[command]
-                elapsed_time = current_time - last_access_time
-                if elapsed_time <= duration:
-                    limit_call = True
-                    time_remaining = duration - elapsed_time
-                else:
-                    del limited_commands[command]
-            else:
-                limited_commands[command] = current_time
+    def maintenance(self, scheduler):
+        """ Clean up buckets which haven't been used in long enough to have refilled. Most are already dropped as new
+        ones are made; this catches the rest once the server goes quiet, as a job run by the MaintenanceScheduler.
+        Returns the job's Deferred. """
+        return scheduler.run("ratelimiter_sweep", self.sweep_batches())
 
-            if limit_call:
-                if output_error:
-                    return self.sendLine(self.rplhelper.err_noprivileges(
-                        "You are doing that too much. Please wait {} seconds and try again.".format(time_remaining)
-                    ))
-                return
-            return command_method(*args)
-        return wrapper
-    return command_decorator
+    def sweep_batches(self):
+        """ Sweep a batch of buckets per step until there are no expired ones left. """
+        while self.sweep(self.sweep_per_step) == self.sweep_per_step:
+            yield
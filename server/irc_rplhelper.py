@@ -1,108 +1,139 @@
 from twisted.words.protocols.irc import ERR_NOSUCHNICK, ERR_NOSUCHCHANNEL, ERR_UNKNOWNCOMMAND, ERR_UNKNOWNMODE, \
     ERR_NICKNAMEINUSE, ERR_NEEDMOREPARAMS, RPL_YOUREOPER, ERR_PASSWDMISMATCH, ERR_ERRONEUSNICKNAME, \
     ERR_USERSDONTMATCH, ERR_NOPRIVILEGES, ERR_BADCHANMASK, ERR_CANNOTSENDTOCHAN, ERR_NONICKNAMEGIVEN, \
-    ERR_NOTONCHANNEL, RPL_UNAWAY, RPL_UMODEIS, RPL_NOWAWAY, RPL_ENDOFWHO
+    ERR_NOTONCHANNEL, RPL_UNAWAY, RPL_UMODEIS, RPL_NOWAWAY, RPL_ENDOFWHO, RPL_STATSCOMMANDS, RPL_ENDOFSTATS, \
+    RPL_ENDOFNAMES, RPL_CHANNELMODEIS
+
+RPL_STATSDEBUG = "249"  # Not in Twisted, but the usual numeric for server-defined STATS reports.
+ERR_INVALIDMODEPARAM = "696"  # Not in Twisted either, the modern numeric for a mode argument which isn't valid.
+
+# The fixed text replies end with, already encoded. The ones with a parameter before them start from its space.
+YOUREOPER_TAIL = b" :You are now an IRC operator\r\n"
+NOWAWAY_TAIL = b" :You are now marked as being away\r\n"
+UNAWAY_TAIL = b" :You are no longer marked as being away\r\n"
+ENDOFWHO_TAIL = b" :End of /WHO list.\r\n"
+ENDOFNAMES_TAIL = b" :End of /NAMES list\r\n"
+ENDOFSTATS_TAIL = b" :End of /STATS report\r\n"
+BADCHANMASK_TAIL = b" :No wildcards in destination.\r\n"
+NOSUCHNICK_TAIL = b" :No such nick\r\n"
+NOSUCHCHANNEL_TAIL = b" :No such channel\r\n"
+UNKNOWNCOMMAND_TAIL = b" :Unknown Command\r\n"
+NEEDMOREPARAMS_TAIL = b" :Not enough parameters\r\n"
+PASSWDMISMATCH_TAIL = b" :Password Incorrect\r\n"
+NONICKNAMEGIVEN_TAIL = b" :No nickname given\r\n"
+NICKNAMEINUSE_TAIL = b" :Nickname is already in use\r\n"
+UNKNOWNMODE_TAIL = b" :Unknown Mode\r\n"
+USERSDONTMATCH_TAIL = b" :Cant change mode for other users\r\n"
 
 
 class RPLHelper:
     """
     This class is for implemented RPL/ERR responses for a user to receive.
-    Every user instance has an RPLHelper instance which generates responses
-    for him.
+    IRCUser inherits it, so the responses are generated from the user's own server_host and nickname without every
+    user having to carry a helper instance of its own.
+
+    Every reply starts with the same ":server NNN nickname" head for the user, which is built once per numeric and
+    kept in reply_heads until the user's nickname changes (see clear_reply_heads). The rest of the reply is a fixed,
+    already encoded tail, or the parameters encoded onto one. Replies are returned encoded and terminated, ready to
+    be queued with IRCProtocol.send_encoded_line; IRCProtocol.sendLine queues them as they are too.
 
     This is probably very unnecessary but it works fine, and it's
     pretty helpful for common err responses, so I'll keep it.
     """
-    def __init__(self, user_instance):
-        self.user_instance = user_instance
+    __slots__ = ["reply_heads"]
+
+    def reply_head(self, numeric):
+        """ The encoded ":server NNN nickname" for a numeric, or with a '*' for the nickname if it isn't set yet. """
+        heads = self.reply_heads
+        if heads is None:
+            heads = self.reply_heads = {}
+        head = heads.get(numeric)
+        if head is None:
+            head = heads[numeric] = ":{} {} {}".format(self.server_host, numeric, self.nickname or '*').encode("utf-8")
+        return head
+
+    def clear_reply_heads(self):
+        """ Called when the nickname changes, so the heads are built again with the new one. """
+        self.reply_heads = None
+
+    def reply(self, numeric, text):
+        """ A reply with a tail which isn't fixed. text is everything after the nickname, starting with its space. """
+        return self.reply_head(numeric) + text.encode("utf-8") + b"\r\n"
 
     def rpl_youreoper(self):
-        return ":{} {} {} :You are now an IRC operator".format(
-            self.user_instance.server_host, RPL_YOUREOPER, self.user_instance.nickname
-        )
+        return self.reply_head(RPL_YOUREOPER) + YOUREOPER_TAIL
 
     def rpl_nowaway(self):
-        return ":{} {} {} :You are now marked as being away".format(
-            self.user_instance.server_host, RPL_NOWAWAY, self.user_instance.nickname
-        )
+        return self.reply_head(RPL_NOWAWAY) + NOWAWAY_TAIL
 
     def rpl_unaway(self):
-        return ":{} {} {} :You are no longer marked as being away".format(
-            self.user_instance.server_host, RPL_UNAWAY, self.user_instance.nickname
-        )
+        return self.reply_head(RPL_UNAWAY) + UNAWAY_TAIL
 
     def rpl_umodeis(self, nick, modes):
-        return ":{} {} {} :{}'s modes are: +{}".format(
-            self.user_instance.server_host, RPL_UMODEIS, self.user_instance.nickname, nick, modes
-        )
+        return self.reply(RPL_UMODEIS, " :{}'s modes are: +{}".format(nick, "".join(modes)))
+
+    def rpl_channelmodeis(self, channel, modes, arguments):
+        return self.reply(RPL_CHANNELMODEIS, " {} +{}".format(channel, " ".join([modes] + arguments)))
 
     def rpl_endofwho(self, channel):
-        return ":{} 315 {} {} :End of /WHO list.".format(
-            self.user_instance.server_host, RPL_ENDOFWHO, self.user_instance.nickname, channel
-        )
+        return self.reply_head(RPL_ENDOFWHO) + b" " + channel.encode("utf-8") + ENDOFWHO_TAIL
+
+    def rpl_endofnames(self, channel):
+        return self.reply_head(RPL_ENDOFNAMES) + b" " + channel.encode("utf-8") + ENDOFNAMES_TAIL
+
+    def server_notice(self, text):
+        return self.reply("NOTICE", " :" + text)
 
-    def err_notonchannel(self, description):
-        return ":{} {} {} :{}".format(
-            self.user_instance.server_host, ERR_NOTONCHANNEL, self.user_instance.nickname, description
-        )
+    def rpl_statscommands(self, command, count, description):
+        return self.reply(RPL_STATSCOMMANDS, " {} {} 0 0 :{}".format(command, count, description))
 
-    def err_nonicknamegiven(self, description):
-        return ":{} {} :{}".format(self.user_instance.server_host, ERR_NONICKNAMEGIVEN, description)
+    def rpl_statsdebug(self, query, description):
+        return self.reply(RPL_STATSDEBUG, " {} :{}".format(query, description))
+
+    def rpl_endofstats(self, query):
+        return self.reply_head(RPL_ENDOFSTATS) + b" " + query.encode("utf-8") + ENDOFSTATS_TAIL
+
+    def err_notonchannel(self, channel, description):
+        return self.reply(ERR_NOTONCHANNEL, " {} :{}".format(channel, description))
+
+    def err_nonicknamegiven(self):
+        return self.reply_head(ERR_NONICKNAMEGIVEN) + NONICKNAMEGIVEN_TAIL
 
     def err_badchanmask(self, destination):
-        return ":{} {} {} {} :No wildcards in destination..".format(
-            self.user_instance.server_host, ERR_BADCHANMASK, self.user_instance.nickname, destination
-        )
+        return self.reply_head(ERR_BADCHANMASK) + b" " + destination.encode("utf-8") + BADCHANMASK_TAIL
 
     def err_cannotsendtochan(self, destination, reason):
-        return ":{} {} {} {} :{}".format(
-            self.user_instance.server_host, ERR_CANNOTSENDTOCHAN, self.user_instance.nickname, destination, reason
-        )
+        return self.reply(ERR_CANNOTSENDTOCHAN, " {} :{}".format(destination, reason))
 
-    def err_nosuchnick(self):
-        return ":{} {} {} :No such nick".format(
-            self.user_instance.server_host, ERR_NOSUCHNICK, self.user_instance.nickname
-        )
+    def err_nosuchnick(self, nickname):
+        return self.reply_head(ERR_NOSUCHNICK) + b" " + nickname.encode("utf-8") + NOSUCHNICK_TAIL
 
-    def err_nosuchchannel(self):
-        return ":{} {} {} :No such channel".format(
-            self.user_instance.server_host, ERR_NOSUCHCHANNEL, self.user_instance.nickname
-        )
+    def err_nosuchchannel(self, channel):
+        return self.reply_head(ERR_NOSUCHCHANNEL) + b" " + channel.encode("utf-8") + NOSUCHCHANNEL_TAIL
 
     def err_unknowncommand(self, command):
-        return ":{} {} {} {} :Unknown Command".format(
-            self.user_instance.server_host, ERR_UNKNOWNCOMMAND, self.user_instance.nickname, command
-        )
+        return self.reply_head(ERR_UNKNOWNCOMMAND) + b" " + command.encode("utf-8") + UNKNOWNCOMMAND_TAIL
 
     def err_needmoreparams(self, command):
-        return ":{} {} {} {} :Not enough parameters".format(
-            self.user_instance.server_host, ERR_NEEDMOREPARAMS, self.user_instance.nickname, command
-        )
+        return self.reply_head(ERR_NEEDMOREPARAMS) + b" " + command.encode("utf-8") + NEEDMOREPARAMS_TAIL
 
     def err_passwordmismatch(self):
-        return ":{} {} {} :Password Incorrect".format(
-            self.user_instance.server_host, ERR_PASSWDMISMATCH, self.user_instance.nickname
-        )
+        return self.reply_head(ERR_PASSWDMISMATCH) + PASSWDMISMATCH_TAIL
 
     def err_erroneousnickname(self, bad_nickname, error_desc):
-        return ":{} {} * {} :{}".format(self.user_instance.server_host, ERR_ERRONEUSNICKNAME, bad_nickname, error_desc)
+        return self.reply(ERR_ERRONEUSNICKNAME, " {} :{}".format(bad_nickname, error_desc))
 
     def err_nicknameinuse(self, inuse_nickname):
-        return ":{} {} * {} :Nickname is already in use".format(
-            self.user_instance.server_host, ERR_NICKNAMEINUSE, inuse_nickname
-        )
+        return self.reply_head(ERR_NICKNAMEINUSE) + b" " + inuse_nickname.encode("utf-8") + NICKNAMEINUSE_TAIL
+
+    def err_invalidmodeparam(self, target, mode_char, argument, description):
+        return self.reply(ERR_INVALIDMODEPARAM, " {} {} {} :{}".format(target, mode_char, argument, description))
 
     def err_unknownmode(self):
-        return ":{} {} {} :Unknown Mode".format(
-            self.user_instance.server_host, ERR_UNKNOWNMODE, self.user_instance.nickname
-        )
+        return self.reply_head(ERR_UNKNOWNMODE) + UNKNOWNMODE_TAIL
 
-    def err_usersdontmatach(self, mode):
-        return ":{} {} {} {} :Cant change mode for other users".format(
-            self.user_instance.server_host, ERR_USERSDONTMATCH, self.user_instance.nickname, mode
-        )
+    def err_usersdontmatch(self):
+        return self.reply_head(ERR_USERSDONTMATCH) + USERSDONTMATCH_TAIL
 
     def err_noprivileges(self, error="You're not an IRC operator"):
-        return ":{} {} {} :Permission Denied - {}".format(
-            self.user_instance.server_host, ERR_NOPRIVILEGES, self.user_instance.nickname, error
-        )
+        return self.reply(ERR_NOPRIVILEGES, " :Permission Denied - {}".format(error))
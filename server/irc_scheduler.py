@@ -0,0 +1,83 @@
+from twisted.internet import reactor
+from twisted.internet.task import Cooperator
+from twisted.python.failure import Failure
+from time import perf_counter
+
+
+class MaintenanceJob:
+    """ One piece of bulk maintenance work being run by the MaintenanceScheduler. """
+    __slots__ = ["name", "size", "done"]
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size  # How many steps the job takes, if known up front.
+        self.done = 0
+
+
+class MaintenanceScheduler:
+    """
+    Runs bulk maintenance work, such as expiring channels or sweeping the rate limiter, a slice at a time instead of
+    in one go. A job is an iterator which does a bounded piece of work, eg. handling one channel, every time it's
+    advanced. Every reactor iteration, the jobs are advanced in turn until budget seconds have passed, and then the
+    reactor gets to handle the clients' I/O before the next slice, so however much maintenance there is to do, clients
+    are never held up for much longer than the budget. Long replies are streamed to clients in the same slices.
+    """
+    def __init__(self, budget, stats, clock=reactor):
+        """
+        Args:
+            budget (float): Seconds of work to do per reactor iteration. At least one step is run per iteration.
+            stats (ServerStats): Where the jobs' progress and backlog are reported.
+        """
+        self.budget = budget
+        self.stats = stats
+        self.clock = clock
+        self.jobs = []
+        self.cooperator = Cooperator(terminationPredicateFactory=self.slice_predicate, scheduler=self.schedule_slice)
+        stats.add_gauge("maintenance_jobs", lambda: len(self.jobs))
+        stats.add_gauge("maintenance_backlog", self.backlog)
+
+    def slice_predicate(self):
+        """ Made by the Cooperator at the start of every slice, and asked after every step whether it's over. """
+        slice_end = perf_counter() + self.budget
+        return lambda: perf_counter() >= slice_end
+
+    def schedule_slice(self, run_slice):
+        """ Run the next slice on the next reactor iteration, after the I/O the current one has waiting. """
+        return self.clock.callLater(0, run_slice)
+
+    def cooperate(self, steps):
+        """ Run an iterator in the same slices as the jobs, without counting it as maintenance. Used for streaming
+        long replies to clients. Returns its CooperativeTask. """
+        return self.cooperator.cooperate(steps)
+
+    def backlog(self):
+        """ How many steps the running jobs which know their size have left. """
+        return sum(job.size - job.done for job in self.jobs if job.size is not None)
+
+    def run(self, name, steps, size=None):
+        """
+        Start running a job. Returns a Deferred which fires once it's finished.
+        Args:
+            name (str): What the job's steps are counted under in the stats, as maintenance_<name>_steps.
+            steps (iterable): Does a step of the job every time it's advanced.
+            size (int): How many steps there are, if known, for the backlog.
+        """
+        job = MaintenanceJob(name, size)
+        self.jobs.append(job)
+        deferred = self.cooperator.coiterate(self.count_steps(job, steps))
+        deferred.addBoth(self.job_finished, job)
+        return deferred
+
+    @staticmethod
+    def count_steps(job, steps):
+        for step in steps:
+            job.done += 1
+            yield step
+
+    def job_finished(self, result, job):
+        """ A job which fails is dropped, the same as a LoopingCall which fails would have been stopped. """
+        self.jobs.remove(job)
+        self.stats.increment("maintenance_{}_steps".format(job.name), job.done)
+        if isinstance(result, Failure):
+            print("Maintenance job {} failed after {} steps: {}".format(job.name, job.done, result.value))
+            self.stats.increment("maintenance_failures")
@@ -1,40 +1,116 @@
-from twisted.internet.protocol import Factory
+from twisted.internet.protocol import Factory, Protocol
 from server.irc_protocol.protocol import IRCProtocol
 from server.irc_ratelimiter import RateLimiter
 from server.irc_clientlimiter import ClientLimiter
+from server.irc_acceptthrottle import AcceptThrottle
 from server.irc_ping_manager import PingManager
 from server.irc_channelmanager import ChannelManager
+from server.irc_protocol.command_manager import CommandManager
+from server.irc_protocol.output import OutputFlusher
+from server.irc_stats import ServerStats
+from server.irc_profiler import SamplingProfiler
+from server.irc_scheduler import MaintenanceScheduler
+from server.irc_bus.worker import WorkerBus
+from server.irc_journal import ChannelJournal
 from collections import OrderedDict
+from os import path
+
+
+class RefusedClient(Protocol):
+    """ Stands in for the IRCProtocol of a connection the acceptthrottle or clientlimiter refused. It tells the client
+    why and hangs up, without anything being allocated for it on the server's side. """
+    too_many_clients = b"ERROR :You have too many clients connected to the server.\r\n"
+    throttled = b"ERROR :Too many connections from your network, try again later.\r\n"
+
+    def __init__(self, refused_line):
+        self.refused_line = refused_line
+
+    def connectionMade(self):
+        self.transport.write(self.refused_line)
+        self.transport.loseConnection()
 
 
 class ChatServer(Factory):
-    def __init__(self, config):
+    def __init__(self, config, worker_id=None):
+        """ If a worker_id is given, this server is one of several worker processes and keeps its users and channels
+        consistent with the other workers through a WorkerBus. """
         self.config = config
         self.users = OrderedDict()
+        self.nicknames = {}  # nickname -> IRCUser, kept in sync by IRCUser.set_nickname and IRCProtocol.
         self.channels = OrderedDict()
-        self.ratelimiter = RateLimiter()
-        self.clientlimiter = ClientLimiter()
-        self.pingmanager = PingManager(self.users)
-        self.channelmanager = ChannelManager(self.channels, self.config.MaintenanceSettings.ChannelUltimatum)
+        rate_limit_settings = self.config.RateLimitSettings
+        self.ratelimiter = RateLimiter({x: getattr(rate_limit_settings, x) for x in rate_limit_settings.options})
+        user_settings = self.config.UserSettings
+        self.clientlimiter = ClientLimiter(user_settings.MaxClients, user_settings.IPv4ClientPrefix,
+                                           user_settings.IPv6ClientPrefix, user_settings.ClientLimitExemptions)
+        self.pingmanager = PingManager(self.config.ServerSettings.PingInterval * 60)
+        self.journal = None
+        if self.config.MaintenanceSettings.FlushInterval != 0:
+            journal_directory = self.config.MaintenanceSettings.FlushDirectory
+            if worker_id is not None:  # Every worker saves the channels it knows about on its own.
+                journal_directory = path.join(journal_directory, "worker-{}".format(worker_id))
+            self.journal = ChannelJournal(journal_directory)
+        self.channelmanager = ChannelManager(self.channels, self.config.MaintenanceSettings.ChannelUltimatum,
+                                             self.journal, self.config.UserSettings.SlowFloodRate)
+        self.commandmanager = CommandManager(self.config.ServerSettings.CommandCategories)
+        self.stats = ServerStats()
+        self.stats.add_commands(self.commandmanager.commands)
+        self.stats.add_gauge("users", lambda: len(self.users))
+        self.stats.add_gauge("channels", lambda: len(self.channels))
+        self.stats.add_gauge("pings_outstanding", self.pingmanager.pings_outstanding)
+        self.stats.add_gauge("ratelimiter_entries", lambda: len(self.ratelimiter.buckets))
+        self.stats.add_gauge("clientlimiter_prefixes", lambda: len(self.clientlimiter.client_prefixes))
+        self.acceptthrottle = AcceptThrottle(user_settings.AcceptRate, user_settings.SubnetAcceptRate,
+                                             user_settings.IPv4AcceptSubnet, user_settings.IPv6AcceptSubnet, self.stats)
+        self.outputflusher = OutputFlusher(self.stats)
+        self.maintenance = MaintenanceScheduler(self.config.MaintenanceSettings.MaintenanceSliceBudget / 1000,
+                                                self.stats)
+        self.profiler = SamplingProfiler(
+            self.config.ServerSettings.ProfileDirectory,
+            ["maintenance_delete_old_channels", "maintenance_ratelimiter", "maintenance_flush_server", "do_pings",
+             "expire_channels", "sweep_batches"],
+            "profile" if worker_id is None else "profile-worker-{}".format(worker_id)
+        )
+        self.bus = None
+        if worker_id is not None:
+            self.bus = WorkerBus(worker_id, self.nicknames, self.channels, self.channelmanager)
+
+    def restore_state(self):
+        """ Reload the channels saved by previous runs. Returns how many were restored. """
+        if self.journal is None:
+            return 0
+        return self.channelmanager.restore_channels(self.bus)
 
     def maintenance_delete_old_channels(self):
         """ This method gets called every x amount of days as defined in crow.ini. The purpose of it is to DELETE
         channels which have not had someone login to the owner account for the past y amount of days. """
-        self.channelmanager.channel_maintenance()
+        self.channelmanager.channel_maintenance(self.maintenance)
 
     def maintenance_ratelimiter(self):
-        """ Clear old entries in the ratelimiter dictionary. """
-        self.ratelimiter.maintenance()
+        """ Clear old entries in the ratelimiter. """
+        self.ratelimiter.maintenance(self.maintenance)
 
     def maintenance_flush_server(self):
-        """ This method gets called every x minutes as defined in crow.ini The purpose of it is to save current
-        channels and their modes, owner details, oper details, and banlists to the server which will be reloaded on
-        server restart. """
-        pass
+        """ This method gets called every x hours as defined in crow.ini. Channel changes are journaled as they
+        happen; this compacts the journal into a new snapshot so restoring stays fast. Banlists are not saved yet. """
+        if self.journal is not None:
+            self.journal.snapshot()
 
     def do_pings(self):
+        """ Called every PingManager.tick_length seconds to ping idle clients and time out unresponsive ones. """
         self.pingmanager.ping_users()
 
     def buildProtocol(self, addr):
-        return IRCProtocol(self.users, self.channels, self.config, self.ratelimiter,
-                           self.clientlimiter, self.pingmanager, self.channelmanager)
+        """ Connections from a subnet over its accept rate, or from a network prefix which already has as many
+        clients as it's allowed, are refused here, before an IRCProtocol and the user instance and everything else
+        that goes with it are made for them. """
+        if not self.acceptthrottle.allow(addr.host):
+            return RefusedClient(RefusedClient.throttled)
+        if not self.clientlimiter.add_entry(addr.host):
+            self.stats.increment("clients_refused")
+            return RefusedClient(RefusedClient.too_many_clients)
+        client_protocol = IRCProtocol(self.users, self.nicknames, self.channels, self.config, self.ratelimiter,
+                                      self.clientlimiter, self.pingmanager, self.channelmanager, self.commandmanager,
+                                      self.outputflusher, self.stats, self.profiler, self.maintenance, self.bus)
+        client_protocol.client_host = addr.host  # Counted under this by the clientlimiter until connectionLost.
+        return client_protocol
@@ -0,0 +1,131 @@
+from twisted.web.resource import Resource
+from twisted.internet import reactor
+from collections import Counter
+from bisect import bisect_left
+from time import perf_counter
+
+# The upper bounds, in seconds, of the buckets every command's handler time is counted into. Anything slower goes in
+# an overflow bucket after the last one.
+LATENCY_BUCKETS = [0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0]
+COMMAND_SAMPLE_INTERVAL = 0.1  # Seconds. Command handlers are timed for one reactor iteration this often.
+
+
+def timed_handler(handler, histogram):
+    """ Wrap a command handler so every call to it is timed into the histogram. """
+    def timed(protocol, prefix, params):
+        start = perf_counter()
+        handler(protocol, prefix, params)
+        histogram.observe(perf_counter() - start)
+    return timed
+
+
+class CommandHistogram:
+    """ How many times a command was handled, and how long the handler took in fixed buckets. """
+    __slots__ = ["counts", "total_seconds"]
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total_seconds = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total_seconds += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, fraction):
+        """ The upper bound of the bucket the quantile falls in, or None if it's in the overflow bucket. """
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else None
+        return None
+
+
+class ServerStats:
+    """ Counts server-wide events worth keeping an eye on, such as clients being dropped for exceeding their SendQ,
+    times a sample of the command handlers' calls, and reads the gauges the server registers when asked for a
+    report. """
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self.counters = Counter()
+        self.commands = {}  # command -> CommandHistogram
+        self.dispatch_table = None  # The CommandManager's, see add_commands.
+        self.plain_entries = {}  # command -> its CommandEntry as it is
+        self.timed_entries = {}  # command -> a copy of its CommandEntry whose handler is timed
+        self.gauges = {}  # name -> callable returning the current value
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def increment(self, name, amount=1):
+        self.counters[name] += amount
+
+    def add_commands(self, dispatch_table):
+        """ Make a histogram for each command in the dispatch table, and a copy of its entry which times its handler
+        into it, for sample_commands to swap in. """
+        self.dispatch_table = dispatch_table
+        for command, entry in dispatch_table.items():
+            histogram = self.commands.setdefault(command, CommandHistogram())
+            self.plain_entries[command] = entry
+            self.timed_entries[command] = entry._replace(handler=timed_handler(entry.handler, histogram))
+
+    def sample_commands(self):
+        """ Time every command handled until the next reactor iteration, by swapping the timed entries into the
+        dispatch table and back. Called every COMMAND_SAMPLE_INTERVAL, so the histograms are of the calls made in a
+        sample of reactor iterations, and the calls made in the others aren't slowed down by timing at all. """
+        self.dispatch_table.update(self.timed_entries)
+        self.clock.callLater(0, self.dispatch_table.update, self.plain_entries)
+
+    def add_gauge(self, name, value_function):
+        self.gauges[name] = value_function
+
+    def gauge_values(self):
+        values = {name: value_function() for name, value_function in self.gauges.items()}
+        values["bytes_in"] = self.bytes_in
+        values["bytes_out"] = self.bytes_out
+        return values
+
+    def prometheus_text(self):
+        """ Everything in the Prometheus text exposition format. """
+        lines = [
+            "# HELP crow_command_seconds Time spent in each command's handler.",
+            "# TYPE crow_command_seconds histogram"
+        ]
+        for command, histogram in sorted(self.commands.items()):
+            if not histogram.count:
+                continue
+            cumulative = 0
+            for upper_bound, bucket_count in zip(LATENCY_BUCKETS + ["+Inf"], histogram.counts):
+                cumulative += bucket_count
+                lines.append('crow_command_seconds_bucket{{command="{}",le="{}"}} {}'.format(
+                    command, upper_bound, cumulative))
+            lines.append('crow_command_seconds_sum{{command="{}"}} {}'.format(command, histogram.total_seconds))
+            lines.append('crow_command_seconds_count{{command="{}"}} {}'.format(command, cumulative))
+        lines.append("# TYPE crow_events_total counter")
+        for name, value in sorted(self.counters.items()):
+            lines.append('crow_events_total{{event="{}"}} {}'.format(name, value))
+        for name, value in sorted(self.gauge_values().items()):
+            if name.startswith("bytes_"):  # Only ever go up, unlike the gauges.
+                lines.append("# TYPE crow_{}_total counter".format(name))
+                lines.append("crow_{}_total {}".format(name, value))
+            else:
+                lines.append("# TYPE crow_{} gauge".format(name))
+                lines.append("crow_{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsResource(Resource):
+    """ Serves a ServerStats instance to Prometheus. Only ever listened on localhost, see MetricsPort in crow.ini. """
+    isLeaf = True
+
+    def __init__(self, stats):
+        Resource.__init__(self)
+        self.stats = stats
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return self.stats.prometheus_text().encode("utf-8")
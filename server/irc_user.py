@@ -1,28 +1,38 @@
+from twisted.words.protocols.irc import lowQuote
 from time import time
 from utils.irc_random_nick_generation import generate_random_nick
+from utils.irc_casemapping import irc_lower
+from server.irc_rplhelper import RPLHelper
 
 
-class IRCUser:
+class IRCUser(RPLHelper):
+    """ One per connected client. It and RPLHelper, its only base, are both slotted, so a user carries no __dict__ at
+    all. The RPL/ERR responses come from RPLHelper. """
     illegal_characters = set(".<>'`()?*#+-")
     valid_modes = ["o"]
+    __slots__ = ["protocol", "__username", "__nickname", "key", "realname", "sign_on_time", "last_msg_time", "host",
+                 "__hostmask_nickname", "__hostmask", "__prefix", "channels", "nickattempts", "nick_length",
+                 "user_length", "server_host", "modes", "status", "operator"]  # And RPLHelper's reply_heads.
 
     def __init__(self, protocol, username, nickname, realname, sign_on_time, last_msg_time, host, hostmask, channels,
-                 nickattempts, nick_length, user_length, rplhelper, serverhost):
+                 nickattempts, nick_length, user_length, serverhost):
         self.protocol = protocol
         self.__username = username
         self.__nickname = nickname
+        self.key = None if nickname is None else irc_lower(nickname)  # What the nickname index has them under.
         self.realname = realname
         self.sign_on_time = sign_on_time
         self.last_msg_time = last_msg_time
         self.host = host
+        self.__hostmask_nickname = None
         self.__hostmask = hostmask
+        self.__prefix = None if hostmask is None else ":{}".format(hostmask).encode("utf-8")
         self.channels = channels
         self.nickattempts = nickattempts
         self.nick_length = nick_length
         self.user_length = user_length
-        self.rplhelper = rplhelper
-        self.rplhelper.user_instance = self
         self.server_host = serverhost
+        self.reply_heads = None
         self.modes = []
         self.status = "H"
         self.operator = False  # ToDo: Rename this
@@ -36,23 +46,19 @@ class IRCUser:
     def hostmask(self):
         return self.__hostmask
 
-    def set_hostmask(self, nickname=None, username=None):
-        nickname_part = '*'
-        username_part = '*'
-        host_part = self.host
-
-        if username is None:  # Called by nickname setter - self.username MAY be None depending on if hostmask was set.
-            nickname_part = nickname
-            if self.__hostmask is not None:  # Hostmask exists, so check if the username in the hostmask was set.
-                if self.__hostmask.split('@')[0].split('!')[1] != '*':  # Username in hostmask was set. Preserve it.
-                    username_part = self.username
-
-        if nickname is None:  # Called by username setter
-            username_part = self.username  # The username setter sets the username before calling, so this exists.
-            if self.__hostmask is not None:  # The nickname exists, and will be preserved.
-                nickname_part = self.__hostmask.split("!")[0]
+    @property
+    def prefix(self):
+        """ The encoded ":nick!user@host" every line sent on behalf of this user starts with. """
+        return self.__prefix
 
-        self.__hostmask = "{}!{}@{}".format(nickname_part, username_part, host_part)
+    def set_hostmask(self, nickname=None):
+        """ The hostmask is kept as its parts: the nickname given here, the username and the host. The hostmask and
+        its encoded prefix are built again when one of them changes, rather than for every line they are sent in. A
+        part which hasn't been set yet is a '*'. """
+        if nickname is not None:
+            self.__hostmask_nickname = nickname
+        self.__hostmask = "{}!{}@{}".format(self.__hostmask_nickname or '*', self.__username or '*', self.host)
+        self.__prefix = ":{}".format(self.__hostmask).encode("utf-8")
 
     @property
     def username(self):
@@ -70,18 +76,44 @@ class IRCUser:
             raise ValueError("***Illegal Characters in Username.***")
         else:
             self.__username = username
-            self.set_hostmask(username=username)
+            self.set_hostmask()
 
     @property
     def nickname(self):
         return self.__nickname
 
+    def __update_nickname(self, nickname, nicknames):
+        """ Set the nickname and hostmask and swap the nickname in the server's nickname index in one step, so the
+        index never holds a stale entry for this user. """
+        old_nickname = self.__nickname
+        if old_nickname is not None and nicknames.get(self.key) is self:
+            del nicknames[self.key]
+        self.key = irc_lower(nickname)
+        nicknames[self.key] = self
+        self.__nickname = nickname
+        self.set_hostmask(nickname=nickname)
+        self.clear_reply_heads()
+        if self.protocol.bus is not None:
+            self.protocol.bus.publish_nick(self, old_nickname)
+
+    def release_nickname(self):
+        """ Unmap this user's nickname from the server's nickname index. Called when the user leaves the server. """
+        nicknames = self.protocol.nicknames
+        if self.__nickname is not None and nicknames.get(self.key) is self:
+            del nicknames[self.key]
+            if self.protocol.bus is not None:
+                self.protocol.bus.publish_release(self.__nickname)
+
     def set_nickname(self, desired_nickname, in_use_nicknames):
         """
         Handle first nickname set on client connection + subsequent nickname changes. If the desired nickname is the
         nickname the client is already using, then nothing will occur.
         Keep track of how many times a client has attempted to change their nickname if a nick collision occurs
         the first time they connect. If they try twice, then generate a nickname for theme.
+        Args:
+            desired_nickname (str): The nickname the client asked for.
+            in_use_nicknames (dict): The server's nickname index (canonical nickname -> IRCUser). It is updated
+            here whenever the nickname changes.
         """
         if self.hostmask is None or '*' in self.hostmask:
             self.set_hostmask(nickname=desired_nickname)
@@ -89,20 +121,19 @@ class IRCUser:
         if self.nickname is not None and desired_nickname == self.nickname:
             return
 
-        # Make sure it's not in use.
-        if desired_nickname in in_use_nicknames:
+        # Make sure it's not in use. Changing the case of their own nickname is fine.
+        if in_use_nicknames.get(irc_lower(desired_nickname), self) is not self:
             # The user instance has no nickname. This is the case on initial connection.
             if self.nickname is None:
                 if self.nickattempts != 2:
                     self.nickattempts += 1
-                    return self.rplhelper.err_nicknameinuse(desired_nickname)
+                    return self.err_nicknameinuse(desired_nickname)
                 # After giving them two tries to change it, generate one for them.
                 randomized_nick = generate_random_nick(
                     self.protocol, in_use_nicknames, self.illegal_characters, self.nick_length
                 )
                 previous_hostmask = self.hostmask  # Store this since it's going to be changed
-                self.__nickname = randomized_nick
-                self.set_hostmask(nickname=randomized_nick)
+                self.__update_nickname(randomized_nick, in_use_nicknames)
                 self.nickattempts = 0
                 return "Nickname attempts exceeded(2). A random nickname was generated for you." \
                        "\n:{} NICK {}".format(previous_hostmask, randomized_nick)
@@ -112,59 +143,85 @@ class IRCUser:
         # If it's not in use, make sure it's a valid nickname.
         error = None
         if len(desired_nickname) > self.nick_length:
-            error = ":Erroneous Nickname - Exceeded max char limit {}".format(self.nick_length)
+            error = "Erroneous Nickname - Exceeded max char limit {}".format(self.nick_length)
         if any((c in self.illegal_characters) for c in desired_nickname):
-            error = ":Erroneous Nickname - Illegal characters"
+            error = "Erroneous Nickname - Illegal characters"
         if error is not None:
             if self.nickname is None:
                 self.nickattempts += 1
-                return self.rplhelper.err_erroneousnickname(desired_nickname, error)
+                return self.err_erroneousnickname(desired_nickname, error)
             return self.notice(error, desired_nickname)
 
         # Check if they're renaming themselves, return rename_notice and also tell all the channels they're in.
         output = None
         if self.nickname is not None and self.nickname != desired_nickname or self.nickattempts != 0:
-            if self.channels is not None:  # Send rename notice to any channels they're in
+            if self.channels:  # Send the rename notice once to everyone in the channels they're in.
                 for connected_channel in self.channels:
-                    connected_channel.rename_user(self, desired_nickname)
+                    connected_channel.rename_user(self)
+                self.broadcast_to_neighbours(" NICK " + desired_nickname)
             if self.nickattempts != 0 and self.nickname is None:  # This nickname is valid
                 self.nickattempts = 0  # so set nickattempts to 0
             output = ":{} NICK {}".format(self.hostmask, desired_nickname)  # Tell them it was accepted.
 
-        self.__nickname = desired_nickname
-        self.set_hostmask(nickname=desired_nickname)
+        self.__update_nickname(desired_nickname, in_use_nicknames)
         return output
 
+    def neighbours(self):
+        """ The users connected to this worker who share at least one channel with this user, each of them once, not
+        including this user. Used as an ordered set, values are unused. """
+        neighbours = {}
+        for channel in self.channels:
+            neighbours.update(channel.users)
+        neighbours.pop(self, None)
+        return neighbours
+
+    def broadcast_to_neighbours(self, text):
+        """ Send a line on behalf of this user, such as a QUIT or NICK, to each of their neighbours once no matter how
+        many channels they share. Sibling workers are sent the line once too, with the channels it's for, and do the
+        same for their members of them. """
+        line = self.prefix + text.encode("utf-8") + b"\r\n"
+        for neighbour in self.neighbours():
+            neighbour.protocol.send_encoded_line(line)
+        if self.protocol.bus is not None:
+            remote_channels = [x.channel_name for x in self.channels if x.remote_users]
+            if remote_channels:
+                self.protocol.bus.publish_neighbours_line(remote_channels, line[:-2].decode("utf-8"))
+
     def send_msg(self, destination, message):
         """ Determine if a client is sending a message to a channel or user and handle appropriately. """
         if '*' in destination or '?' in destination:
-            return self.rplhelper.err_badchanmask(destination)
+            return self.err_badchanmask(destination)
         elif destination[0] == '#':
-            if destination not in self.protocol.channels:
-                return self.rplhelper.err_nosuchchannel()
-            if self not in self.protocol.channels[destination].users:
-                return self.rplhelper.err_cannotsendtochan(destination, "Cannot send to channel you are not in.")
-            else:
-                self.protocol.channels[destination].broadcast_message(message, self.hostmask)
-                self.last_msg_time = time()
+            channel = self.protocol.channels.get(irc_lower(destination))
+            if channel is None:
+                return self.err_nosuchchannel(destination)
+            if self not in channel.users:
+                return self.err_cannotsendtochan(destination, "Cannot send to channel you are not in.")
+            wait = channel.consume_line(self)  # Before the line costs a write to every member.
+            if wait:
+                self.protocol.stats.increment("slow_flood_refused")
+                return self.err_cannotsendtochan(
+                    destination, "Slow flood limit (+S) reached, wait {:.1f} seconds.".format(wait))
+            channel.broadcast_message(message, self)
+            self.last_msg_time = time()
         else:
-            for i in self.protocol.users:
-                destination_user = self.protocol.users.get(i)
-                destination_user_protocol = destination_user.protocol
-                destination_user_nickname = destination_user.nickname
-                if destination_user_protocol == destination_user_protocol and destination_user_nickname == destination:
-                    destination_user_protocol.privmsg(self.hostmask, destination, message)
-                    self.last_msg_time = time()
-            return self.rplhelper.err_nosuchnick()
+            destination_user = self.protocol.nicknames.get(irc_lower(destination))
+            if destination_user is None:
+                return self.err_nosuchnick(destination)
+            destination_user.protocol.send_encoded_line(b"".join((
+                self.prefix, b" PRIVMSG ", destination_user.nickname.encode("utf-8"), b" :", lowQuote(message).encode("utf-8"),
+                b"\r\n"
+            )))
+            self.last_msg_time = time()
 
     def away(self, reason):
         """ Mark a user as either away or unaway. If supplying no reason, assume they are marking as unaway. """
         if reason is None:
             self.status = 'H'
-            return self.rplhelper.rpl_unaway()
+            return self.rpl_unaway()
         else:
             self.status = 'G'
-            return self.rplhelper.rpl_nowaway()
+            return self.rpl_nowaway()
 
     def set_mode(self, mode, accessor_nickname=None, accessor_is_operator=None):
         """ Handle a request to change a user's mode. Do not allow duplicate modes. Make sure it's valid. Make sure
@@ -178,16 +235,16 @@ class IRCUser:
         changing_own_modes = accessor_nickname == self.nickname
 
         if mode_char not in self.valid_modes:
-            return self.rplhelper.err_unknownmode()
+            return self.err_unknownmode()
 
         if not changing_own_modes and not accessor_is_operator:
-            return self.rplhelper.err_noprivileges("You can not affect someone else's modes.")
+            return self.err_noprivileges("You can not affect someone else's modes.")
 
         if mode_char == "o":
             if not accessor_is_operator:
-                return self.rplhelper.err_noprivileges()
+                return self.err_noprivileges()
             if not changing_own_modes:
-                return self.rplhelper.err_noprivileges("You can not change someone else's operator flag.")
+                return self.err_noprivileges("You can not change someone else's operator flag.")
             if "o" not in self.modes:
                 self.modes.append("o")
                 return mode_change_message
@@ -212,8 +269,8 @@ class IRCUser:
             accessor_is_operator = self.operator
         checking_own_modes = accessor_nickname == self.nickname
         if not checking_own_modes and not accessor_is_operator:
-            return self.rplhelper.err_noprivileges("You do not have permission to check someone else's modes.")
-        return self.rplhelper.rpl_umodeis(self.nickname, self.modes)
+            return self.err_noprivileges("You do not have permission to check someone else's modes.")
+        return self.rpl_umodeis(self.nickname, self.modes)
 
     def notice(self, message, nick=None, send=False):
         """ Send a notice to this user. """
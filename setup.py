@@ -24,7 +24,7 @@ setup(
     ],
 
     keywords='twisted twisted-irc irc-server',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'bench']),
 
     install_requires=['twisted, sentryconfig'],
 
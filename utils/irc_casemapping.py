@@ -0,0 +1,15 @@
+from string import ascii_uppercase, ascii_lowercase
+
+CASEMAPPING = "rfc1459"  # As advertised in RPL_ISUPPORT.
+
+# RFC1459 treats []\~ as the upper case forms of {}|^, on top of ASCII letters.
+RFC1459_TABLE = str.maketrans(ascii_uppercase + "[]\\~", ascii_lowercase + "{}|^")
+
+
+def irc_lower(name):
+    """
+    The canonical key of a nickname or channel name, which the server's nickname index and channels are keyed by.
+    Names the case mapping treats as the same have the same key. Work it out once where the name comes in from a
+    client or a sibling worker, and keep it around (eg. IRCUser.key, IRCChannel.key) rather than mapping it again.
+    """
+    return name.translate(RFC1459_TABLE)
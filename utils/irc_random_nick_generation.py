@@ -1,5 +1,6 @@
 from random import sample, choice
 from string import ascii_lowercase, ascii_uppercase, digits
+from utils.irc_casemapping import irc_lower
 
 
 def generate_random_nick(protocol, in_use_nicknames, illegal_characters, max_length):
@@ -7,7 +8,7 @@ def generate_random_nick(protocol, in_use_nicknames, illegal_characters, max_len
     For use in IRCUser - generate a random nick based off the protocol instance of the user.
     Args:
         protocol (IRCProtocol): The user's protocol instance.
-        in_use_nicknames (list): The list of nicknames currently in use by other users in the server.
+        in_use_nicknames (dict): The server's nickname index; only membership tests are done against it.
         illegal_characters (set): What characters to omit in the generated nickname.
         max_length (int): The server's max nickname setting value.
         The resulting nickname will be trimmed depending on this value.
@@ -20,7 +21,7 @@ def generate_random_nick(protocol, in_use_nicknames, illegal_characters, max_len
     random_nick_s = ''.join([c for c in random_nick[:max_length] if c not in illegal_characters])
 
     def validate_nick(nick, current_nicks):  # Check if the nick is still conflicting. Generate new one if yes.
-        if nick in in_use_nicknames:
+        if irc_lower(nick) in in_use_nicknames:
             def generate_junk(amount):
                 return ''.join([
                     choice(